@@ -3,13 +3,17 @@
 Fraud Detection Dashboard - Flask Backend API
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, abort
 from flask_cors import CORS
 import pandas as pd
 import numpy as np
 import joblib
 import os
 import json
+import re
+import sys
+import time
+from itertools import chain
 from datetime import datetime, timedelta
 import logging
 from werkzeug.utils import secure_filename
@@ -17,16 +21,83 @@ import traceback
 
 # Import our custom models
 from models.fraud_model import FraudDetectionModel
-from models.behavior_model import BehaviorProfilingModel
-from utils.data_processor import DataProcessor
+from models.behavior_model import BehaviorProfilingModel, build_user_behavior_features
+from utils.data_processor import DataProcessor, FEATURE_COLUMNS
+from utils.transaction_store import TransactionStore
+from utils.shadow_scorer import ShadowScorer
+from utils.rules_engine import DecisionRulesEngine, DEFAULT_RULES_PATH
+from utils.profiling import RequestProfiler, MemoryTracker, SORT_KEYS as PROFILE_SORT_KEYS
+from utils.hotspots import HotspotTracker, DIMENSIONS as HOTSPOT_DIMENSIONS
+from utils.link_graph import LinkGraph, LINK_FIELDS
+from utils.replay_guard import ReplayGuard
+from utils.user_shards import LocalUserState, ShardedUserState
+from utils.checkpoint import StateCheckpointer
+from utils.explanations import RiskExplainer
+from utils.admission import AdmissionController
+from utils.drift import DriftMonitor, build_reference
+from utils.uploads import (
+    DECOMPRESSION_ERRORS, RAW_CSV_MIMETYPES, UnsupportedCompression, UploadSummary,
+    open_csv_stream, rewindable, upload_compression
+)
+from utils.user_profiles import UserProfileCache
+from utils.static_assets import StaticAssets
+from utils.fast_json import FastJSONProvider
+from utils.anomaly_sweep import AnomalySweeper
+from utils.rollups import TimeSeriesRollups, RESOLUTIONS as ROLLUP_RESOLUTIONS
+from utils.score_distributions import ScoreDistributions, METRICS as SCORE_METRICS, DIMENSIONS as SCORE_DIMENSIONS
 
 # Initialize Flask app
 app = Flask(__name__)
+app.json = FastJSONProvider(app)  # orjson-backed jsonify with NumPy support
 CORS(app)  # Enable CORS for all routes
 
 # Configuration
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['UPLOAD_FOLDER'] = 'data/uploads'
+app.config['QUARANTINE_FOLDER'] = 'data/quarantine'
+app.config['FRONTEND_FOLDER'] = '../frontend'
+# Serve the frontend from memory, precompressed (STATIC_CACHE=0 reads it from disk per request, for editing)
+app.config['STATIC_CACHE'] = os.environ.get('STATIC_CACHE', '1').lower() in ('1', 'true', 'yes')
+# Uploads are parsed in chunks of this many rows; UPLOAD_MAX_ROWS caps a (decompressed) file, 0 = no cap
+app.config['UPLOAD_CHUNK_ROWS'] = int(os.environ.get('UPLOAD_CHUNK_ROWS', 100000))
+app.config['UPLOAD_MAX_ROWS'] = int(os.environ.get('UPLOAD_MAX_ROWS', 5000000))
+# List responses with at least this many rows are streamed as they are encoded
+app.config['JSON_STREAM_MIN_ROWS'] = int(os.environ.get('JSON_STREAM_MIN_ROWS', 1000))
+app.config['CHALLENGER_MODEL_PATH'] = os.environ.get('CHALLENGER_MODEL_PATH', 'data/challenger_xgb_model.pkl')
+app.config['SHADOW_WORKERS'] = int(os.environ.get('SHADOW_WORKERS', 2))
+app.config['HOTSPOT_WINDOW_SECONDS'] = int(os.environ.get('HOTSPOT_WINDOW_SECONDS', 3600))
+# Users sharing an IP/device stay linked until the shared edge is unused for LINK_WINDOW_SECONDS
+app.config['LINK_WINDOW_SECONDS'] = int(os.environ.get('LINK_WINDOW_SECONDS', 86400))
+app.config['LINK_MAX_EDGES'] = int(os.environ.get('LINK_MAX_EDGES', 1000000))
+app.config['DECISION_RULES_PATH'] = os.environ.get('DECISION_RULES_PATH', DEFAULT_RULES_PATH)
+app.config['REPLAY_WINDOW_SECONDS'] = int(os.environ.get('REPLAY_WINDOW_SECONDS', 86400))
+# Per-user state lives in this many shard processes (0 keeps it in-process)
+app.config['USER_SHARDS'] = int(os.environ.get('USER_SHARDS', 0))
+app.config['USER_SHARD_DIR'] = os.environ.get('USER_SHARD_DIR', 'data/shards')
+# Only 1 is supported: the transaction store and aggregates live in the serving process
+app.config['WEB_WORKERS'] = int(os.environ.get('WEB_WORKERS', 1))
+# Serving state checkpoints (empty CHECKPOINT_DIR disables them)
+app.config['CHECKPOINT_DIR'] = os.environ.get('CHECKPOINT_DIR', 'data/checkpoints')
+app.config['CHECKPOINT_INTERVAL'] = int(os.environ.get('CHECKPOINT_INTERVAL', 300))
+# TreeSHAP explanations, computed only for requests that ask for them
+app.config['EXPLANATIONS_ENABLED'] = os.environ.get('EXPLANATIONS_ENABLED', '1').lower() in ('1', 'true', 'yes')
+app.config['EXPLANATION_TOP_K'] = int(os.environ.get('EXPLANATION_TOP_K', 3))
+# Target share of transactions flagged anomalous; unset keeps the fixed cut-off
+app.config['ADAPTIVE_ANOMALY_RATE'] = float(os.environ['ADAPTIVE_ANOMALY_RATE']) if os.environ.get('ADAPTIVE_ANOMALY_RATE') else None
+app.config['DEFAULT_ANOMALY_THRESHOLD'] = -0.1
+# Admission control in front of model scoring (SCORING_MAX_CONCURRENT=0 disables it);
+# requests over the queueing budget are degraded to the heuristic score or shed
+app.config['SCORING_MAX_CONCURRENT'] = int(os.environ.get('SCORING_MAX_CONCURRENT', os.cpu_count() or 4))
+app.config['SCORING_MAX_QUEUE'] = int(os.environ.get('SCORING_MAX_QUEUE', 64))
+app.config['SCORING_QUEUE_BUDGET_MS'] = float(os.environ.get('SCORING_QUEUE_BUDGET_MS', 200))
+app.config['OVERLOAD_MODE'] = os.environ.get('OVERLOAD_MODE', 'degrade')
+# Isolation Forest sweep over users active in the window (ANOMALY_SWEEP_INTERVAL=0 disables it)
+app.config['ANOMALY_SWEEP_INTERVAL'] = int(os.environ.get('ANOMALY_SWEEP_INTERVAL', 300))
+app.config['ANOMALY_SWEEP_WINDOW'] = int(os.environ.get('ANOMALY_SWEEP_WINDOW', 86400))
+app.config['ANOMALY_SWEEP_CHUNK_ROWS'] = int(os.environ.get('ANOMALY_SWEEP_CHUNK_ROWS', 50000))
+app.config['ANOMALY_SWEEP_JOBS'] = int(os.environ.get('ANOMALY_SWEEP_JOBS', -1))
+# Profiling, memory, checkpoint and sweep endpoints under /api/admin/ (off unless ADMIN_ENDPOINTS=1)
+app.config['ADMIN_ENDPOINTS'] = os.environ.get('ADMIN_ENDPOINTS', '0').lower() in ('1', 'true', 'yes')
 
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -39,16 +110,40 @@ logger = logging.getLogger(__name__)
 fraud_model = None
 behavior_model = None
 data_processor = None
+challenger_scorer = None
+rules_engine = None
+user_state = None
+state_checkpointer = None
+risk_explainer = None
+anomaly_sweeper = None
+
+# On-demand diagnostics (idle unless armed through the admin endpoints)
+request_profiler = RequestProfiler()
+memory_tracker = MemoryTracker()
 
 # In-memory storage for demo purposes
-transaction_store = []
-user_profiles_store = {}
+transaction_store = TransactionStore()
+hotspot_tracker = HotspotTracker(window_seconds=app.config['HOTSPOT_WINDOW_SECONDS'])
+link_graph = LinkGraph(window_seconds=app.config['LINK_WINDOW_SECONDS'], max_edges=app.config['LINK_MAX_EDGES'])
+score_distributions = ScoreDistributions()
+timeseries_rollups = TimeSeriesRollups()
+user_profile_cache = UserProfileCache(transaction_store)
+admission_controller = AdmissionController(
+    app.config['SCORING_MAX_CONCURRENT'],
+    max_queue=app.config['SCORING_MAX_QUEUE'],
+    queue_budget_ms=app.config['SCORING_QUEUE_BUDGET_MS'],
+    mode=app.config['OVERLOAD_MODE']
+)
+replay_guard = ReplayGuard(transaction_store, window_seconds=app.config['REPLAY_WINDOW_SECONDS'])
+static_assets = StaticAssets(app.config['FRONTEND_FOLDER']) if app.config['STATIC_CACHE'] else None
 
 def initialize_models():
     """Initialize ML models and data processor"""
-    global fraud_model, behavior_model, data_processor
+    global fraud_model, behavior_model, data_processor, challenger_scorer, rules_engine, user_state, state_checkpointer
+    global risk_explainer, anomaly_sweeper
 
     try:
+        rules_engine = DecisionRulesEngine(app.config['DECISION_RULES_PATH'])
         fraud_model = FraudDetectionModel()
         behavior_model = BehaviorProfilingModel()
         data_processor = DataProcessor()
@@ -58,9 +153,68 @@ def initialize_models():
             fraud_model.load_model('data/trained_xgb_model.pkl')
             logger.info("Loaded XGBoost model successfully")
 
+        # Compare live scoring traffic with the training feature distribution
+        if fraud_model.is_trained:
+            if fraud_model.reference_histograms is None and os.path.exists('data/fraud_detection_dataset.csv'):
+                # Model saved before histograms were captured at training time
+                training_features = data_processor.process_dataframe(pd.read_csv('data/fraud_detection_dataset.csv'))
+                fraud_model.reference_histograms = build_reference(
+                    [training_features[FEATURE_COLUMNS].values], fraud_model.model_feature_names()
+                )
+                logger.info("Built reference feature histograms from the training dataset")
+            if fraud_model.reference_histograms is not None:
+                fraud_model.drift_monitor = DriftMonitor(fraud_model.reference_histograms)
+
+        if app.config['EXPLANATIONS_ENABLED']:
+            risk_explainer = RiskExplainer(fraud_model, top_k=app.config['EXPLANATION_TOP_K'])
+
         if os.path.exists('data/trained_isolation_model.pkl'):
             behavior_model.load_model('data/trained_isolation_model.pkl')
             logger.info("Loaded Isolation Forest model successfully")
+            if behavior_model.category_codes is None and os.path.exists('data/fraud_detection_dataset.csv'):
+                # Model saved before its category codes were stored
+                behavior_model.fit_category_codes(
+                    build_user_behavior_features(pd.read_csv('data/fraud_detection_dataset.csv'))
+                )
+                logger.info("Built behavior category codes from the training dataset")
+
+        # Per-user behavior summaries, sharded by userId when running several workers
+        if app.config['USER_SHARDS'] > 0:
+            user_state = ShardedUserState(app.config['USER_SHARDS'], app.config['USER_SHARD_DIR'],
+                                          seed_profiles=behavior_model.user_profiles)
+            logger.info(f"Using {app.config['USER_SHARDS']} user state shards")
+        else:
+            user_state = LocalUserState(behavior_model.user_profiles)
+
+        # Rebuild stored transactions and user state from the last checkpoint and its log
+        checkpoint_dir = app.config['CHECKPOINT_DIR']
+        state_checkpointer = StateCheckpointer(checkpoint_dir, transaction_store, user_state,
+                                               interval=app.config['CHECKPOINT_INTERVAL'])
+        if state_checkpointer.restore():
+            n_recent = replay_guard.remember_stored()
+            logger.info(f"Replay guard remembers {n_recent} client transaction IDs stored within its window")
+            rebuild_aggregates()
+        state_checkpointer.start()
+
+        # Population-wide behavior anomaly flags for the dashboard and user profiles
+        anomaly_sweeper = AnomalySweeper(
+            transaction_store, user_profile_cache, behavior_model, user_state,
+            interval=app.config['ANOMALY_SWEEP_INTERVAL'],
+            window_seconds=app.config['ANOMALY_SWEEP_WINDOW'],
+            chunk_size=app.config['ANOMALY_SWEEP_CHUNK_ROWS'],
+            n_jobs=app.config['ANOMALY_SWEEP_JOBS']
+        )
+        anomaly_sweeper.start()
+
+        # Optional challenger model scored in shadow alongside fraud_model
+        challenger_path = app.config['CHALLENGER_MODEL_PATH']
+        if challenger_path and os.path.exists(challenger_path):
+            challenger_model = FraudDetectionModel()
+            challenger_model.load_model(challenger_path)
+            challenger_scorer = ShadowScorer(
+                challenger_model, rules_engine, max_workers=app.config['SHADOW_WORKERS']
+            )
+            logger.info(f"Loaded challenger model from {challenger_path} for shadow scoring")
 
         logger.info("Models initialized successfully")
 
@@ -68,15 +222,33 @@ def initialize_models():
         logger.error(f"Error initializing models: {str(e)}")
         raise
 
+@app.before_request
+def guard_admin_endpoints():
+    if request.path.startswith('/api/admin/') and not app.config['ADMIN_ENDPOINTS']:
+        return jsonify({'error': 'Admin endpoints are disabled'}), 404
+
+@app.before_request
+def profile_before_request():
+    request_profiler.before_request(request)
+
+@app.teardown_request
+def profile_teardown_request(exc=None):
+    request_profiler.teardown_request(exc)
+
 @app.route('/')
 def index():
     """Serve the main dashboard page"""
-    return send_from_directory('../frontend', 'index.html')
+    return static_files('index.html')
 
 @app.route('/<path:filename>')
 def static_files(filename):
     """Serve static files (CSS, JS, etc.)"""
-    return send_from_directory('../frontend', filename)
+    if static_assets is None:
+        return send_from_directory(app.config['FRONTEND_FOLDER'], filename)
+    response = static_assets.response(filename, request)
+    if response is None:
+        abort(404)
+    return response
 
 @app.route('/api/health')
 def health_check():
@@ -87,28 +259,36 @@ def health_check():
         'models_loaded': {
             'fraud_model': fraud_model is not None,
             'behavior_model': behavior_model is not None
-        }
+        },
+        'replayGuard': replay_guard.stats(),
+        'userShards': user_state.status() if user_state is not None else None,
+        'admission': admission_controller.stats()
     })
 
 @app.route('/api/dashboard_metrics')
 def get_dashboard_metrics():
     """Get dashboard overview metrics"""
     try:
-        # Calculate metrics from stored transactions
+        # Calculate metrics from stored transactions; rows scored by the heuristic
+        # fallback while overloaded say nothing about the model and are left out
         total_transactions = len(transaction_store)
-        high_risk_count = sum(1 for t in transaction_store if t.get('riskCategory') == 'High')
-        anomalous_users = len([u for u in user_profiles_store.values() if u.get('isAnomalous', False)])
+        model_scored = transaction_store.column('degraded') != 1
+        high_risk_mask = transaction_store.mask_equals('riskCategory', 'High') & model_scored
+        high_risk_count = int(high_risk_mask.sum())
+        anomalous_users = user_profile_cache.anomalous_user_count()
 
         # Calculate fraud detection rate
-        actual_frauds = sum(1 for t in transaction_store if t.get('fraud') == 1)
-        detected_frauds = sum(1 for t in transaction_store if t.get('riskCategory') == 'High' and t.get('fraud') == 1)
+        fraud_mask = (transaction_store.column('fraud') == 1) & model_scored
+        actual_frauds = int(fraud_mask.sum())
+        detected_frauds = int((high_risk_mask & fraud_mask).sum())
         fraud_detection_rate = detected_frauds / actual_frauds if actual_frauds > 0 else 0
 
         # Risk distribution
+        category_counts = transaction_store.category_counts('riskCategory', model_scored)
         risk_distribution = {
-            'Low': sum(1 for t in transaction_store if t.get('riskCategory') == 'Low'),
-            'Moderate': sum(1 for t in transaction_store if t.get('riskCategory') == 'Moderate'),
-            'High': sum(1 for t in transaction_store if t.get('riskCategory') == 'High')
+            'Low': category_counts.get('Low', 0),
+            'Moderate': category_counts.get('Moderate', 0),
+            'High': category_counts.get('High', 0)
         }
 
         return jsonify({
@@ -117,6 +297,7 @@ def get_dashboard_metrics():
             'fraudDetectionRate': round(fraud_detection_rate, 3),
             'anomalousUsers': anomalous_users,
             'riskDistribution': risk_distribution,
+            'degradedTransactions': total_transactions - int(model_scored.sum()),
             'lastUpdated': datetime.now().isoformat()
         })
 
@@ -127,6 +308,7 @@ def get_dashboard_metrics():
 @app.route('/api/analyze_transaction', methods=['POST'])
 def analyze_transaction():
     """Analyze a single transaction"""
+    reserved_id = None
     try:
         data = request.get_json()
 
@@ -138,31 +320,71 @@ def analyze_transaction():
             if field not in data:
                 return jsonify({'error': f'Missing required field: {field}'}), 400
 
+        # Unknown categories have always been scored here, so only uploads reject them
+        errors = data_processor.validate_transaction_data(data, check_categories=False)
+        if errors:
+            return jsonify({'error': 'Invalid transaction data', 'errors': errors}), 400
+
+        explain = wants_explanation(data)
+
+        # Replayed transaction IDs get the originally stored result back; a new one is held
+        # until it is stored, so a concurrent request with the same ID waits and then gets it
+        client_txn_id = data.get('transactionId')
+        if client_txn_id is not None:
+            row = replay_guard.reserve(client_txn_id)
+            if row >= 0:
+                return jsonify(duplicate_response(transaction_store.get(row)))
+            reserved_id = client_txn_id
+
         # Process transaction data
         processed_data = data_processor.process_single_transaction(data)
 
-        # Get fraud risk score
-        risk_score = fraud_model.predict_risk_score(processed_data) if fraud_model else np.random.random() * 0.5
+        # Get fraud risk score, falling back to the heuristic when over the queueing budget
+        with admission_controller.admit() as admission:
+            if admission.status == 'shed':
+                return overloaded_response(admission)
+            if not fraud_model:
+                risk_score = np.random.random() * 0.5
+            elif admission.admitted:
+                risk_score = fraud_model.predict_risk_score(processed_data)
+            else:
+                risk_score = fraud_model.heuristic_risk_score(processed_data)
+        degraded = not admission.admitted
 
-        # Determine risk category
-        if risk_score < 0.3:
-            risk_category = 'Low'
-        elif risk_score < 0.7:
-            risk_category = 'Moderate'
-        else:
-            risk_category = 'High'
+        # Score with the challenger in the background
+        if challenger_scorer and not degraded:
+            challenger_scorer.submit(processed_data, risk_score)
 
-        # Get user behavior analysis
-        user_profile = user_profiles_store.get(data['userId'])
-        behavior_analysis = behavior_model.analyze_user_behavior(data['userId'], processed_data) if behavior_model else {
+        # Determine risk category
+        rules = rules_engine.rules
+        risk_category = rules.risk_category(risk_score)
+
+        # Get user behavior analysis, with the cut-off adapted to the target alert rate if set
+        anomaly_threshold = app.config['DEFAULT_ANOMALY_THRESHOLD']
+        if app.config['ADAPTIVE_ANOMALY_RATE'] is not None:
+            adaptive = score_distributions.threshold('anomaly', app.config['ADAPTIVE_ANOMALY_RATE'])
+            if adaptive is not None:
+                anomaly_threshold = adaptive
+        behavior_analysis = behavior_model.analyze_user_behavior(
+            data['userId'], processed_data, anomaly_threshold=anomaly_threshold
+        ) if behavior_model else {
             'anomalyScore': np.random.random() - 0.5,
             'isAnomalous': np.random.random() > 0.8,
             'deviations': []
         }
 
+        # Keep the user's running behavior summary current
+        state_checkpointer.update_behavior(data['userId'], data)
+        score_distributions.record(None if degraded else risk_score, behavior_analysis['anomalyScore'],
+                                   data['transactionType'], data['location'])
+
+        # Traffic concentration for this IP/subnet/user, including this transaction
+        hotspot_tracker.record(data.get('ipAddress'), data['userId'])
+        hotspot_features = hotspot_tracker.features(data.get('ipAddress'), data['userId'])
+
         # Create transaction record
         transaction_record = {
-            'id': f"TXN_{len(transaction_store) + 1:06d}",
+            'clientId': client_txn_id,  # None: the store assigns a server ID
             'userId': data['userId'],
             'transactionType': data['transactionType'],
             'loginAttempts': data['loginAttempts'],
@@ -174,21 +396,47 @@ def analyze_transaction():
             'riskCategory': risk_category,
             'isAnomaly': behavior_analysis['isAnomalous'],
             'anomalyScore': round(behavior_analysis['anomalyScore'], 4),
-            'fraud': 1 if risk_score > 0.8 else 0  # Simulate actual fraud label
+            'fraud': 1 if risk_score > 0.8 else 0,  # Simulate actual fraud label
+            'degraded': degraded
         }
 
-        # Store transaction
-        transaction_store.append(transaction_record)
+        # Store transaction and respond with the stored (JSON-ready) form
+        row = state_checkpointer.append(transaction_record)
+        if client_txn_id is not None:
+            replay_guard.remember(client_txn_id)
+        transaction_record = transaction_store.get(row)
+        timeseries_rollups.record(risk_score, risk_category, behavior_analysis['isAnomalous'],
+                                  behavior_analysis['anomalyScore'], transaction_record['fraud'])
+
+        # Users linked to this one through shared IPs/devices, including this transaction
+        link_graph.record(data['userId'], {field: data.get(field) for field in LINK_FIELDS},
+                          transaction_record['fraud'])
+        cluster_features = link_graph.features(data['userId'])
+
+        # Explain now if asked, otherwise keep the features for /api/explain
+        explanation = None
+        if risk_explainer:
+            if explain and not degraded:
+                explanation = risk_explainer.explain_one(processed_data)
+            else:
+                risk_explainer.remember(transaction_record['id'], processed_data)
 
         # Combined decision logic
-        combined_decision = get_combined_decision(risk_score, behavior_analysis['isAnomalous'])
+        combined_decision = rules.combined_decision(risk_score, behavior_analysis['isAnomalous'])
 
         response = {
             'transaction': transaction_record,
             'behaviorAnalysis': behavior_analysis,
+            'hotspotCounts': hotspot_features,
+            'clusterFeatures': cluster_features,
             'combinedDecision': combined_decision,
-            'recommendations': get_recommendations(risk_category, behavior_analysis['isAnomalous'])
+            'recommendations': rules.recommendations(risk_category, behavior_analysis['isAnomalous'])
         }
+        if explanation is not None:
+            response['explanation'] = explanation
+        if degraded:
+            response['degraded'] = True
+            response['admission'] = admission.to_dict()
 
         return jsonify(response)
 
@@ -196,68 +444,76 @@ def analyze_transaction():
         logger.error(f"Error analyzing transaction: {str(e)}")
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
+    finally:
+        if reserved_id is not None:
+            replay_guard.release(reserved_id)
 
 @app.route('/api/upload_csv', methods=['POST'])
 def upload_csv():
-    """Process CSV file upload for bulk analysis"""
+    """Process a CSV upload (plain, .csv.gz or .csv.zst) for bulk analysis, chunk by chunk"""
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file uploaded'}), 400
-
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-
-        if not file.filename.lower().endswith('.csv'):
-            return jsonify({'error': 'File must be a CSV'}), 400
-
-        # Save uploaded file
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-
-        # Process CSV
-        df = pd.read_csv(filepath)
-        processed_transactions = []
-
-        for _, row in df.iterrows():
-            # Process each transaction
-            transaction_data = row.to_dict()
-            processed_data = data_processor.process_single_transaction(transaction_data)
-
-            # Get predictions
-            risk_score = fraud_model.predict_risk_score(processed_data) if fraud_model else np.random.random() * 0.5
-
-            # Determine risk category
-            if risk_score < 0.3:
-                risk_category = 'Low'
-            elif risk_score < 0.7:
-                risk_category = 'Moderate'
-            else:
-                risk_category = 'High'
-
-            # Create transaction record
-            transaction_record = {
-                'id': transaction_data.get('TransactionId', f"TXN_{len(processed_transactions) + 1:06d}"),
-                'userId': transaction_data.get('UserID', f"USER_{np.random.randint(1000, 9999)}"),
-                'transactionType': transaction_data.get('Transaction Type', 'Unknown'),
-                'riskScore': round(risk_score, 4),
-                'riskCategory': risk_category,
-                'timestamp': transaction_data.get('Time', datetime.now().isoformat()),
-                'originalData': transaction_data
-            }
-
-            processed_transactions.append(transaction_record)
-            transaction_store.append(transaction_record)
-
-        # Clean up uploaded file
-        os.remove(filepath)
-
-        return jsonify({
-            'message': f'Successfully processed {len(processed_transactions)} transactions',
-            'transactions': processed_transactions[:100],  # Return first 100 for display
-            'totalCount': len(processed_transactions)
-        })
+        if request.mimetype in RAW_CSV_MIMETYPES:
+            # CSV sent as the request body, optionally with Content-Encoding: gzip/zstd
+            filename = secure_filename(request.args.get('filename', '')) or 'upload.csv'
+            content_encoding = request.headers.get('Content-Encoding')
+            source = request.stream
+            options = request.args
+        else:
+            if 'file' not in request.files:
+                return jsonify({'error': 'No file uploaded'}), 400
+
+            file = request.files['file']
+            if file.filename == '':
+                return jsonify({'error': 'No file selected'}), 400
+            filename = secure_filename(file.filename)
+            content_encoding = file.headers.get('Content-Encoding')
+            source = file.stream
+            options = request.form
+
+        try:
+            compression = upload_compression(filename, content_encoding)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except UnsupportedCompression as e:
+            return jsonify({'error': str(e)}), 415
+
+        chunksize = app.config['UPLOAD_CHUNK_ROWS']
+        max_rows = app.config['UPLOAD_MAX_ROWS']
+        upload = UploadSummary(filename, explain=wants_explanation(options))
+
+        try:
+            # With onInvalid=reject any invalid row rejects the whole file, so
+            # validate every chunk before storing anything (row numbers are 0-based data rows)
+            if options.get('onInvalid', request.args.get('onInvalid')) == 'reject':
+                source = rewindable(source)
+                check = UploadSummary(filename)
+                with pd.read_csv(open_csv_stream(source, compression), chunksize=chunksize) as reader:
+                    for df in reader:
+                        check.add_validation(data_processor.validate_dataframe(df, required_fields=()),
+                                             check.rows_read)
+                        check.rows_read += len(df)
+                if check.invalid_count:
+                    return jsonify({'error': 'CSV contains invalid rows', **check.validation_fields()}), 400
+                source.seek(0)
+
+            # Decompress and parse in a stream; memory is bounded by the chunk size
+            with pd.read_csv(open_csv_stream(source, compression), chunksize=chunksize) as reader:
+                for df in reader:
+                    if max_rows and upload.rows_read + len(df) > max_rows:
+                        df = df.iloc[:max_rows - upload.rows_read]
+                        upload.truncated = True
+                    shed = process_upload_chunk(df, upload)
+                    if shed is not None:
+                        return shed
+                    if upload.truncated:
+                        logger.warning(f"Upload {filename} truncated at {max_rows} rows")
+                        break
+
+        except DECOMPRESSION_ERRORS as e:
+            return jsonify({'error': f'Could not decompress upload: {e}',
+                            'processedCount': upload.total_count}), 400
+
+        return jsonify(upload.response())
 
     except Exception as e:
         logger.error(f"Error processing CSV upload: {str(e)}")
@@ -267,20 +523,11 @@ def upload_csv():
 def get_user_profile(user_id):
     """Get user behavior profile"""
     try:
-        # Get user transactions
-        user_transactions = [t for t in transaction_store if t.get('userId') == user_id]
-
-        if not user_transactions:
+        # Cached unless the user has new transactions since the last read
+        profile, _ = user_profile_cache.profile(user_id)
+        if profile is None:
             return jsonify({'error': 'User not found'}), 404
 
-        # Calculate user statistics
-        profile = calculate_user_profile(user_transactions)
-        profile['userId'] = user_id
-        profile['transactionHistory'] = user_transactions[-10:]  # Last 10 transactions
-
-        # Store/update user profile
-        user_profiles_store[user_id] = profile
-
         return jsonify(profile)
 
     except Exception as e:
@@ -295,91 +542,531 @@ def get_transactions():
         user_filter = request.args.get('userId')
         limit = int(request.args.get('limit', 50))
 
-        filtered_transactions = transaction_store.copy()
+        mask = np.ones(len(transaction_store), dtype=bool)
 
         # Apply filters
         if risk_filter:
-            filtered_transactions = [t for t in filtered_transactions if t.get('riskCategory') == risk_filter]
+            mask &= transaction_store.mask_equals('riskCategory', risk_filter)
 
         if user_filter:
-            filtered_transactions = [t for t in filtered_transactions if t.get('userId') == user_filter]
+            mask &= transaction_store.mask_equals('userId', user_filter)
 
         # Sort by timestamp (newest first)
-        filtered_transactions.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
+        filtered_rows = np.flatnonzero(mask)
+        timestamps = transaction_store.column('timestamp')[filtered_rows]
+        filtered_rows = filtered_rows[np.argsort(-timestamps, kind='stable')]
 
-        # Apply limit
-        limited_transactions = filtered_transactions[:limit]
-
-        return jsonify({
-            'transactions': limited_transactions,
-            'totalCount': len(filtered_transactions),
+        # Apply limit and materialize only the returned rows
+        page_rows = filtered_rows[:limit]
+        response = {
+            'transactions': None,
+            'totalCount': len(filtered_rows),
             'appliedFilters': {
                 'risk': risk_filter,
                 'userId': user_filter,
                 'limit': limit
             }
-        })
+        }
+
+        # Large pages are materialized and encoded batch by batch while being sent
+        if len(page_rows) >= app.config['JSON_STREAM_MIN_ROWS']:
+            batches = (transaction_store.materialize(page_rows[i:i + 500]) for i in range(0, len(page_rows), 500))
+            return app.json.streaming_response(response, 'transactions', chain.from_iterable(batches))
+
+        response['transactions'] = transaction_store.materialize(page_rows)
+        return jsonify(response)
 
     except Exception as e:
         logger.error(f"Error getting transactions: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-def get_combined_decision(risk_score, is_anomalous):
-    """Get combined decision from both models"""
-    if risk_score > 0.7 and is_anomalous:
-        return "CRITICAL RISK - Block Transaction"
-    elif risk_score > 0.7:
-        return "HIGH RISK - Additional Verification Required"
-    elif is_anomalous:
-        return "MODERATE RISK - Monitor Transaction"
+@app.route('/api/explain/<transaction_id>')
+def explain_transaction(transaction_id):
+    """TreeSHAP explanation for a recently analyzed transaction"""
+    try:
+        if not risk_explainer:
+            return jsonify({'error': 'Explanations are disabled'}), 400
+
+        explanation = risk_explainer.explain_transaction(transaction_id)
+        if explanation is None:
+            return jsonify({'error': 'Transaction not available for explanation'}), 404
+
+        return jsonify({'transactionId': transaction_id, 'explanation': explanation,
+                        'cache': risk_explainer.stats()})
+
+    except Exception as e:
+        logger.error(f"Error explaining transaction: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/hotspots')
+def get_hotspots():
+    """Get the heaviest IPs, subnets and users in the current window"""
+    try:
+        dimension = request.args.get('dimension')
+        top = int(request.args.get('top', 20))
+
+        if dimension and dimension not in HOTSPOT_DIMENSIONS:
+            return jsonify({'error': f"dimension must be one of: {', '.join(HOTSPOT_DIMENSIONS)}"}), 400
+
+        value = request.args.get('value')
+        if dimension and value:
+            return jsonify({
+                'dimension': dimension,
+                'value': value,
+                'count': hotspot_tracker.count(dimension, value),
+                'windowSeconds': hotspot_tracker.window_seconds
+            })
+
+        hotspots = {dimension: hotspot_tracker.top(dimension, top)} if dimension else hotspot_tracker.summary(top)
+        return jsonify({
+            'hotspots': hotspots,
+            'windowSeconds': hotspot_tracker.window_seconds
+        })
+
+    except Exception as e:
+        logger.error(f"Error getting hotspots: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/clusters')
+def get_clusters():
+    """Users linked through shared IPs/devices: one user's cluster, or the largest clusters"""
+    try:
+        limit = int(request.args.get('limit', 20))
+        user_id = request.args.get('userId')
+        if user_id:
+            cluster = link_graph.cluster(user_id, limit=limit)
+            if cluster is None:
+                return jsonify({'error': 'User not found'}), 404
+            return jsonify({'userId': user_id, 'cluster': cluster})
+
+        return jsonify({
+            'clusters': link_graph.top_clusters(
+                n=int(request.args.get('top', 20)),
+                min_size=int(request.args.get('minSize', 2)),
+                limit=limit
+            ),
+            'stats': link_graph.stats()
+        })
+
+    except Exception as e:
+        logger.error(f"Error getting clusters: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/score_distributions')
+def get_score_distributions():
+    """Get live risk/anomaly score percentiles and thresholds for a target alert rate"""
+    try:
+        alert_rate = request.args.get('alertRate', type=float)
+        if alert_rate is not None and not 0 < alert_rate < 1:
+            return jsonify({'error': 'alertRate must be between 0 and 1'}), 400
+        quantiles = tuple(float(q) for q in request.args.get('quantiles', '0.5,0.9,0.95,0.99').split(','))
+
+        metric = request.args.get('metric')
+        if metric:
+            if metric not in SCORE_METRICS:
+                return jsonify({'error': f"metric must be one of: {', '.join(SCORE_METRICS)}"}), 400
+            dimension = request.args.get('dimension')
+            if dimension and dimension not in SCORE_DIMENSIONS:
+                return jsonify({'error': f"dimension must be one of: {', '.join(SCORE_DIMENSIONS)}"}), 400
+            value = request.args.get('value') if dimension else None
+            result = {
+                'metric': metric,
+                'dimension': dimension,
+                'value': value,
+                'percentiles': score_distributions.percentiles(metric, dimension, value, quantiles)
+            }
+            if alert_rate is not None:
+                threshold = score_distributions.threshold(metric, alert_rate, dimension, value)
+                result['threshold'] = round(threshold, 4) if threshold is not None else None
+            return jsonify(result)
+
+        return jsonify({
+            'distributions': score_distributions.summary(quantiles, alert_rate),
+            'alertRate': alert_rate,
+            'adaptiveAnomalyRate': app.config['ADAPTIVE_ANOMALY_RATE']
+        })
+
+    except Exception as e:
+        logger.error(f"Error getting score distributions: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/timeseries')
+def get_timeseries():
+    """Get per-minute/per-hour transaction rollups for charts"""
+    try:
+        resolution = request.args.get('resolution')
+        if resolution and resolution not in ROLLUP_RESOLUTIONS:
+            return jsonify({'error': f"resolution must be one of: {', '.join(ROLLUP_RESOLUTIONS)}"}), 400
+        window = int(request.args.get('window', 3600))  # seconds
+        points = int(request.args.get('points', 120))
+        if window <= 0 or points <= 0:
+            return jsonify({'error': 'window and points must be positive'}), 400
+
+        end = request.args.get('end')
+        end = datetime.fromisoformat(end).timestamp() if end else time.time()
+
+        series = timeseries_rollups.series(resolution, start=end - window, end=end, max_points=points)
+        series['windowSeconds'] = window
+        return jsonify(series)
+
+    except Exception as e:
+        logger.error(f"Error getting time series: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/drift')
+def get_drift():
+    """Get PSI/KS drift of live model features against the training distribution"""
+    try:
+        monitor = fraud_model.drift_monitor if fraud_model else None
+        if monitor is None:
+            return jsonify({'error': 'Drift monitoring unavailable: no trained model with reference histograms'}), 503
+
+        feature = request.args.get('feature')
+        if feature:
+            histogram = monitor.histogram(feature)
+            if histogram is None:
+                return jsonify({'error': f"Unknown feature: {feature}"}), 404
+            return jsonify(histogram)
+
+        return jsonify(monitor.report())
+
+    except Exception as e:
+        logger.error(f"Error computing drift: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/shadow/stats')
+def get_shadow_stats():
+    """Get champion/challenger agreement and latency statistics"""
+    try:
+        if challenger_scorer is None:
+            return jsonify({'enabled': False})
+
+        limit = int(request.args.get('pairs', 0))
+        stats = challenger_scorer.stats()
+        stats['enabled'] = True
+        if limit > 0:
+            stats['recentPairs'] = challenger_scorer.recent_pairs(limit)
+
+        return jsonify(stats)
+
+    except Exception as e:
+        logger.error(f"Error getting shadow stats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/rules')
+def get_rules():
+    """Get the active decision thresholds and rules"""
+    try:
+        return jsonify(rules_engine.describe())
+
+    except Exception as e:
+        logger.error(f"Error getting decision rules: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/rules/reload', methods=['POST'])
+def reload_rules():
+    """Reload decision rules from the config file"""
+    try:
+        if not rules_engine.reload():
+            return jsonify({'error': 'Invalid decision rules config; previous rules kept'}), 400
+
+        return jsonify(rules_engine.describe())
+
+    except Exception as e:
+        logger.error(f"Error reloading decision rules: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/profile', methods=['GET', 'POST', 'DELETE'])
+def admin_profile():
+    """Arm, read or clear sampled cProfile profiling of a route"""
+    try:
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            if 'route' not in data:
+                return jsonify({'error': 'Missing required field: route'}), 400
+
+            request_profiler.arm(
+                data['route'],
+                int(data.get('requests', 100)),
+                float(data.get('sampleRate', 1.0))
+            )
+            return jsonify(request_profiler.status())
+
+        if request.method == 'DELETE':
+            request_profiler.disarm()
+            return jsonify(request_profiler.status())
+
+        top = int(request.args.get('top', 30))
+        sort = request.args.get('sort', 'cumulative')
+        if sort not in PROFILE_SORT_KEYS:
+            return jsonify({'error': f"sort must be one of: {', '.join(PROFILE_SORT_KEYS)}"}), 400
+        status = request_profiler.status()
+        status['stats'] = request_profiler.report(top=top, sort=sort)
+        return jsonify(status)
+
+    except Exception as e:
+        logger.error(f"Error in profiling endpoint: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/memory', methods=['GET', 'POST'])
+def admin_memory():
+    """Start/stop tracemalloc, reset the baseline, or diff against it"""
+    try:
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            action = data.get('action')
+            if action == 'start':
+                memory_tracker.start(int(data.get('frames', 1)))
+            elif action == 'snapshot':
+                if not memory_tracker.tracing:
+                    return jsonify({'error': 'Memory tracing is not started'}), 409
+                memory_tracker.snapshot()
+            elif action == 'stop':
+                memory_tracker.stop()
+            else:
+                return jsonify({'error': 'action must be one of: start, snapshot, stop'}), 400
+            return jsonify({'tracing': memory_tracker.tracing})
+
+        if not memory_tracker.tracing:
+            return jsonify({'error': 'Memory tracing is not started'}), 409
+
+        group_by = request.args.get('groupBy', 'lineno')
+        if group_by not in ('lineno', 'filename', 'traceback'):
+            return jsonify({'error': 'groupBy must be one of: lineno, filename, traceback'}), 400
+        result = memory_tracker.diff(top=int(request.args.get('top', 20)), key_type=group_by)
+        result['tracing'] = True
+        user_sizes = user_state.sizes()
+        result['stateSizes'] = {
+            'transactionStoreRows': len(transaction_store),
+            'transactionStoreBytes': transaction_store.nbytes(),
+            'behaviorUserProfiles': user_sizes['behaviorProfiles'],
+            'userProfileCache': user_profile_cache.stats(),
+            'linkGraph': link_graph.stats()
+        }
+        return jsonify(result)
+
+    except Exception as e:
+        logger.error(f"Error in memory endpoint: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/checkpoint', methods=['GET', 'POST'])
+def admin_checkpoint():
+    """Checkpoint status, or write a checkpoint now (POST)"""
+    try:
+        if request.method == 'POST':
+            if not state_checkpointer.enabled:
+                return jsonify({'error': 'Checkpointing is disabled'}), 400
+            state_checkpointer.checkpoint()
+        return jsonify(state_checkpointer.status())
+
+    except Exception as e:
+        logger.error(f"Error in checkpoint endpoint: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/anomaly_sweep', methods=['GET', 'POST'])
+def admin_anomaly_sweep():
+    """Anomaly sweep status, or sweep all active users now (POST)"""
+    try:
+        if request.method == 'POST':
+            if not anomaly_sweeper.enabled:
+                return jsonify({'error': 'Behavior model is not trained'}), 400
+            anomaly_sweeper.sweep()
+        return jsonify(anomaly_sweeper.status())
+
+    except Exception as e:
+        logger.error(f"Error in anomaly sweep endpoint: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def rebuild_aggregates(chunk_rows=1000000):
+    """Refill the rollups and score distributions from the stored transactions (after a restore)
+
+    Hotspots and the link graph are not rebuilt: the store keeps no IP
+    addresses or device IDs, so they start empty and fill from new traffic.
+    """
+    start = time.perf_counter()
+    size = len(transaction_store)
+    column = transaction_store.column
+    for first in range(0, size, chunk_rows):
+        rows = np.arange(first, min(first + chunk_rows, size))
+        risk_scores = column('riskScore')[rows].astype(np.float64)
+        anomaly_scores = column('anomalyScore')[rows].astype(np.float64)
+        scored = np.isfinite(anomaly_scores)  # Upload rows have no behavior score
+        model_scored = column('degraded')[rows] != 1  # Heuristic fallback scores stay out of the distributions
+        transaction_types = transaction_store.category_values('transactionType', rows)
+        locations = transaction_store.category_values('location', rows)
+
+        timeseries_rollups.record_batch(
+            risk_scores, transaction_store.category_values('riskCategory', rows),
+            is_anomalous=column('isAnomaly')[rows] == 1, anomaly_scores=np.where(scored, anomaly_scores, 0.0),
+            frauds=column('fraud')[rows] == 1, timestamps=column('timestamp')[rows] / 1e6
+        )
+        score_distributions.record_batch(risk_scores[model_scored], transaction_types=transaction_types[model_scored],
+                                         locations=locations[model_scored])
+        score_distributions.record_batch(anomaly_scores=anomaly_scores[scored],
+                                         transaction_types=transaction_types[scored], locations=locations[scored])
+    logger.info(f"Rebuilt rollups and score distributions from {size} stored transactions "
+                f"in {time.perf_counter() - start:.2f}s (hotspots and link graph start empty)")
+
+def process_upload_chunk(df, upload):
+    """Validate, dedupe, score and store one chunk of an upload; returns a response if it was shed"""
+    row_offset = upload.rows_read
+    upload.rows_read += len(df)
+
+    # Bad rows are quarantined and skipped
+    validation = data_processor.validate_dataframe(df, required_fields=())
+    if validation.n_invalid:
+        upload.add_validation(validation, row_offset)
+        upload.quarantine_file = quarantine_rows(df, validation, upload.filename,
+                                                 path=upload.quarantine_file, row_offset=row_offset)
+        df = df[validation.valid_mask].reset_index(drop=True)
+
+    # Skip rows whose transaction ID was already processed (earlier chunks included) or repeats within the chunk;
+    # new IDs stay reserved until stored, so a concurrent request carrying one waits and then sees it
+    id_column = transaction_id_column(df)
+    if id_column is None:
+        return store_upload_chunk(df, upload, None)
+    txn_ids = df[id_column].astype(str)
+    stored = replay_guard.reserve_many(txn_ids) >= 0
+    try:
+        duplicates = stored | txn_ids.duplicated().values
+        if duplicates.any():
+            upload.add_duplicates(txn_ids[duplicates].tolist())
+            df = df[~duplicates].reset_index(drop=True)
+        return store_upload_chunk(df, upload, id_column)
+    finally:
+        replay_guard.release_many(txn_ids[~stored])
+
+def store_upload_chunk(df, upload, id_column):
+    """Score and store the new rows of an upload chunk; returns a response if it was shed"""
+    n_rows = len(df)
+    if n_rows == 0:
+        return None
+    features = data_processor.process_dataframe(df)[FEATURE_COLUMNS].values
+
+    # Get predictions, falling back to the heuristic when over the queueing budget
+    with admission_controller.admit() as admission:
+        if admission.status == 'shed':
+            return overloaded_response(admission, processedCount=upload.total_count)
+        if not fraud_model:
+            risk_scores = np.random.random(n_rows) * 0.5
+        elif admission.admitted:
+            risk_scores = np.atleast_1d(fraud_model.predict_risk_score(features)).astype(np.float64)
+        else:
+            risk_scores = np.atleast_1d(fraud_model.heuristic_risk_score(features)).astype(np.float64)
+    degraded = not admission.admitted
+    if degraded:
+        upload.admission = admission
+
+    if challenger_scorer and not degraded:
+        challenger_scorer.submit(features, risk_scores)
+
+    # Determine risk categories
+    risk_categories = rules_engine.rules.risk_categories(risk_scores)
+
+    # Store transaction records
+    def column(name, default):
+        return df[name].values if name in df.columns else default
+
+    user_ids = column('UserID', [f"USER_{n}" for n in np.random.randint(1000, 9999, size=n_rows)])
+    hotspot_tracker.record_batch(column('ipAddress', None), user_ids)
+    link_graph.record_batch(user_ids, {field: column(field, None) for field in LINK_FIELDS})
+    transaction_types = column('Transaction Type', np.full(n_rows, 'Unknown', dtype=object))
+    score_distributions.record_batch(None if degraded else risk_scores, transaction_types=transaction_types,
+                                     locations=column('location', None))
+
+    start_row = state_checkpointer.extend({
+        'clientId': df[id_column].astype(str).values if id_column is not None else None,
+        'userId': user_ids,
+        'transactionType': transaction_types,
+        'riskScore': risk_scores,
+        'riskCategory': risk_categories,
+        'timestamp': column('Time', column('timestamp', None)),
+        'degraded': np.full(n_rows, degraded)
+    }, n_rows)
+    # Rollups bucket rows by the times the store parsed (upload time where a row has none)
+    timeseries_rollups.record_batch(risk_scores, risk_categories, timestamps=transaction_store.column(
+        'timestamp')[start_row:start_row + n_rows] / 1e6)
+    if id_column is not None:
+        replay_guard.remember_many(df[id_column].astype(str))
+    upload.total_count += n_rows
+
+    # Only the preview rows keep their original CSV data
+    n_preview = min(n_rows, upload.preview_room())
+    preview = transaction_store.materialize(range(start_row, start_row + n_preview))
+    for record, original in zip(preview, df.head(n_preview).to_dict('records')):
+        record['originalData'] = original
+
+    # One batched TreeSHAP pass over the chunk when asked for
+    if risk_explainer and upload.explain and not degraded:
+        explanations = risk_explainer.explain(features)
+        if explanations[0] is not None:
+            for record, explanation in zip(preview, explanations):
+                record['explanation'] = explanation
+            upload.add_risk_factors(explanations)
+    upload.transactions.extend(preview)
+    return None
+
+def transaction_id_column(df):
+    """Name of the upload's transaction ID column (transactionId/TransactionId, any case), or None"""
+    return next((column for column in df.columns if str(column).lower() == 'transactionid'), None)
+
+def quarantine_rows(df, validation, filename, path=None, row_offset=0):
+    """Write the rows that failed validation, with their errors, next to the uploads
+
+    Later chunks of the same upload pass the returned path to append to it.
+    """
+    os.makedirs(app.config['QUARANTINE_FOLDER'], exist_ok=True)
+    invalid = np.flatnonzero(~validation.valid_mask)
+    rows = df.iloc[invalid].copy()
+    rows.insert(0, 'sourceRow', invalid + row_offset)
+    rows['validationErrors'] = ['; '.join(validation.errors_for(row)) for row in invalid]
+
+    if path is None:
+        # Quarantined rows are written uncompressed
+        name = re.sub(r'\.(gz|zst)$', '', filename, flags=re.IGNORECASE)
+        path = os.path.join(app.config['QUARANTINE_FOLDER'],
+                            f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{name}")
+        rows.to_csv(path, index=False)
     else:
-        return "LOW RISK - Approve Transaction"
-
-def get_recommendations(risk_category, is_anomalous):
-    """Get recommendations based on risk assessment"""
-    recommendations = []
-
-    if risk_category == 'High':
-        recommendations.extend([
-            "Block transaction immediately",
-            "Contact user for verification",
-            "Review recent account activity"
-        ])
-    elif risk_category == 'Moderate':
-        recommendations.extend([
-            "Request additional authentication",
-            "Monitor for suspicious patterns"
-        ])
-
-    if is_anomalous:
-        recommendations.extend([
-            "Flag user for behavioral review",
-            "Compare with historical patterns"
-        ])
-
-    return recommendations if recommendations else ["Transaction appears normal"]
-
-def calculate_user_profile(transactions):
-    """Calculate user behavior profile from transactions"""
-    if not transactions:
-        return {}
-
-    df = pd.DataFrame(transactions)
-
-    profile = {
-        'transactionCount': len(transactions),
-        'avgRiskScore': df['riskScore'].mean(),
-        'maxRiskScore': df['riskScore'].max(),
-        'riskTrend': 'increasing' if df['riskScore'].iloc[-1] > df['riskScore'].mean() else 'stable',
-        'anomalyCount': sum(1 for t in transactions if t.get('isAnomaly', False)),
-        'isAnomalous': any(t.get('isAnomaly', False) for t in transactions),
-        'fraudRate': sum(1 for t in transactions if t.get('fraud') == 1) / len(transactions),
-        'lastActivity': max(t.get('timestamp', '') for t in transactions)
+        rows.to_csv(path, mode='a', header=False, index=False)
+    logger.warning(f"Quarantined {len(invalid)} invalid rows from {filename} to {path}")
+    return path
+
+def wants_explanation(data):
+    """True if the request asked for explanations (?explain=1 or an explain field)"""
+    flag = request.args.get('explain', data.get('explain') if data else None)
+    return str(flag).lower() in ('1', 'true', 'yes')
+
+def overloaded_response(ticket, **extra):
+    """503 for a request shed by admission control"""
+    response = jsonify({'error': 'Scoring is overloaded, retry shortly', 'admission': ticket.to_dict(), **extra})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def duplicate_response(transaction_record):
+    """Analysis response for a replayed transaction, rebuilt from its stored record"""
+    rules = rules_engine.rules
+    is_anomalous = transaction_record.get('isAnomaly', False)
+    return {
+        'transaction': transaction_record,
+        'behaviorAnalysis': {
+            'anomalyScore': transaction_record.get('anomalyScore', 0.0),
+            'isAnomalous': is_anomalous,
+            'deviations': []
+        },
+        'combinedDecision': rules.combined_decision(transaction_record['riskScore'], is_anomalous),
+        'recommendations': rules.recommendations(transaction_record['riskCategory'], is_anomalous),
+        'duplicate': True
     }
 
-    return profile
-
 if __name__ == '__main__':
+    if app.config['WEB_WORKERS'] > 1:
+        # Only per-user behavior state is shared (through the shards); the transaction
+        # store, rollups, hotspots and link graph would be lost with each worker process
+        logger.error("WEB_WORKERS > 1 is not supported: run a single worker "
+                     "(USER_SHARDS still moves per-user state out of process)")
+        sys.exit(1)
+
     # Initialize models
     initialize_models()
 
@@ -4,14 +4,143 @@ import numpy as np
 import pandas as pd
 import joblib
 import logging
+from datetime import datetime
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 
+from utils.sketches import HyperLogLog, TopK
+
 logger = logging.getLogger(__name__)
 
+
+def _group_mode(df, key, column):
+    """Most frequent value of column per key (ties resolved like Series.mode)"""
+    counts = df.groupby([key, column]).size().reset_index(name='n')
+    counts = counts.sort_values([key, 'n', column], ascending=[True, False, True])
+    return counts.drop_duplicates(key).set_index(key)[column]
+
+
+def build_user_behavior_features(df, min_transactions=3):
+    """Aggregate raw transactions into one behavior feature row per user
+
+    Vectorized replacement for looping over ``df.groupby('userId')``; users
+    with fewer than ``min_transactions`` transactions are dropped. Preferred
+    transaction type and location are left as values: BehaviorProfilingModel
+    encodes them with the codes fixed when it was trained.
+    """
+    groups = df.groupby('userId')
+    features = groups.agg(
+        avg_login_attempts=('loginAttempts', 'mean'),
+        std_login_attempts=('loginAttempts', 'std'),
+        avg_transaction_count=('transactionCount', 'mean'),
+        std_transaction_count=('transactionCount', 'std'),
+        avg_transaction_velocity=('transactionVelocity', 'mean'),
+        std_transaction_velocity=('transactionVelocity', 'std'),
+        unique_locations=('location', 'nunique'),
+        transaction_frequency=('loginAttempts', 'size')
+    )
+    features = features[features['transaction_frequency'] >= min_transactions]
+
+    for column in ['std_login_attempts', 'std_transaction_count', 'std_transaction_velocity']:
+        features[column] = features[column].fillna(0)
+
+    features['preferred_transaction_type'] = _group_mode(df, 'userId', 'transactionType').reindex(features.index)
+    features['preferred_location'] = _group_mode(df, 'userId', 'location').reindex(features.index)
+
+    if 'timestamp' in df.columns:
+        hours = pd.to_datetime(df['timestamp'], errors='coerce', format='mixed').dt.hour.fillna(12).astype(int)
+        features['preferred_hour'] = _group_mode(df.assign(hour=hours), 'userId', 'hour').reindex(features.index)
+    else:
+        features['preferred_hour'] = 12  # Default
+
+    if 'ipAddress' in df.columns:
+        subnets = df['ipAddress'].astype(str).str.split('.', n=2).str[:2].str.join('.')
+        features['unique_ip_subnets'] = df.assign(subnet=subnets).groupby('userId')['subnet'].nunique().reindex(features.index)
+    else:
+        features['unique_ip_subnets'] = 1
+
+    return features.reset_index()
+
+
+class UserBehaviorState:
+    """Constant-size running summary of one user's transactions
+
+    Means/variances use Welford's update, distinct counts use HyperLogLog and
+    preferred values use a small Space-Saving top-k, so memory and update cost
+    do not grow with the number of transactions.
+    """
+
+    __slots__ = (
+        'n', 'means', 'm2s', 'locations', 'ip_subnets',
+        'top_locations', 'top_transaction_types', 'top_hours'
+    )
+
+    NUMERIC_FIELDS = (
+        ('loginAttempts', 'login_attempts', 1),
+        ('transactionCount', 'transaction_count', 1),
+        ('transactionVelocity', 'transaction_velocity', 0.5)
+    )
+
+    def __init__(self):
+        self.n = 0
+        self.means = [0.0] * len(self.NUMERIC_FIELDS)
+        self.m2s = [0.0] * len(self.NUMERIC_FIELDS)
+        self.locations = HyperLogLog()
+        self.ip_subnets = HyperLogLog()
+        self.top_locations = TopK()
+        self.top_transaction_types = TopK()
+        self.top_hours = TopK()
+
+    def update(self, transaction_data):
+        """Fold one raw transaction into the summary"""
+        self.n += 1
+        for i, (field, _, default) in enumerate(self.NUMERIC_FIELDS):
+            value = float(transaction_data.get(field, default))
+            delta = value - self.means[i]
+            self.means[i] += delta / self.n
+            self.m2s[i] += delta * (value - self.means[i])
+
+        location = transaction_data.get('location', 'Unknown')
+        self.locations.add(location)
+        self.top_locations.add(location)
+        self.top_transaction_types.add(transaction_data.get('transactionType', 'Credit Card'))
+
+        ip_address = str(transaction_data.get('ipAddress', '192.168.1.1'))
+        self.ip_subnets.add('.'.join(ip_address.split('.')[:2]))
+
+        self.top_hours.add(self._hour(transaction_data.get('timestamp')))
+
+    def profile(self):
+        """Behavior features in the shape of BehaviorProfilingModel.feature_columns"""
+        profile = {}
+        for i, (_, name, _) in enumerate(self.NUMERIC_FIELDS):
+            profile[f'avg_{name}'] = self.means[i]
+            profile[f'std_{name}'] = (self.m2s[i] / (self.n - 1)) ** 0.5 if self.n > 1 else 0.0
+        profile.update({
+            'preferred_transaction_type': self.top_transaction_types.top('Credit Card'),
+            'preferred_location': self.top_locations.top('Unknown'),
+            'preferred_hour': self.top_hours.top(12),
+            'unique_locations': self.locations.count(),
+            'unique_ip_subnets': self.ip_subnets.count(),
+            'transaction_frequency': self.n
+        })
+        return profile
+
+    @staticmethod
+    def _hour(timestamp):
+        if timestamp is None:
+            return datetime.now().hour
+        try:
+            return pd.Timestamp(timestamp).hour
+        except (ValueError, TypeError):
+            return datetime.now().hour
+
+
 class BehaviorProfilingModel:
     """Wrapper for Isolation Forest behavior profiling model"""
 
+    CATEGORICAL_FEATURES = ('preferred_transaction_type', 'preferred_location')
+
     def __init__(self):
         self.model = None
         self.scaler = None
@@ -23,13 +152,36 @@ class BehaviorProfilingModel:
             'preferred_transaction_type', 'preferred_location', 'preferred_hour',
             'unique_locations', 'unique_ip_subnets', 'transaction_frequency'
         ]
+        # Categorical feature -> {value: code}, fixed at training time
+        self.category_codes = None
         self.is_trained = False
 
+    def fit_category_codes(self, user_behavior_data):
+        """Fix the code of each categorical feature value (sorted order, as pd.Categorical assigns them)"""
+        self.category_codes = {
+            column: {value: code for code, value in
+                     enumerate(pd.Categorical(user_behavior_data[column].dropna()).categories)}
+            for column in self.CATEGORICAL_FEATURES
+        }
+
+    def _feature_matrix(self, user_behavior_data):
+        """Model input: the feature columns with categorical values mapped to their training codes (unknown -1)"""
+        X = user_behavior_data[self.feature_columns].copy()
+        for column in self.CATEGORICAL_FEATURES:
+            if column not in X.columns or pd.api.types.is_numeric_dtype(X[column]):
+                continue  # Already encoded
+            if self.category_codes is None:
+                raise ValueError("Behavior model has no category codes; call fit_category_codes "
+                                 "with its training data")
+            X[column] = X[column].map(self.category_codes[column]).fillna(-1).astype(int)
+        return X.fillna(0)
+
     def train(self, user_behavior_data):
         """Train the Isolation Forest model"""
         try:
             # Prepare features
-            X = user_behavior_data[self.feature_columns].fillna(0)
+            self.fit_category_codes(user_behavior_data)
+            X = self._feature_matrix(user_behavior_data)
 
             # Standardize features
             self.scaler = StandardScaler()
@@ -56,7 +208,7 @@ class BehaviorProfilingModel:
             # Return random anomaly prediction for demo
             return np.random.choice([0, 1], size=len(user_behavior_data), p=[0.9, 0.1])
 
-        X = user_behavior_data[self.feature_columns].fillna(0)
+        X = self._feature_matrix(user_behavior_data)
         X_scaled = self.scaler.transform(X)
         predictions = self.model.predict(X_scaled)
 
@@ -69,18 +221,18 @@ class BehaviorProfilingModel:
             # Return random scores for demo
             return np.random.uniform(-0.2, 0.2, size=len(user_behavior_data))
 
-        X = user_behavior_data[self.feature_columns].fillna(0)
+        X = self._feature_matrix(user_behavior_data)
         X_scaled = self.scaler.transform(X)
         return self.model.decision_function(X_scaled)
 
-    def analyze_user_behavior(self, user_id, transaction_data):
-        """Analyze specific user's behavior for anomalies"""
+    def analyze_user_behavior(self, user_id, transaction_data, anomaly_threshold=-0.1):
+        """Analyze specific user's behavior for anomalies (scores below anomaly_threshold are anomalous)"""
         try:
             # This is a simplified analysis for demo purposes
             # In production, you'd analyze the user's historical pattern
 
             anomaly_score = np.random.uniform(-0.5, 0.5)
-            is_anomalous = anomaly_score < -0.1
+            is_anomalous = anomaly_score < anomaly_threshold
 
             deviations = []
 
@@ -118,15 +270,14 @@ class BehaviorProfilingModel:
         """Update user's behavioral profile with new transaction"""
         if user_id not in self.user_profiles:
             self.user_profiles[user_id] = {
-                'transactions': [],
+                'state': UserBehaviorState(),
                 'profile': {}
             }
 
-        # Add transaction to user's history
-        self.user_profiles[user_id]['transactions'].append(transaction_data)
-
-        # Recalculate profile
-        self._calculate_user_profile(user_id)
+        # Fold the transaction into the user's running summary
+        entry = self.user_profiles[user_id]
+        entry['state'].update(transaction_data)
+        entry['profile'] = entry['state'].profile()
 
     def get_user_profile(self, user_id):
         """Get user's behavioral profile"""
@@ -138,8 +289,8 @@ class BehaviorProfilingModel:
             model_data = {
                 'model': self.model,
                 'scaler': self.scaler,
-                'user_profiles': self.user_profiles,
                 'feature_columns': self.feature_columns,
+                'category_codes': self.category_codes,
                 'is_trained': self.is_trained
             }
             joblib.dump(model_data, filepath)
@@ -153,14 +304,27 @@ class BehaviorProfilingModel:
             model_data = joblib.load(filepath)
             self.model = model_data['model']
             self.scaler = model_data['scaler']
-            self.user_profiles = model_data.get('user_profiles', {})
+            # Per-user state is checkpointed with the serving state; older model
+            # files still carry it and it is used to seed the profiles
+            self.user_profiles = self._upgrade_user_profiles(model_data.get('user_profiles', {}))
             self.feature_columns = model_data.get('feature_columns', self.feature_columns)
+            self.category_codes = model_data.get('category_codes')
             self.is_trained = model_data.get('is_trained', True)
             logger.info(f"Behavior model loaded from {filepath}")
         except Exception as e:
             logger.error(f"Error loading behavior model: {e}")
             raise
 
+    def _upgrade_user_profiles(self, user_profiles):
+        """Convert profiles saved with raw transaction lists to running summaries"""
+        for user_id, entry in user_profiles.items():
+            if 'state' not in entry:
+                state = UserBehaviorState()
+                for transaction_data in entry.get('transactions', []):
+                    state.update(transaction_data)
+                user_profiles[user_id] = {'state': state, 'profile': state.profile() if state.n else {}}
+        return user_profiles
+
     def _identify_risk_factors(self, transaction_data):
         """Identify specific risk factors in transaction"""
         risk_factors = []
@@ -186,22 +350,3 @@ class BehaviorProfilingModel:
             pass
 
         return risk_factors
-
-    def _calculate_user_profile(self, user_id):
-        """Calculate behavioral profile for a user"""
-        transactions = self.user_profiles[user_id]['transactions']
-        if not transactions:
-            return
-
-        df = pd.DataFrame(transactions)
-
-        profile = {
-            'avg_login_attempts': df.get('loginAttempts', pd.Series([1])).mean(),
-            'avg_transaction_count': df.get('transactionCount', pd.Series([1])).mean(),
-            'avg_transaction_velocity': df.get('transactionVelocity', pd.Series([0.5])).mean(),
-            'transaction_frequency': len(transactions),
-            'unique_locations': df.get('location', pd.Series(['Unknown'])).nunique(),
-            'preferred_location': df.get('location', pd.Series(['Unknown'])).mode().iloc[0] if len(df) > 0 else 'Unknown'
-        }
-
-        self.user_profiles[user_id]['profile'] = profile
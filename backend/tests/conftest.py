@@ -0,0 +1,30 @@
+"""
+Shared fixtures: the Flask app with its trained models, run from backend/
+"""
+
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Backend modules import each other as top-level packages (utils, models)
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture(scope='module')
+def app_module():
+    """The app module, initialized without checkpoints or background sweeps"""
+    os.environ['CHECKPOINT_DIR'] = ''
+    os.environ['ANOMALY_SWEEP_INTERVAL'] = '0'
+    os.chdir(BACKEND_DIR)
+
+    import app
+    app.initialize_models()
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,63 @@
+"""
+Checkpoint restore and change-log replay
+"""
+
+import time
+
+import numpy as np
+
+from utils.checkpoint import StateCheckpointer
+from utils.transaction_store import TransactionStore
+from utils.user_shards import LocalUserState
+
+
+def restored(directory):
+    store, user_state = TransactionStore(), LocalUserState()
+    StateCheckpointer(directory, store, user_state).restore()
+    return store, user_state
+
+
+def test_replayed_rows_keep_their_original_timestamps(tmp_path):
+    store = TransactionStore()
+    checkpointer = StateCheckpointer(str(tmp_path), store, LocalUserState())
+    checkpointer.restore()
+    checkpointer.append({'userId': 'U1', 'riskScore': 0.1})
+    checkpointer.extend({'userId': ['U2', 'U3'], 'riskScore': [0.2, 0.3],
+                         'timestamp': [None, 'not a time']}, 2)
+    checkpointer.extend({'userId': ['U4'], 'riskScore': [0.4]}, 1)
+    written = store.column('timestamp').copy()
+
+    time.sleep(0.01)
+    replayed, _ = restored(str(tmp_path))
+    np.testing.assert_array_equal(replayed.column('timestamp'), written)
+
+
+def test_restore_rebuilds_rows_ids_and_user_state_from_checkpoint_and_log(tmp_path):
+    store, user_state = TransactionStore(), LocalUserState()
+    checkpointer = StateCheckpointer(str(tmp_path), store, user_state)
+    checkpointer.restore()
+    checkpointer.append({'clientId': 'EXT-1', 'userId': 'U1', 'transactionType': 'UPI', 'loginAttempts': 2,
+                         'riskScore': 0.9, 'riskCategory': 'High', 'isAnomaly': True, 'degraded': False})
+    checkpointer.update_behavior('U1', {'loginAttempts': 2, 'location': 'Delhi', 'ipAddress': '10.1.2.3'})
+    checkpointer.extend({'clientId': ['EXT-2', 'EXT-3'], 'userId': ['U2', 'U3'], 'riskScore': [0.2, 0.5],
+                         'riskCategory': ['Low', 'Moderate'], 'degraded': [True, False]}, 2)
+    checkpointer.checkpoint()
+
+    # Changes after the checkpoint only exist in the change log
+    checkpointer.append({'userId': 'U2', 'location': 'Mumbai', 'riskScore': 0.1})
+    checkpointer.update_behavior('U1', {'loginAttempts': 4, 'location': 'Mumbai', 'ipAddress': '10.9.2.3'})
+    checkpointer.update_behavior('U4', {'loginAttempts': 1})
+
+    replayed, replayed_state = restored(str(tmp_path))
+    assert len(replayed) == len(store) == 4
+    assert replayed.materialize(range(4)) == store.materialize(range(4))
+    np.testing.assert_array_equal(replayed.find_client_ids(['EXT-1', 'EXT-2', 'EXT-3', 'TXN_000004', 'NEW']),
+                                  [0, 1, 2, -1, -1])
+    assert replayed_state.sizes() == {'behaviorProfiles': 2}
+    assert replayed_state.behavior_profile('U1') == user_state.behavior_profile('U1')
+    assert replayed_state.behavior_profile('U1')['transaction_frequency'] == 2
+
+    # New rows continue the server ID sequence and index new client IDs
+    row = replayed.append({'clientId': 'EXT-5', 'userId': 'U5'})
+    assert replayed.get(row - 1)['id'] == 'TXN_000004'
+    assert replayed.find_client_ids(['EXT-5'])[0] == row
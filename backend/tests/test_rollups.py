@@ -0,0 +1,56 @@
+"""
+Time-series rollups: per-row bucketing of batches
+"""
+
+from utils.rollups import TimeSeriesRollups
+
+# A fixed "now" on a minute boundary keeps bucket arithmetic exact
+NOW = 1_700_000_040.0
+
+
+def counts(rollups, resolution, start, end):
+    points = rollups.series(resolution, start, end, max_points=10000)['points']
+    return [point['count'] for point in points]
+
+
+def test_batch_rows_land_in_the_buckets_of_their_own_times():
+    rollups = TimeSeriesRollups()
+    rollups.record_batch([0.9, 0.1, 0.5, 0.2], ['High', 'Low', 'Moderate', 'Low'],
+                         frauds=[1, 0, 0, 0], now=NOW, timestamps=[NOW - 120, NOW - 100, NOW - 50, NOW])
+
+    assert counts(rollups, 'minute', NOW - 180, NOW) == [0, 2, 1, 1]
+    points = rollups.series('minute', NOW - 180, NOW)['points']
+    assert points[1]['riskCategories'] == {'High': 1, 'Low': 1, 'Moderate': 0}
+    assert points[1]['frauds'] == 1
+    assert points[1]['avgRiskScore'] == 0.5
+    assert sum(counts(rollups, 'hour', NOW - 7200, NOW)) == 4
+
+
+def test_rows_older_than_retention_are_dropped():
+    rollups = TimeSeriesRollups(retention={'minute': 10})
+    rollups.record_batch([0.1, 0.2], ['Low', 'Low'], now=NOW, timestamps=[NOW - 11 * 60, NOW - 9 * 60])
+
+    assert sum(counts(rollups, 'minute', NOW - 3600, NOW)) == 1
+    # The hour ring still covers both rows
+    assert sum(counts(rollups, 'hour', NOW - 7200, NOW)) == 2
+
+
+def test_future_rows_count_now_and_do_not_block_live_records():
+    rollups = TimeSeriesRollups(retention={'minute': 10})
+    # Ten minutes ahead maps onto the slot of the current minute in a ten-bucket ring
+    rollups.record_batch([0.3], ['Low'], now=NOW, timestamps=[NOW + 10 * 60])
+    rollups.record(0.4, 'Low', now=NOW)
+    rollups.record(0.5, 'Low', now=NOW + 60)
+
+    assert counts(rollups, 'minute', NOW - 60, NOW + 60) == [0, 2, 1]
+
+
+def test_batches_without_timestamps_go_to_the_current_buckets():
+    rollups = TimeSeriesRollups()
+    rollups.record_batch([0.9, 0.8], ['High', 'Critical'], is_anomalous=[True, False], now=NOW)
+
+    point = rollups.series('minute', NOW, NOW)['points'][0]
+    assert point['count'] == 2
+    assert point['anomalies'] == 1
+    # Categories first seen in a batch are added to every resolution
+    assert point['riskCategories'] == {'High': 1, 'Critical': 1}
@@ -0,0 +1,54 @@
+"""
+Client transaction IDs: replay detection and upload deduplication
+"""
+
+import io
+
+import pandas as pd
+
+TRANSACTION = {
+    'transactionType': 'UPI', 'loginAttempts': 1, 'transactionCount': 2,
+    'transactionVelocity': 0.5, 'location': 'Delhi'
+}
+
+
+def upload(client, df, name='transactions.csv'):
+    return client.post('/api/upload_csv', data={'file': (io.BytesIO(df.to_csv(index=False).encode()), name)},
+                       content_type='multipart/form-data')
+
+
+def test_client_id_never_matches_server_generated_row(client, app_module):
+    server = client.post('/api/analyze_transaction', json=dict(TRANSACTION, userId='U1')).get_json()
+    server_id = server['transaction']['id']
+    assert server_id.startswith('TXN_')
+
+    request = dict(TRANSACTION, userId='CLIENT', transactionId=server_id)
+    first = client.post('/api/analyze_transaction', json=request).get_json()
+    assert not first.get('duplicate')
+    assert first['transaction']['userId'] == 'CLIENT'
+
+    replayed = client.post('/api/analyze_transaction', json=request).get_json()
+    assert replayed['duplicate'] is True
+    assert replayed['transaction']['userId'] == 'CLIENT'
+
+
+def test_reuploading_repo_dataset_is_deduplicated(client, app_module):
+    # Rows whose IDs no other test has sent
+    df = pd.read_csv('data/fraud_detection_dataset.csv', nrows=1050).tail(50)
+    before = len(app_module.transaction_store)
+
+    first = upload(client, df).get_json()
+    assert first['totalCount'] == 50
+    assert first['duplicateCount'] == 0
+
+    second = upload(client, df).get_json()
+    assert second['totalCount'] == 0
+    assert second['duplicateCount'] == 50
+    assert len(app_module.transaction_store) == before + 50
+
+
+def test_uploads_without_ids_get_unique_server_ids(client, app_module):
+    df = pd.read_csv('data/fraud_detection_dataset.csv', nrows=5).drop(columns=['transactionId'])
+    ids = [t['id'] for t in upload(client, df).get_json()['transactions']]
+    ids += [t['id'] for t in upload(client, df).get_json()['transactions']]
+    assert len(set(ids)) == 10
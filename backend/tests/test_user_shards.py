@@ -0,0 +1,82 @@
+"""
+User state shards: routing by userId and state kept across shard processes
+"""
+
+import os
+import pickle
+
+import pytest
+
+from utils.user_shards import HashRing, LocalUserState, ShardedUserState
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason="shards are forked processes")
+
+USERS = [f"USER_{n}" for n in range(1000, 1400)]
+
+
+def transaction(n):
+    return {'loginAttempts': 1 + n % 3, 'transactionCount': 2, 'transactionVelocity': 0.5,
+            'location': ['Delhi', 'Mumbai'][n % 2], 'ipAddress': f"10.{n % 5}.0.1"}
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    state = ShardedUserState(3, str(tmp_path / 'shards'))
+    yield state
+    state.shutdown()
+
+
+def test_ring_routing_is_stable_and_moves_few_users_when_a_shard_is_added():
+    ring = HashRing(4)
+    owners = [ring.shard_for(user_id) for user_id in USERS]
+    assert owners == [HashRing(4).shard_for(user_id) for user_id in USERS]
+    assert set(owners) == {0, 1, 2, 3}
+
+    grown = HashRing(5)
+    moved = [user_id for user_id, owner in zip(USERS, owners) if grown.shard_for(user_id) != owner]
+    # Only users taken over by the new shard move (about a fifth of them)
+    assert all(grown.shard_for(user_id) == 4 for user_id in moved)
+    assert len(moved) < len(USERS) / 3
+
+
+def test_sharded_state_matches_in_process_state(sharded):
+    local = LocalUserState()
+    for n, user_id in enumerate(USERS[:60] * 2):
+        sharded.update_behavior(user_id, transaction(n))
+        local.update_behavior(user_id, transaction(n))
+
+    assert sharded.sizes() == local.sizes() == {'behaviorProfiles': 60}
+    for user_id in USERS[:60]:
+        assert sharded.behavior_profile(user_id) == local.behavior_profile(user_id)
+    names = USERS[55:65]
+    assert sharded.behavior_values('unique_locations', names) == local.behavior_values('unique_locations', names)
+    assert sharded.behavior_values('transaction_frequency', ['UNKNOWN']) == [None]
+
+
+def test_export_import_round_trip_across_shard_counts(sharded, tmp_path):
+    for n, user_id in enumerate(USERS[:30]):
+        sharded.update_behavior(user_id, transaction(n))
+    blob = sharded.export_state()
+    assert set(pickle.loads(blob)['behavior']) == set(USERS[:30])
+
+    regrouped = ShardedUserState(2, str(tmp_path / 'regrouped'))
+    try:
+        regrouped.import_state(blob)
+        assert regrouped.sizes() == {'behaviorProfiles': 30}
+        for user_id in USERS[:30]:
+            assert regrouped.behavior_profile(user_id) == sharded.behavior_profile(user_id)
+    finally:
+        regrouped.shutdown()
+
+
+def test_dead_shard_is_restarted_and_counted(sharded):
+    user_id = USERS[0]
+    sharded.update_behavior(user_id, transaction(0))
+    shard = sharded.ring.shard_for(user_id)
+    victim = sharded.processes[shard]
+    victim.terminate()
+    victim.join(1)
+
+    assert sharded.behavior_profile(user_id) == {}
+    assert sharded.status() == {'shards': 3, 'restarts': 1,
+                                'restartsByShard': [int(i == shard) for i in range(3)]}
@@ -0,0 +1,132 @@
+"""
+Admission control for model scoring under overload
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+import logging
+
+logger = logging.getLogger(__name__)
+
+OVERLOAD_MODES = ('degrade', 'shed')
+
+
+class AdmissionTicket:
+    """Outcome of asking for a scoring slot"""
+
+    def __init__(self, status, queue_ms=0.0, reason=None):
+        self.status = status  # 'admitted', 'degraded' or 'shed'
+        self.queue_ms = queue_ms
+        self.reason = reason
+
+    @property
+    def admitted(self):
+        return self.status == 'admitted'
+
+    def to_dict(self):
+        """Response fields describing how the request was served"""
+        return {'status': self.status, 'queueMs': round(self.queue_ms, 2), 'reason': self.reason}
+
+
+class AdmissionController:
+    """Bounded queue in front of the model with a queueing-delay budget
+
+    At most max_concurrent requests score at once; up to max_queue more wait
+    for a slot. A request is turned away (degraded or shed, depending on the
+    mode) when the queue is full, when the expected wait from the recent
+    service time already exceeds the budget, or when it has waited out the
+    budget. Latency under overload therefore stays close to the budget
+    instead of growing with the backlog.
+
+    max_concurrent <= 0 admits everything.
+    """
+
+    def __init__(self, max_concurrent, max_queue=64, queue_budget_ms=200, mode='degrade'):
+        if mode not in OVERLOAD_MODES:
+            raise ValueError(f"mode must be one of: {', '.join(OVERLOAD_MODES)}")
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_budget = queue_budget_ms / 1000.0
+        self.mode = mode
+        self.in_flight = 0
+        self.waiting = 0
+        self.service_seconds = None  # EWMA of time spent holding a slot
+        self.counts = {'admitted': 0, 'degraded': 0, 'shed': 0}
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def admit(self):
+        """Yield an AdmissionTicket; an admitted request holds its slot until the block exits"""
+        ticket = self._acquire()
+        start = time.perf_counter()
+        try:
+            yield ticket
+        finally:
+            if ticket.admitted:
+                self._release(time.perf_counter() - start)
+
+    def _acquire(self):
+        if self.max_concurrent <= 0:
+            with self._cond:
+                self.counts['admitted'] += 1
+            return AdmissionTicket('admitted')
+
+        start = time.perf_counter()
+        with self._cond:
+            # Queue behind anyone already waiting rather than jumping ahead
+            if self.in_flight < self.max_concurrent and not self.waiting:
+                return self._admitted(start)
+            if self.waiting >= self.max_queue:
+                return self._overloaded(start, 'queue_full')
+            if self._expected_wait() > self.queue_budget:
+                return self._overloaded(start, 'expected_wait')
+
+            self.waiting += 1
+            try:
+                deadline = start + self.queue_budget
+                while self.in_flight >= self.max_concurrent:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        return self._overloaded(start, 'queue_timeout')
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            return self._admitted(start)
+
+    def _expected_wait(self):
+        """Rough queueing delay for a new arrival from the recent service time"""
+        if self.service_seconds is None:
+            return 0.0
+        return (self.waiting + 1) * self.service_seconds / self.max_concurrent
+
+    def _admitted(self, start):
+        self.in_flight += 1
+        self.counts['admitted'] += 1
+        return AdmissionTicket('admitted', (time.perf_counter() - start) * 1000)
+
+    def _overloaded(self, start, reason):
+        status = 'degraded' if self.mode == 'degrade' else 'shed'
+        self.counts[status] += 1
+        return AdmissionTicket(status, (time.perf_counter() - start) * 1000, reason)
+
+    def _release(self, seconds):
+        with self._cond:
+            self.in_flight -= 1
+            self.service_seconds = seconds if self.service_seconds is None else \
+                0.8 * self.service_seconds + 0.2 * seconds
+            self._cond.notify()
+
+    def stats(self):
+        """Queue state and outcome counters"""
+        with self._cond:
+            return {
+                'mode': self.mode,
+                'maxConcurrent': self.max_concurrent,
+                'maxQueue': self.max_queue,
+                'queueBudgetMs': round(self.queue_budget * 1000, 1),
+                'inFlight': self.in_flight,
+                'waiting': self.waiting,
+                'serviceMs': round(self.service_seconds * 1000, 2) if self.service_seconds is not None else None,
+                **self.counts
+            }
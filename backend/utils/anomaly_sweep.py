@@ -0,0 +1,155 @@
+"""
+Scheduled Isolation Forest sweep over every active user's behavior
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+import logging
+
+import numpy as np
+import pandas as pd
+from joblib import parallel_config
+
+from models.behavior_model import build_user_behavior_features
+from utils.transaction_store import local_datetimes, to_epoch_us
+
+logger = logging.getLogger(__name__)
+
+
+class AnomalySweeper:
+    """Periodically scores all active users with the behavior model and publishes the flags
+
+    Users with transactions in the last window_seconds are aggregated from
+    the transaction store into the behavior feature matrix in one pass, and
+    scored with ``decision_function`` in chunks of chunk_size rows (trees
+    evaluated on n_jobs threads). Negative scores are flagged, the same
+    cut-off as ``predict``. Results go to the user profile cache, which
+    keeps the flagged-user count for the dashboard.
+
+    The store keeps no IP addresses, so unique_ip_subnets comes from the
+    users' behavior summaries in user_state (their HyperLogLog count).
+    """
+
+    def __init__(self, store, profiles, behavior_model, user_state=None, interval=300, window_seconds=86400,
+                 chunk_size=50000, n_jobs=-1, min_transactions=3):
+        self.store = store
+        self.profiles = profiles
+        self.behavior_model = behavior_model
+        self.user_state = user_state
+        self.interval = interval
+        self.window_seconds = window_seconds
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+        self.min_transactions = min_transactions
+        self.last_sweep = None
+        self._sweep_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def enabled(self):
+        return self.behavior_model is not None and self.behavior_model.is_trained
+
+    def behavior_features(self, now=None):
+        """(behavior feature rows keyed by store userId code, transactions used) for active users"""
+        size = len(self.store)
+        column = lambda name: self.store.column(name)[:size]
+
+        # Bulk uploads store no raw behavior fields, only scored rows with them count
+        active = (column('userId') >= 0) & (column('loginAttempts') >= 0)
+        if self.window_seconds:
+            now = datetime.now() if now is None else now
+            active &= column('timestamp') >= to_epoch_us(now - timedelta(seconds=self.window_seconds))
+        rows = np.flatnonzero(active)
+
+        df = pd.DataFrame({
+            'userId': column('userId')[rows],
+            'loginAttempts': column('loginAttempts')[rows],
+            'transactionCount': column('transactionCount')[rows],
+            'transactionVelocity': column('transactionVelocity')[rows],
+            'transactionType': self.store.category_values('transactionType', rows),
+            'location': self.store.category_values('location', rows),
+            'timestamp': local_datetimes(column('timestamp')[rows])
+        })
+        if df.empty:
+            return pd.DataFrame(columns=['userId'] + self.behavior_model.feature_columns), 0
+        features = build_user_behavior_features(df, min_transactions=self.min_transactions)
+        if self.user_state is not None and len(features):
+            user_ids = [self.store.pools['userId'].decode(code) for code in features['userId']]
+            subnets = pd.Series(self.user_state.behavior_values('unique_ip_subnets', user_ids), index=features.index)
+            features['unique_ip_subnets'] = subnets.fillna(1).astype(int)
+        return features, len(df)
+
+    def score(self, features):
+        """Isolation Forest scores for a behavior feature matrix, chunk by chunk"""
+        scores = np.empty(len(features), dtype=np.float64)
+        with parallel_config(backend='threading', n_jobs=self.n_jobs):
+            for start in range(0, len(features), self.chunk_size):
+                chunk = features.iloc[start:start + self.chunk_size]
+                scores[start:start + len(chunk)] = self.behavior_model.get_anomaly_score(chunk)
+        return scores
+
+    def sweep(self):
+        """Score every active user now and publish the flags; returns the sweep summary"""
+        if not self.enabled:
+            logger.warning("Anomaly sweep skipped: behavior model is not trained")
+            return None
+
+        with self._sweep_lock:
+            start = time.perf_counter()
+            features, n_transactions = self.behavior_features()
+            feature_seconds = time.perf_counter() - start
+
+            scores = self.score(features)
+            flags = scores < 0
+            scoring_seconds = time.perf_counter() - start - feature_seconds
+
+            swept_at = datetime.now().isoformat()
+            self.profiles.publish_anomalies(features['userId'].to_numpy(dtype=np.int64), scores, flags, swept_at)
+
+            self.last_sweep = {
+                'sweptAt': swept_at,
+                'transactions': n_transactions,
+                'users': len(features),
+                'anomalousUsers': int(np.count_nonzero(flags)),
+                'featureSeconds': round(feature_seconds, 3),
+                'scoringSeconds': round(scoring_seconds, 3),
+                'seconds': round(time.perf_counter() - start, 3)
+            }
+            logger.info(f"Anomaly sweep flagged {self.last_sweep['anomalousUsers']} of "
+                        f"{len(features)} users in {self.last_sweep['seconds']}s")
+            return self.last_sweep
+
+    # Background sweeps
+
+    def start(self):
+        """Sweep now and then every interval seconds in a background thread"""
+        if self._thread is not None or not self.interval or not self.enabled:
+            return
+        self._thread = threading.Thread(target=self._run, name='anomaly-sweeper', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Anomaly sweep failed: {e}")
+            if self._stop.wait(self.interval):
+                return
+
+    def stop(self):
+        """Stop the background thread"""
+        self._stop.set()
+
+    def status(self):
+        """Schedule and the last sweep's summary"""
+        return {
+            'enabled': self.enabled,
+            'intervalSeconds': self.interval,
+            'windowSeconds': self.window_seconds,
+            'chunkSize': self.chunk_size,
+            'nJobs': self.n_jobs,
+            'lastSweep': self.last_sweep
+        }
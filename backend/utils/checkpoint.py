@@ -0,0 +1,314 @@
+"""
+Checkpoints and an append-only change log for the in-memory serving state
+"""
+
+import glob
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 1
+
+
+class StateCheckpointer:
+    """Keeps the transaction store and per-user state recoverable across restarts
+
+    Every change goes through this class, which applies it and appends it to
+    the current log. The lock covers only the log write (and the in-process
+    store append, whose row order the log must match); user state changes,
+    which may be a round trip to a shard process, run outside it and are
+    counted in flight, and a checkpoint waits for them to finish before it
+    captures state. A checkpoint writes the store's columns (.npy) and the
+    pickled user state into a new directory and starts a new log; restoring
+    memory-maps the latest checkpoint and replays its log.
+
+    With directory=None changes are applied without being logged, so callers
+    can use one write path whether or not persistence is enabled.
+
+    Layout of the directory::
+
+        CURRENT                     name of the latest complete checkpoint
+        checkpoint-000003/          manifest.json, columns/*.npy, user_state.pkl
+        log-000003.bin              changes made after checkpoint 3
+    """
+
+    def __init__(self, directory, store, user_state, interval=300):
+        self.directory = directory
+        self.store = store
+        self.user_state = user_state
+        self.interval = interval
+        self.sequence = 0
+        self.log_entries = 0
+        self.last_checkpoint = None
+        self._lock = threading.Condition()
+        self._in_flight = 0  # User state changes logged but not yet applied
+        self._draining = False
+        self._checkpoint_lock = threading.Lock()
+        self._log = None
+        self._stop = threading.Event()
+        self._thread = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def _log_path(self, sequence):
+        return os.path.join(self.directory, f"log-{sequence:06d}.bin")
+
+    def _checkpoint_path(self, sequence):
+        return os.path.join(self.directory, f"checkpoint-{sequence:06d}")
+
+    # Recording changes
+
+    def _write(self, entry):
+        if self._log is None:
+            return
+        pickle.dump(entry, self._log, protocol=pickle.HIGHEST_PROTOCOL)
+        self._log.flush()
+        self.log_entries += 1
+
+    def append(self, record):
+        """Store one transaction record and log it; returns its row index"""
+        with self._lock:
+            row = self.store.append(record)
+            if self._log is not None:
+                # Log the time the store resolved, so replay does not stamp a missing one with its own "now"
+                record = dict(record, timestamp=int(self.store.column('timestamp')[row]))
+            self._write(('append', record))
+            return row
+
+    def extend(self, columns, n_rows):
+        """Store a batch of transactions given as columns and log it; returns the first row"""
+        with self._lock:
+            start = self.store.extend(columns, n_rows)
+            if self._log is not None:
+                # Log the times the store resolved, so replay does not stamp missing ones with its own "now"
+                columns = dict(columns, timestamp=self.store.column('timestamp')[start:start + n_rows].copy())
+            self._write(('extend', columns, n_rows))
+            return start
+
+    def _begin(self, entry):
+        """Log a user state change that the caller applies next, outside the lock"""
+        with self._lock:
+            while self._draining:
+                self._lock.wait()
+            self._write(entry)
+            self._in_flight += 1
+
+    def _end(self):
+        with self._lock:
+            self._in_flight -= 1
+            if not self._in_flight:
+                self._lock.notify_all()
+
+    def update_behavior(self, user_id, transaction_data):
+        """Fold a transaction into the user's behavior summary and log it"""
+        self._begin(('behavior', user_id, transaction_data))
+        try:
+            self.user_state.update_behavior(user_id, transaction_data)
+        finally:
+            self._end()
+
+    # Restore
+
+    def restore(self):
+        """Load the latest checkpoint, replay its log and open the log for appending"""
+        if not self.enabled:
+            return None
+        start = time.perf_counter()
+        rows = users = 0
+
+        current = os.path.join(self.directory, 'CURRENT')
+        if os.path.exists(current):
+            with open(current) as f:
+                name = f.read().strip()
+            path = os.path.join(self.directory, name)
+            with open(os.path.join(path, 'manifest.json')) as f:
+                manifest = json.load(f)
+            self.sequence = manifest['sequence']
+            rows = self.store.load_checkpoint(os.path.join(path, 'columns'))
+            with open(os.path.join(path, 'user_state.pkl'), 'rb') as f:
+                self.user_state.import_state(f.read())
+            users = manifest.get('users', 0)
+            self.last_checkpoint = manifest
+
+        # Normally only this checkpoint's log exists; a crash between rotating
+        # the log and writing CURRENT leaves newer logs, which are replayed too
+        replayed = 0
+        for sequence in self._log_sequences(self.sequence):
+            replayed += self._replay(self._log_path(sequence))
+            self.sequence = sequence
+        self._log = open(self._log_path(self.sequence), 'ab')
+        self.log_entries = replayed
+
+        seconds = time.perf_counter() - start
+        logger.info(f"Restored serving state: {rows} checkpointed rows, {users} users, "
+                    f"{replayed} log entries replayed in {seconds:.2f}s")
+        return {'checkpointRows': rows, 'users': users, 'replayedEntries': replayed,
+                'seconds': round(seconds, 3)}
+
+    def _log_sequences(self, first):
+        sequences = []
+        for path in glob.glob(os.path.join(self.directory, 'log-*.bin')):
+            try:
+                sequence = int(os.path.basename(path)[4:-4])
+            except ValueError:
+                continue
+            if sequence >= first:
+                sequences.append(sequence)
+        return sorted(sequences)
+
+    def _replay(self, path):
+        """Apply every complete entry of a log file; a torn tail is cut off"""
+        if not os.path.exists(path):
+            return 0
+
+        replayed = 0
+        good_offset = 0
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    entry = pickle.load(f)
+                except EOFError:
+                    break
+                except (pickle.UnpicklingError, ValueError, IndexError, AttributeError) as e:
+                    logger.warning(f"Stopping log replay at a damaged entry in {path}: {e}")
+                    break
+                self._apply(entry)
+                replayed += 1
+                good_offset = f.tell()
+
+        if good_offset < os.path.getsize(path):
+            # Drop the partial write so new entries start on a clean boundary
+            with open(path, 'r+b') as f:
+                f.truncate(good_offset)
+        return replayed
+
+    def _apply(self, entry):
+        kind = entry[0]
+        if kind == 'append':
+            self.store.append(entry[1])
+        elif kind == 'extend':
+            self.store.extend(entry[1], entry[2])
+        elif kind == 'behavior':
+            self.user_state.update_behavior(entry[1], entry[2])
+        elif kind == 'profile':
+            pass  # Dashboard profiles are no longer kept in user state; old logs may have them
+        else:
+            logger.warning(f"Skipping unknown log entry type: {kind}")
+
+    # Checkpoints
+
+    def checkpoint(self):
+        """Write a new checkpoint and switch to a fresh log; returns its manifest"""
+        if not self.enabled:
+            raise RuntimeError("Checkpointing is disabled")
+        with self._checkpoint_lock:
+            return self._checkpoint()
+
+    def _checkpoint(self):
+        start = time.perf_counter()
+        with self._lock:
+            # Hold off new user state changes and wait for logged ones to be
+            # applied, then capture state and rotate the log together so every
+            # change lands in exactly one of (checkpoint, new log)
+            self._draining = True
+            try:
+                while self._in_flight:
+                    self._lock.wait()
+                sequence = self.sequence + 1
+                store_snapshot = self.store.snapshot()
+                user_blob = self.user_state.export_state()
+
+                old_log = self._log
+                self._log = open(self._log_path(sequence), 'ab')
+                self.sequence = sequence
+                self.log_entries = 0
+            finally:
+                self._draining = False
+                self._lock.notify_all()
+        old_log.close()
+
+        path = self._checkpoint_path(sequence)
+        tmp_path = path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        rows = self.store.save_checkpoint(os.path.join(tmp_path, 'columns'), store_snapshot)
+        with open(os.path.join(tmp_path, 'user_state.pkl'), 'wb') as f:
+            f.write(user_blob)
+        sizes = self.user_state.sizes()
+        manifest = {
+            'version': CHECKPOINT_VERSION,
+            'sequence': sequence,
+            'rows': rows,
+            'users': sizes.get('behaviorProfiles', 0),
+            'createdAt': datetime.now().isoformat()
+        }
+        with open(os.path.join(tmp_path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+
+        # Point CURRENT at the new checkpoint atomically, then drop older ones
+        current_tmp = os.path.join(self.directory, 'CURRENT.tmp')
+        with open(current_tmp, 'w') as f:
+            f.write(os.path.basename(path))
+        os.replace(current_tmp, os.path.join(self.directory, 'CURRENT'))
+        self._remove_before(sequence)
+
+        manifest['seconds'] = round(time.perf_counter() - start, 3)
+        self.last_checkpoint = manifest
+        logger.info(f"Wrote checkpoint {sequence}: {rows} rows in {manifest['seconds']}s")
+        return manifest
+
+    def _remove_before(self, sequence):
+        for path in glob.glob(os.path.join(self.directory, 'checkpoint-*')) + \
+                glob.glob(os.path.join(self.directory, 'log-*.bin')):
+            try:
+                older = int(os.path.basename(path).split('-')[1].split('.')[0]) < sequence
+            except ValueError:
+                continue
+            if older:
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.remove(path)
+
+    # Background checkpoints
+
+    def start(self):
+        """Checkpoint every interval seconds in a background thread (when there are changes)"""
+        if self._thread is not None or not self.interval or not self.enabled:
+            return
+        self._thread = threading.Thread(target=self._run, name='state-checkpointer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self.log_entries:
+                try:
+                    self.checkpoint()
+                except Exception as e:
+                    logger.error(f"Checkpoint failed: {e}")
+
+    def stop(self):
+        """Stop the background thread"""
+        self._stop.set()
+
+    def status(self):
+        """Current sequence, log length and last checkpoint"""
+        return {
+            'enabled': self.enabled,
+            'directory': os.path.abspath(self.directory) if self.enabled else None,
+            'sequence': self.sequence,
+            'logEntries': self.log_entries,
+            'intervalSeconds': self.interval,
+            'lastCheckpoint': self.last_checkpoint
+        }
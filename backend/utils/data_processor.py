@@ -9,6 +9,75 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Model input columns produced by process_single_transaction/process_dataframe
+FEATURE_COLUMNS = [
+    'loginAttempts', 'transactionCount', 'lastTransactionTime',
+    'transactionVelocity', 'hour', 'dayOfWeek', 'month',
+    'transactionType', 'lastTransaction', 'utility', 'location', 'ipSubnet'
+]
+
+IP_SUBNET_MAPPING = {
+    '192.168': 0, '10.0': 1, '172.16': 2, '203.0': 3,
+    '115.240': 4, '49.36': 5, '106.51': 6
+}
+
+# Validation rules shared by validate_transaction_data and validate_dataframe
+REQUIRED_FIELDS = ('userId', 'transactionType')
+NUMERIC_RANGES = {
+    'loginAttempts': (1, 10),
+    'transactionCount': (1, 50),
+    'transactionVelocity': (0.01, 10.0),
+    'lastTransactionTime': (1, 48)
+}
+VALIDATED_CATEGORIES = ('transactionType', 'location')
+
+
+class ValidationResult:
+    """Per-row validation errors as one bitmask per row
+
+    Bit i of ``error_bits[row]`` is set when the row failed ``rules[i]``, so a
+    million-row upload costs four bytes per row however many rows are bad.
+    """
+
+    def __init__(self, n_rows):
+        self.error_bits = np.zeros(n_rows, dtype=np.uint32)
+        self.rules = []
+
+    def add(self, failed, message):
+        """Record a rule and the boolean mask of rows that failed it"""
+        failed = np.asarray(failed, dtype=bool)
+        if not failed.any():
+            return
+        if len(self.rules) == 32:
+            raise ValueError("Too many validation rules for a 32-bit error index")
+        self.error_bits[failed] |= np.uint32(1 << len(self.rules))
+        self.rules.append(message)
+
+    @property
+    def valid_mask(self):
+        return self.error_bits == 0
+
+    @property
+    def n_invalid(self):
+        return int(np.count_nonzero(self.error_bits))
+
+    def errors_for(self, row):
+        """Messages for the rules a row failed"""
+        bits = int(self.error_bits[row])
+        return [message for i, message in enumerate(self.rules) if bits & (1 << i)]
+
+    def summary(self):
+        """Number of failing rows per rule"""
+        return {
+            message: int(np.count_nonzero(self.error_bits & np.uint32(1 << i)))
+            for i, message in enumerate(self.rules)
+        }
+
+    def invalid_rows(self, limit=100):
+        """First invalid rows with their messages"""
+        rows = np.flatnonzero(self.error_bits)[:limit]
+        return [{'row': int(row), 'errors': self.errors_for(row)} for row in rows]
+
 class DataProcessor:
     """Utility class for processing transaction data"""
 
@@ -98,25 +167,60 @@ class DataProcessor:
             logger.error(f"Error processing CSV data: {e}")
             raise
 
-    def validate_transaction_data(self, transaction_data):
-        """Validate transaction data format and required fields"""
-        required_fields = ['userId', 'transactionType']
+    def process_dataframe(self, df):
+        """Vectorized equivalent of process_single_transaction for a whole DataFrame"""
+        n_rows = len(df)
+        processed = pd.DataFrame(index=df.index)
+
+        def column(name, default):
+            if name in df.columns:
+                return df[name]
+            return pd.Series(default, index=df.index)
+
+        processed['loginAttempts'] = pd.to_numeric(column('loginAttempts', 1), errors='coerce').fillna(1).astype(np.int32)
+        processed['transactionCount'] = pd.to_numeric(column('transactionCount', 1), errors='coerce').fillna(1).astype(np.int32)
+        processed['transactionVelocity'] = pd.to_numeric(column('transactionVelocity', 0.5), errors='coerce').fillna(0.5).astype(np.float32)
+        processed['lastTransactionTime'] = pd.to_numeric(column('lastTransactionTime', 24), errors='coerce').fillna(24).astype(np.int32)
+
+        # Datetime features, falling back to the current time like the single-row path
+        now = pd.Timestamp(datetime.now())
+        if 'timestamp' in df.columns:
+            timestamps = pd.to_datetime(df['timestamp'], errors='coerce', format='mixed').fillna(now)
+        else:
+            timestamps = pd.Series(now, index=df.index)
+        processed['hour'] = timestamps.dt.hour.astype(np.int32)
+        processed['dayOfWeek'] = timestamps.dt.dayofweek.astype(np.int32)
+        processed['month'] = timestamps.dt.month.astype(np.int32)
+
+        # Encode categorical variables
+        for category, default in [('transactionType', 'Credit Card'), ('lastTransaction', 'Shopping'),
+                                  ('utility', 'Payment'), ('location', 'Mumbai')]:
+            values = column(category, default)
+            processed[category] = values.map(self.categorical_mappings[category]).fillna(0).astype(np.int32)
+
+        # Process IP address to subnet
+        ip_addresses = column('ipAddress', '192.168.1.1').astype(str)
+        ip_subnets = ip_addresses.str.split('.', n=2).str[:2].str.join('.')
+        processed['ipSubnet'] = ip_subnets.map(IP_SUBNET_MAPPING).fillna(0).astype(np.int32)
+
+        logger.debug(f"Processed {n_rows} transactions in bulk")
+        return processed[FEATURE_COLUMNS]
+
+    def validate_transaction_data(self, transaction_data, check_categories=True):
+        """Validate transaction data format and required fields
+
+        With check_categories=False unknown transactionType/location values
+        pass; processing encodes them like the default category.
+        """
         errors = []
 
         # Check required fields
-        for field in required_fields:
+        for field in REQUIRED_FIELDS:
             if field not in transaction_data or transaction_data[field] is None:
                 errors.append(f"Missing required field: {field}")
 
         # Validate data types and ranges
-        numeric_validations = {
-            'loginAttempts': (1, 10),
-            'transactionCount': (1, 50),
-            'transactionVelocity': (0.01, 10.0),
-            'lastTransactionTime': (1, 48)
-        }
-
-        for field, (min_val, max_val) in numeric_validations.items():
+        for field, (min_val, max_val) in NUMERIC_RANGES.items():
             if field in transaction_data:
                 try:
                     val = float(transaction_data[field])
@@ -126,27 +230,63 @@ class DataProcessor:
                     errors.append(f"{field} must be a valid number")
 
         # Validate categorical fields
-        categorical_validations = {
-            'transactionType': ['Credit Card', 'Debit Card', 'UPI'],
-            'location': list(self.categorical_mappings['location'].keys())
-        }
-
-        for field, valid_values in categorical_validations.items():
+        for field in VALIDATED_CATEGORIES if check_categories else ():
+            valid_values = self.categorical_mappings[field]
             if field in transaction_data:
                 if transaction_data[field] not in valid_values:
                     errors.append(f"{field} must be one of: {', '.join(valid_values)}")
 
+        if transaction_data.get('timestamp') is not None:
+            try:
+                pd.Timestamp(transaction_data['timestamp'])
+            except (ValueError, TypeError):
+                errors.append("timestamp must be a valid date/time")
+
         return errors
 
+    def validate_dataframe(self, df, required_fields=REQUIRED_FIELDS):
+        """Vectorized validate_transaction_data for a whole DataFrame (or chunk)
+
+        Applies the same rules with column masks and returns a
+        ValidationResult. Empty cells count as missing, which only fails the
+        required fields; process_dataframe fills defaults for the rest.
+        """
+        result = ValidationResult(len(df))
+
+        for field in required_fields:
+            if field in df.columns:
+                result.add(df[field].isna().values, f"Missing required field: {field}")
+            else:
+                result.add(np.ones(len(df), dtype=bool), f"Missing required field: {field}")
+
+        for field, (min_val, max_val) in NUMERIC_RANGES.items():
+            if field not in df.columns:
+                continue
+            present = df[field].notna().values
+            values = pd.to_numeric(df[field], errors='coerce').values.astype(np.float64)
+            not_numeric = present & np.isnan(values)
+            result.add(not_numeric, f"{field} must be a valid number")
+            with np.errstate(invalid='ignore'):
+                out_of_range = present & ~not_numeric & ((values < min_val) | (values > max_val))
+            result.add(out_of_range, f"{field} must be between {min_val} and {max_val}")
+
+        for field in VALIDATED_CATEGORIES:
+            if field not in df.columns:
+                continue
+            valid_values = self.categorical_mappings[field]
+            unknown = df[field].notna().values & ~df[field].isin(list(valid_values)).values
+            result.add(unknown, f"{field} must be one of: {', '.join(valid_values)}")
+
+        if 'timestamp' in df.columns:
+            parsed = pd.to_datetime(df['timestamp'], errors='coerce', format='mixed')
+            result.add(df['timestamp'].notna().values & parsed.isna().values,
+                       "timestamp must be a valid date/time")
+
+        return result
+
     def create_feature_vector(self, processed_transaction):
         """Create feature vector for model input"""
-        feature_order = [
-            'loginAttempts', 'transactionCount', 'lastTransactionTime',
-            'transactionVelocity', 'hour', 'dayOfWeek', 'month',
-            'transactionType', 'lastTransaction', 'utility', 'location', 'ipSubnet'
-        ]
-
-        return np.array([processed_transaction.get(field, 0) for field in feature_order])
+        return np.array([processed_transaction.get(field, 0) for field in FEATURE_COLUMNS])
 
     def _parse_datetime(self, timestamp_str):
         """Parse various datetime formats"""
@@ -175,11 +315,7 @@ class DataProcessor:
 
     def _encode_ip_subnet(self, ip_subnet):
         """Encode IP subnet"""
-        subnet_mapping = {
-            '192.168': 0, '10.0': 1, '172.16': 2, '203.0': 3,
-            '115.240': 4, '49.36': 5, '106.51': 6
-        }
-        return subnet_mapping.get(ip_subnet, 0)
+        return IP_SUBNET_MAPPING.get(ip_subnet, 0)
 
     def _get_default_transaction(self):
         """Return default transaction data for error cases"""
@@ -0,0 +1,186 @@
+"""
+Feature drift between the training distribution and live scoring traffic
+"""
+
+import threading
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Usual PSI reading: < 0.1 stable, 0.1-0.25 moderate shift, > 0.25 significant shift
+PSI_MODERATE = 0.1
+PSI_SIGNIFICANT = 0.25
+
+
+def _bin_edges(values, n_bins):
+    """Bin edges: midpoints for low-cardinality features, quantiles otherwise
+
+    The outer edges bracket the training range, so live values outside it
+    land in their own (empty in training) bins instead of the end bins.
+    """
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return np.array([], dtype=np.float64)
+    unique = np.unique(values)
+    if len(unique) <= n_bins:
+        interior = (unique[:-1] + unique[1:]) / 2
+        return np.concatenate([[unique[0] - 0.5], interior, [unique[-1] + 0.5]])
+    interior = np.quantile(values, np.linspace(0, 1, n_bins + 1)[1:-1])
+    return np.unique(np.concatenate([[unique[0]], interior, [np.nextafter(unique[-1], np.inf)]]))
+
+
+def build_reference(chunks, feature_names, n_bins=10):
+    """Fixed-bin histograms of the training features, as a plain (picklable) dict
+
+    ``chunks`` is an iterable of 2-D feature arrays in model column order;
+    bin edges come from the first chunk and every chunk is counted, so a
+    dataset larger than memory can be summarized in one streaming pass.
+    """
+    edges = None
+    counts = None
+    rows = 0
+    for X in chunks:
+        X = np.asarray(X, dtype=np.float64)
+        if edges is None:
+            edges = [_bin_edges(X[:, j], n_bins) for j in range(X.shape[1])]
+            counts = [np.zeros(len(e) + 1, dtype=np.int64) for e in edges]
+        for j, feature_edges in enumerate(edges):
+            counts[j] += np.bincount(np.searchsorted(feature_edges, X[:, j], side='right'),
+                                     minlength=len(feature_edges) + 1)
+        rows += len(X)
+
+    if edges is None:
+        return None
+    return {
+        'features': list(feature_names),
+        'edges': [e.tolist() for e in edges],
+        'counts': [c.tolist() for c in counts],
+        'rows': rows
+    }
+
+
+def psi(expected, actual, epsilon=1e-4):
+    """Population stability index between two histograms over the same bins"""
+    e = np.maximum(expected / max(expected.sum(), 1), epsilon)
+    a = np.maximum(actual / max(actual.sum(), 1), epsilon)
+    return float(np.sum((a - e) * np.log(a / e)))
+
+
+def ks_statistic(expected, actual):
+    """Largest gap between the two binned CDFs (a lower bound on the exact KS statistic)"""
+    e = np.cumsum(expected) / max(expected.sum(), 1)
+    a = np.cumsum(actual) / max(actual.sum(), 1)
+    return float(np.max(np.abs(e - a)))
+
+
+class DriftMonitor:
+    """Live histograms over the training bins, compared with PSI/KS on demand
+
+    All features' bins live in one flat count array, so a batch is folded in
+    with a single bincount. Single transactions are buffered and folded in
+    together once the buffer fills (or when a report is asked for). No raw
+    transactions are kept beyond that buffer.
+    """
+
+    def __init__(self, reference, buffer_size=256):
+        self.reference = reference
+        self.features = reference['features']
+        self.edges = [np.asarray(e, dtype=np.float64) for e in reference['edges']]
+        self.expected = [np.asarray(c, dtype=np.int64) for c in reference['counts']]
+
+        sizes = [len(e) + 1 for e in self.edges]
+        self._offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+        self._n_bins = int(sum(sizes))
+        self.counts = np.zeros(self._n_bins, dtype=np.int64)
+        self.rows = 0
+
+        self._buffer = np.empty((buffer_size, len(self.features)), dtype=np.float64)
+        self._buffered = 0
+        self._lock = threading.Lock()
+
+    def update(self, X):
+        """Fold a batch (or a single row) of model features into the live histograms"""
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        with self._lock:
+            if len(X) == 1:
+                self._buffer[self._buffered] = X[0]
+                self._buffered += 1
+                if self._buffered == len(self._buffer):
+                    self._flush()
+            else:
+                self._add(X)
+
+    def _flush(self):
+        if self._buffered:
+            self._add(self._buffer[:self._buffered])
+            self._buffered = 0
+
+    def _add(self, X):
+        bins = np.empty(X.shape, dtype=np.int64)
+        for j, feature_edges in enumerate(self.edges):
+            bins[:, j] = np.searchsorted(feature_edges, X[:, j], side='right')
+        bins += self._offsets
+        self.counts += np.bincount(bins.ravel(), minlength=self._n_bins)
+        self.rows += len(X)
+
+    def report(self):
+        """PSI and KS per feature, worst first, plus an overall status"""
+        with self._lock:
+            self._flush()
+            counts = self.counts.copy()
+            rows = self.rows
+
+        features = []
+        for j, name in enumerate(self.features):
+            start = self._offsets[j]
+            actual = counts[start:start + len(self.expected[j])]
+            feature_psi = psi(self.expected[j], actual) if rows else 0.0
+            features.append({
+                'feature': name,
+                'psi': round(feature_psi, 4),
+                'ks': round(ks_statistic(self.expected[j], actual), 4) if rows else 0.0,
+                'status': self._status(feature_psi),
+                'bins': len(actual)
+            })
+        features.sort(key=lambda f: f['psi'], reverse=True)
+
+        worst = features[0]['psi'] if features else 0.0
+        return {
+            'liveRows': rows,
+            'referenceRows': self.reference['rows'],
+            'status': self._status(worst) if rows else 'no_data',
+            'features': features
+        }
+
+    def histogram(self, feature):
+        """Bin edges with reference and live counts for one feature, or None if unknown"""
+        if feature not in self.features:
+            return None
+        j = self.features.index(feature)
+        with self._lock:
+            self._flush()
+            start = self._offsets[j]
+            actual = self.counts[start:start + len(self.expected[j])].tolist()
+        return {
+            'feature': feature,
+            'edges': self.edges[j].tolist(),
+            'reference': self.expected[j].tolist(),
+            'live': actual
+        }
+
+    def reset(self):
+        """Forget the live counts"""
+        with self._lock:
+            self.counts[:] = 0
+            self.rows = 0
+            self._buffered = 0
+
+    @staticmethod
+    def _status(value):
+        if value >= PSI_SIGNIFICANT:
+            return 'significant'
+        if value >= PSI_MODERATE:
+            return 'moderate'
+        return 'stable'
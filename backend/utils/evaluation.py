@@ -0,0 +1,178 @@
+"""
+Batch evaluation metrics for the fraud detection models
+"""
+
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class RankedScores:
+    """Scores sorted once and grouped by distinct value
+
+    All metrics below work on per-group label weights, so a bootstrap
+    replicate only needs new weights (Poisson bootstrap) instead of a
+    resample and re-sort of the whole array.
+    """
+
+    def __init__(self, y_true, scores):
+        y_true = np.asarray(y_true, dtype=np.float64)
+        scores = np.asarray(scores, dtype=np.float64)
+
+        # Descending order; groups of tied scores share one threshold
+        order = np.argsort(-scores, kind='stable')
+        self.y = y_true[order]
+        self.n = len(scores)
+        sorted_scores = scores[order]
+        boundaries = np.flatnonzero(np.diff(sorted_scores)) + 1
+        self.group = np.zeros(self.n, dtype=np.int64)
+        self.group[boundaries] = 1
+        self.group = np.cumsum(self.group)
+        self.n_groups = int(self.group[-1]) + 1 if self.n else 0
+
+    def metrics(self, k_values, weights=None):
+        """AUC, average precision and precision@k for the given row weights"""
+        w = np.ones(self.n) if weights is None else weights
+        pos = np.bincount(self.group, weights=w * self.y, minlength=self.n_groups)
+        neg = np.bincount(self.group, weights=w * (1 - self.y), minlength=self.n_groups)
+        total_pos, total_neg = pos.sum(), neg.sum()
+
+        results = {}
+        if total_pos > 0 and total_neg > 0:
+            # Each positive beats the negatives ranked below it, ties count half
+            neg_below = total_neg - np.cumsum(neg)
+            results['auc'] = float(np.sum(pos * (neg_below + 0.5 * neg)) / (total_pos * total_neg))
+            tp = np.cumsum(pos)
+            fp = np.cumsum(neg)
+            # Groups holding only zero-weight rows have no precision (and add nothing)
+            precision = np.divide(tp, tp + fp, out=np.zeros_like(tp), where=(tp + fp) > 0)
+            results['average_precision'] = float(np.sum(pos * precision) / total_pos)
+        else:
+            results['auc'] = np.nan
+            results['average_precision'] = np.nan
+
+        cum_w = np.cumsum(w)
+        cum_tp = np.cumsum(w * self.y)
+        for k in k_values:
+            cut = min(int(np.searchsorted(cum_w, k, side='left')), self.n - 1)
+            results[f'precision_at_{k}'] = float(cum_tp[cut] / cum_w[cut]) if cum_w[cut] > 0 else np.nan
+
+        return results
+
+
+# Per-process state for bootstrap workers, set once by the pool initializer
+_worker_ranked = None
+
+
+def _init_bootstrap_worker(ranked):
+    global _worker_ranked
+    _worker_ranked = ranked
+
+
+def _bootstrap_batch(seed, n_replicates, k_values):
+    rng = np.random.default_rng(seed)
+    return [
+        _worker_ranked.metrics(k_values, weights=rng.poisson(1.0, _worker_ranked.n))
+        for _ in range(n_replicates)
+    ]
+
+
+def bootstrap_metrics(y_true, scores, k_values=(100, 500, 1000), n_boot=200,
+                      alpha=0.05, n_workers=None, seed=42):
+    """Point estimates and bootstrap confidence intervals, computed across processes
+
+    Returns ``{metric: (estimate, lower, upper, n_dropped)}``, where ``n_dropped``
+    counts the replicates left out of the interval because the metric was
+    undefined for them (e.g. a resample without positives).
+    """
+    ranked = RankedScores(y_true, scores)
+    for k in k_values:
+        if k > ranked.n:
+            # The cut-off is clamped to the whole set, so this is just the base rate
+            logger.warning(f"precision@{k} requested for only {ranked.n} rows: "
+                           f"clamped to all {ranked.n} rows")
+    estimates = ranked.metrics(k_values)
+
+    replicates = []
+    if n_boot > 0:
+        n_workers = n_workers or os.cpu_count() or 1
+        batch_sizes = [len(b) for b in np.array_split(np.arange(n_boot), n_workers) if len(b)]
+        seeds = np.random.SeedSequence(seed).generate_state(len(batch_sizes))
+
+        if len(batch_sizes) == 1:
+            _init_bootstrap_worker(ranked)
+            replicates = _bootstrap_batch(int(seeds[0]), batch_sizes[0], k_values)
+        else:
+            with ProcessPoolExecutor(max_workers=len(batch_sizes), initializer=_init_bootstrap_worker,
+                                     initargs=(ranked,)) as pool:
+                futures = [pool.submit(_bootstrap_batch, int(s), size, k_values)
+                           for s, size in zip(seeds, batch_sizes)]
+                for future in futures:
+                    replicates.extend(future.result())
+
+    results = {}
+    for metric, estimate in estimates.items():
+        values = np.array([r[metric] for r in replicates], dtype=np.float64)
+        defined = values[~np.isnan(values)]
+        dropped = len(values) - len(defined)
+        if dropped and not np.isnan(estimate):
+            # The interval over the remaining replicates leans optimistic; say by how much
+            logger.warning(f"Dropped {dropped} of {len(values)} bootstrap replicates without a {metric} "
+                           f"(too few positives or negatives in the sample)")
+        if len(defined):
+            lower, upper = np.quantile(defined, [alpha / 2, 1 - alpha / 2])
+        else:
+            lower = upper = np.nan
+        results[metric] = (estimate, float(lower), float(upper), dropped)
+
+    return results
+
+
+def threshold_sweep(risk_scores, is_anomalous, y_true, thresholds):
+    """Decision volumes and catch rates of the combined decision for each threshold
+
+    Scores are sorted once per (anomalous, fraud) cell; every threshold is then
+    answered with a binary search, so the sweep is a single pass over the data.
+    """
+    risk_scores = np.asarray(risk_scores, dtype=np.float64)
+    anomalous = np.asarray(is_anomalous, dtype=bool)
+    fraud = np.asarray(y_true).astype(bool)
+    n = len(risk_scores)
+    total_fraud = int(fraud.sum())
+
+    cells = {}
+    for anom in (False, True):
+        for is_fraud in (False, True):
+            cells[anom, is_fraud] = np.sort(risk_scores[(anomalous == anom) & (fraud == is_fraud)])
+
+    def above(cell, threshold):
+        return len(cell) - int(np.searchsorted(cell, threshold, side='right'))
+
+    rows = []
+    for threshold in thresholds:
+        high = {key: above(cell, threshold) for key, cell in cells.items()}
+        sizes = {key: len(cell) for key, cell in cells.items()}
+
+        critical = high[True, False] + high[True, True]
+        high_only = high[False, False] + high[False, True]
+        moderate = sizes[True, False] + sizes[True, True] - critical
+        low = n - critical - high_only - moderate
+        alerts = critical + high_only
+        caught = high[True, True] + high[False, True]
+
+        rows.append({
+            'threshold': round(float(threshold), 4),
+            'critical': critical,
+            'high': high_only,
+            'moderate': moderate,
+            'low': low,
+            'alert_rate': alerts / n if n else 0.0,
+            'catch_rate': caught / total_fraud if total_fraud else 0.0,
+            'alert_precision': caught / alerts if alerts else 0.0
+        })
+
+    return rows
@@ -0,0 +1,120 @@
+"""
+Per-transaction risk explanations from XGBoost TreeSHAP contributions
+"""
+
+import threading
+from collections import OrderedDict
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class RiskExplainer:
+    """Top-k feature contributions per transaction, cached by feature vector
+
+    Contributions are computed for a whole batch in one pred_contribs call,
+    and identical feature vectors (common for replayed or templated traffic)
+    are served from an LRU cache. Feature vectors of recent single
+    transactions are kept so they can be explained later, on request,
+    instead of on the scoring path.
+    """
+
+    def __init__(self, fraud_model, top_k=3, max_entries=10000, max_remembered=10000):
+        self.fraud_model = fraud_model
+        self.top_k = top_k
+        self.max_entries = max_entries
+        self.max_remembered = max_remembered
+        self._cache = OrderedDict()
+        self._remembered = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def explain(self, X):
+        """Explanation dicts for each row of a processed feature matrix (None without a model)"""
+        X = np.atleast_2d(np.asarray(X, dtype=np.float32))
+        keys = [row.tobytes() for row in X]
+        results = [None] * len(keys)
+
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is None:
+                    missing.append(i)
+                else:
+                    self._cache.move_to_end(key)
+                    results[i] = cached
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            computed = self._compute(X[missing])
+            if computed is None:
+                return results
+            with self._lock:
+                for i, explanation in zip(missing, computed):
+                    results[i] = explanation
+                    self._cache[keys[i]] = explanation
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+
+        return results
+
+    def explain_one(self, features):
+        """Explanation for a single processed transaction (dict or feature vector)"""
+        if isinstance(features, dict):
+            features = self.fraud_model._dict_to_array(features)
+        return self.explain(features)[0]
+
+    def _compute(self, X):
+        result = self.fraud_model.feature_contributions(X)
+        if result is None:
+            return None
+        feature_names, contributions, bias = result
+
+        k = min(self.top_k, contributions.shape[1])
+        # Largest absolute contributions first
+        top = np.argsort(-np.abs(contributions), axis=1, kind='stable')[:, :k]
+        return [
+            {
+                'baseValue': round(float(bias[row]), 4),
+                'topFeatures': [
+                    {
+                        'feature': feature_names[j],
+                        'value': round(float(X[row, j]), 4),
+                        'contribution': round(float(contributions[row, j]), 4)
+                    }
+                    for j in top[row]
+                    if contributions[row, j] != 0
+                ]
+            }
+            for row in range(len(X))
+        ]
+
+    def remember(self, transaction_id, features):
+        """Keep a transaction's features (dict or vector, converted only if explained later)"""
+        with self._lock:
+            self._remembered[transaction_id] = features
+            while len(self._remembered) > self.max_remembered:
+                self._remembered.popitem(last=False)
+
+    def explain_transaction(self, transaction_id):
+        """Explanation for a remembered transaction, or None if it is not remembered"""
+        with self._lock:
+            features = self._remembered.get(transaction_id)
+        if features is None:
+            return None
+        return self.explain_one(features)
+
+    def stats(self):
+        """Cache counters"""
+        with self._lock:
+            return {
+                'cachedExplanations': len(self._cache),
+                'rememberedTransactions': len(self._remembered),
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,104 @@
+"""
+Fast JSON encoding for API responses (orjson when installed) with NumPy support
+"""
+
+import json
+from datetime import date, datetime
+from itertools import islice
+import logging
+
+import numpy as np
+import pandas as pd
+from flask import stream_with_context
+from flask.json.provider import DefaultJSONProvider
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # Optional: falls back to the standard library encoder
+    orjson = None
+
+
+def to_jsonable(obj):
+    """Plain Python value for types neither encoder handles natively"""
+    if isinstance(obj, np.generic):
+        value = obj.item()
+        # NaN/inf are not JSON; encode them as null like orjson does
+        return None if isinstance(value, float) and not np.isfinite(value) else value
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (pd.Timestamp, datetime, date)):
+        return obj.isoformat()
+    if obj is pd.NaT or obj is pd.NA:
+        return None
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    # Decimal, UUID, dataclasses and __html__ as Flask encodes them
+    return DefaultJSONProvider.default(obj)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider encoding with orjson, so ``jsonify`` needs no changes
+
+    NumPy arrays and scalars, datetimes and pandas timestamps are encoded
+    without converting them first, and NaN/inf floats become null (which
+    keeps responses valid JSON). Keys are sorted and non-string keys are
+    converted, as with Flask's default provider. Without orjson this is the
+    default provider with NumPy support added.
+    """
+
+    default = staticmethod(to_jsonable)
+
+    def _options(self, indent=False):
+        options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps_bytes(self, obj, indent=False):
+        """UTF-8 encoded JSON for obj"""
+        if orjson is None:
+            return json.dumps(obj, default=to_jsonable, ensure_ascii=self.ensure_ascii, sort_keys=self.sort_keys,
+                              indent=2 if indent else None,
+                              separators=None if indent else (',', ':')).encode('utf-8')
+        return orjson.dumps(obj, default=to_jsonable, option=self._options(indent))
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.dumps_bytes(obj, indent) + b'\n', mimetype=self.mimetype)
+
+    def iter_encode(self, obj, stream_key, items, batch_size=500):
+        """Encode obj with obj[stream_key] replaced by items, yielding bytes as items are encoded
+
+        items can be any iterable (e.g. a generator materializing rows in
+        batches), so neither the list nor the full document is held in
+        memory. The streamed key comes first; the other keys follow.
+        """
+        head = self.dumps_bytes({key: value for key, value in obj.items() if key != stream_key})
+        yield b'{' + self.dumps_bytes(stream_key) + b':['
+        items = iter(items)
+        first = True
+        while True:
+            batch = list(islice(items, batch_size))
+            if not batch:
+                break
+            encoded = self.dumps_bytes(batch)[1:-1]  # Strip the list brackets
+            yield encoded if first else b',' + encoded
+            first = False
+        yield b']' + (b',' + head[1:] if len(head) > 2 else b'}') + b'\n'
+
+    def streaming_response(self, obj, stream_key, items, batch_size=500):
+        """Response streaming obj with the large list under stream_key encoded batch by batch"""
+        return self._app.response_class(
+            stream_with_context(self.iter_encode(obj, stream_key, items, batch_size)),
+            mimetype=self.mimetype
+        )
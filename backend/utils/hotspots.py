@@ -0,0 +1,137 @@
+"""
+Sliding-window heavy-hitter tracking for traffic concentration
+"""
+
+import threading
+import time
+from collections import deque
+import logging
+
+from utils.sketches import CountMinSketch, TopK
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ('ipAddress', 'ipSubnet', 'userId')
+
+
+def ip_subnet(ip_address):
+    """Two-octet subnet of an IPv4 address (matches DataProcessor)"""
+    return '.'.join(str(ip_address).split('.')[:2])
+
+
+class _Bucket:
+    """Sketches for one time slice of the window"""
+
+    __slots__ = ('bucket_id', 'counters', 'heavy_hitters')
+
+    def __init__(self, bucket_id, width, depth, k):
+        self.bucket_id = bucket_id
+        self.counters = {dim: CountMinSketch(width, depth) for dim in DIMENSIONS}
+        self.heavy_hitters = {dim: TopK(k) for dim in DIMENSIONS}
+
+
+class HotspotTracker:
+    """Count-Min + Space-Saving counts of IPs, subnets and users over a sliding window
+
+    The window is split into n_buckets slices; each slice holds a fixed-size
+    sketch per dimension and expired slices are dropped whole, so memory is
+    fixed and an update touches only the newest slice.
+    """
+
+    def __init__(self, window_seconds=3600, n_buckets=6, width=4096, depth=4, k=64):
+        self.window_seconds = window_seconds
+        self.n_buckets = n_buckets
+        self.bucket_seconds = window_seconds / n_buckets
+        self.width = width
+        self.depth = depth
+        self.k = k
+        self._buckets = deque()
+        self._lock = threading.Lock()
+
+    def record(self, ip_address=None, user_id=None, now=None):
+        """Count one scored transaction"""
+        values = self._values(ip_address, user_id)
+        with self._lock:
+            bucket = self._current_bucket(now)
+            for dim, value in values.items():
+                bucket.counters[dim].add(value)
+                bucket.heavy_hitters[dim].add(value)
+
+    def record_batch(self, ip_addresses=None, user_ids=None, now=None):
+        """Count a batch of scored transactions with one sketch update per dimension"""
+        columns = {}
+        if ip_addresses is not None:
+            ips = [str(ip) for ip in ip_addresses]
+            columns['ipAddress'] = ips
+            columns['ipSubnet'] = [ip_subnet(ip) for ip in ips]
+        if user_ids is not None:
+            columns['userId'] = [str(user_id) for user_id in user_ids]
+
+        with self._lock:
+            bucket = self._current_bucket(now)
+            for dim, values in columns.items():
+                bucket.counters[dim].add_many(values)
+                heavy_hitters = bucket.heavy_hitters[dim]
+                for value in values:
+                    heavy_hitters.add(value)
+
+    def count(self, dimension, value, now=None):
+        """Estimated occurrences of value in the current window"""
+        with self._lock:
+            self._expire(now)
+            return sum(bucket.counters[dimension].estimate(value) for bucket in self._buckets)
+
+    def features(self, ip_address=None, user_id=None, now=None):
+        """Windowed counts for one transaction's IP, subnet and user"""
+        values = self._values(ip_address, user_id)
+        with self._lock:
+            self._expire(now)
+            return {
+                dim: sum(bucket.counters[dim].estimate(value) for bucket in self._buckets)
+                for dim, value in values.items()
+            }
+
+    def top(self, dimension, n=20, now=None):
+        """Heaviest values of a dimension in the window, with Count-Min estimates"""
+        with self._lock:
+            self._expire(now)
+            candidates = set()
+            for bucket in self._buckets:
+                candidates.update(bucket.heavy_hitters[dimension].counts)
+            total = sum(bucket.counters[dimension].total for bucket in self._buckets)
+            ranked = sorted(
+                ((value, sum(b.counters[dimension].estimate(value) for b in self._buckets))
+                 for value in candidates),
+                key=lambda item: -item[1]
+            )[:n]
+
+        return [
+            {'value': value, 'count': count, 'share': round(count / total, 4) if total else 0.0}
+            for value, count in ranked
+        ]
+
+    def summary(self, n=20, now=None):
+        """Top values for every dimension"""
+        return {dim: self.top(dim, n, now) for dim in DIMENSIONS}
+
+    def _values(self, ip_address, user_id):
+        values = {}
+        if ip_address:
+            values['ipAddress'] = str(ip_address)
+            values['ipSubnet'] = ip_subnet(ip_address)
+        if user_id:
+            values['userId'] = str(user_id)
+        return values
+
+    def _current_bucket(self, now):
+        bucket_id = self._expire(now)
+        if not self._buckets or self._buckets[-1].bucket_id != bucket_id:
+            self._buckets.append(_Bucket(bucket_id, self.width, self.depth, self.k))
+        return self._buckets[-1]
+
+    def _expire(self, now):
+        """Drop slices that have left the window; returns the current slice id"""
+        bucket_id = int((time.time() if now is None else now) // self.bucket_seconds)
+        while self._buckets and self._buckets[0].bucket_id <= bucket_id - self.n_buckets:
+            self._buckets.popleft()
+        return bucket_id
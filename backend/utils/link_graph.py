@@ -0,0 +1,237 @@
+"""
+Entity-link graph clustering users who share IP addresses or other identifiers
+"""
+
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Transaction fields whose exact value links the users that share it
+LINK_FIELDS = ('ipAddress', 'deviceId')
+
+
+class LinkGraph:
+    """Incremental union-find over users and the identifiers they use
+
+    Users and identifier values are nodes; every transaction links its user
+    to its identifiers and merges their sets (union by size, path halving),
+    so the cluster of a user and its user count, transactions and fraud
+    count are read in near-constant O(α(n)) time. Union-find cannot split
+    sets, so edges not seen for window_seconds are expired by rebuilding
+    from the live edges every rebuild_seconds; the least recently seen
+    edges are also dropped early when there are more than max_edges. Users'
+    transaction and fraud counts are kept per rebuild_seconds bucket, so
+    counts older than the window expire with the edges.
+    """
+
+    def __init__(self, window_seconds=86400, max_edges=1000000, rebuild_seconds=None):
+        self.window_seconds = window_seconds
+        self.max_edges = max_edges
+        self.rebuild_seconds = rebuild_seconds or max(1.0, window_seconds / 8)
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+        self._clear()
+        self._last_rebuild = None
+
+    def _clear(self):
+        self._index = {}  # (field, value) -> node
+        self._keys = []
+        self._parent = []
+        self._last_seen = []
+        self._edges = {}  # (user node, identifier node) -> last seen, least recently seen first
+        # Per user node: [bucket, transactions, frauds] per rebuild_seconds bucket, and their totals
+        self._activity = []
+        self._transactions = []
+        self._frauds = []
+        # Per root: cluster totals
+        self._cluster_nodes = []
+        self._cluster_users = []
+        self._cluster_transactions = []
+        self._cluster_frauds = []
+
+    def _node(self, key, now):
+        node = self._index.get(key)
+        if node is None:
+            node = self._index[key] = len(self._keys)
+            self._keys.append(key)
+            self._parent.append(node)
+            self._last_seen.append(now)
+            self._activity.append([] if key[0] == 'userId' else None)
+            self._transactions.append(0)
+            self._frauds.append(0)
+            self._cluster_nodes.append(1)
+            self._cluster_users.append(1 if key[0] == 'userId' else 0)
+            self._cluster_transactions.append(0)
+            self._cluster_frauds.append(0)
+        else:
+            self._last_seen[node] = now
+        return node
+
+    def _find(self, node):
+        parent = self._parent
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def _union(self, a, b):
+        a, b = self._find(a), self._find(b)
+        if a == b:
+            return
+        if self._cluster_nodes[a] < self._cluster_nodes[b]:
+            a, b = b, a
+        self._parent[b] = a
+        self._cluster_nodes[a] += self._cluster_nodes[b]
+        self._cluster_users[a] += self._cluster_users[b]
+        self._cluster_transactions[a] += self._cluster_transactions[b]
+        self._cluster_frauds[a] += self._cluster_frauds[b]
+
+    def _add(self, user_id, identifiers, fraud, now):
+        user = self._node(('userId', str(user_id)), now)
+        activity = self._activity[user]
+        bucket = int(now // self.rebuild_seconds)
+        if not activity or activity[-1][0] != bucket:
+            activity.append([bucket, 0, 0])
+        activity[-1][1] += 1
+        activity[-1][2] += fraud
+        self._transactions[user] += 1
+        self._frauds[user] += fraud
+        root = self._find(user)
+        self._cluster_transactions[root] += 1
+        self._cluster_frauds[root] += fraud
+        for field, value in identifiers:
+            if value is None or value != value or value == '':  # Missing (None/NaN/empty)
+                continue
+            identifier = self._node((field, str(value)), now)
+            # Re-insert so the dict stays ordered by last seen
+            self._edges.pop((user, identifier), None)
+            self._edges[(user, identifier)] = now
+            self._union(user, identifier)
+
+    def record(self, user_id, identifiers, fraud=0, now=None):
+        """Link one transaction's user to its identifiers ({field: value})"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._add(user_id, identifiers.items(), int(fraud), now)
+            self._maybe_rebuild(now)
+
+    def record_batch(self, user_ids, identifiers, frauds=None, now=None):
+        """Link a batch of transactions; identifiers maps field -> values aligned with user_ids"""
+        now = time.time() if now is None else now
+        fields = [(field, list(values)) for field, values in identifiers.items() if values is not None]
+        with self._lock:
+            for i, user_id in enumerate(user_ids):
+                self._add(user_id, [(field, values[i]) for field, values in fields],
+                          int(frauds[i]) if frauds is not None else 0, now)
+            self._maybe_rebuild(now)
+
+    def _maybe_rebuild(self, now):
+        if self._last_rebuild is None:
+            self._last_rebuild = now
+        if len(self._edges) > self.max_edges:
+            # Drop the least recently seen edges (ties in insertion order), leaving
+            # headroom so this does not run on every insert
+            self._rebuild(now - self.window_seconds, now, drop=len(self._edges) - int(self.max_edges * 0.75))
+        elif now - self._last_rebuild >= self.rebuild_seconds:
+            self._rebuild(now - self.window_seconds, now)
+
+    def _rebuild(self, cutoff, now, drop=0):
+        """Rebuild the sets from the edges and users seen at or after cutoff, less the drop oldest edges"""
+        edges = iter(self._edges.items())
+        for _ in range(drop):
+            next(edges)
+        live_edges = [(self._keys[u], self._keys[i], seen) for (u, i), seen in edges if seen >= cutoff]
+        first_bucket = int(cutoff // self.rebuild_seconds)
+        live_users = [(self._keys[node], self._last_seen[node],
+                       [entry for entry in self._activity[node] if entry[0] >= first_bucket])
+                      for node in range(len(self._keys))
+                      if self._keys[node][0] == 'userId' and self._last_seen[node] >= cutoff]
+        n_edges = len(self._edges)
+
+        self._clear()
+        for key, seen, activity in live_users:
+            node = self._node(key, seen)
+            self._activity[node] = activity
+            self._transactions[node] = self._cluster_transactions[node] = sum(entry[1] for entry in activity)
+            self._frauds[node] = self._cluster_frauds[node] = sum(entry[2] for entry in activity)
+        for user_key, identifier_key, seen in live_edges:
+            # A live edge's user is live too (it was seen with the edge)
+            user = self._index[user_key]
+            identifier = self._index.get(identifier_key)
+            if identifier is None:
+                identifier = self._node(identifier_key, seen)
+            self._last_seen[identifier] = max(self._last_seen[identifier], seen)
+            self._edges[(user, identifier)] = seen
+            self._union(user, identifier)
+
+        self._last_rebuild = now
+        self.rebuilds += 1
+        logger.info(f"Link graph rebuilt: {n_edges - len(self._edges)} edges expired, {len(self._edges)} kept")
+
+    def features(self, user_id):
+        """Cluster size (users), transactions and fraud rate for the user's cluster"""
+        with self._lock:
+            node = self._index.get(('userId', str(user_id)))
+            if node is None:
+                return {'clusterSize': 0, 'clusterTransactions': 0, 'clusterFraudRate': 0.0}
+            root = self._find(node)
+            transactions = self._cluster_transactions[root]
+            return {
+                'clusterSize': self._cluster_users[root],
+                'clusterTransactions': transactions,
+                'clusterFraudRate': round(self._cluster_frauds[root] / transactions, 4) if transactions else 0.0
+            }
+
+    def _describe(self, root, members, limit):
+        users = [value for field, value in members if field == 'userId']
+        identifiers = [{'field': field, 'value': value} for field, value in members if field != 'userId']
+        transactions = self._cluster_transactions[root]
+        return {
+            'size': self._cluster_users[root],
+            'transactions': transactions,
+            'frauds': self._cluster_frauds[root],
+            'fraudRate': round(self._cluster_frauds[root] / transactions, 4) if transactions else 0.0,
+            'identifierCount': len(identifiers),
+            'users': users[:limit],
+            'identifiers': identifiers[:limit]
+        }
+
+    def cluster(self, user_id, limit=100):
+        """The user's cluster with (up to limit) member users and identifiers, or None"""
+        with self._lock:
+            node = self._index.get(('userId', str(user_id)))
+            if node is None:
+                return None
+            root = self._find(node)
+            members = [key for n, key in enumerate(self._keys) if self._find(n) == root]
+            return self._describe(root, members, limit)
+
+    def top_clusters(self, n=20, min_size=2, limit=20):
+        """Largest clusters of at least min_size users"""
+        with self._lock:
+            roots = [node for node, parent in enumerate(self._parent)
+                     if parent == node and self._cluster_users[node] >= min_size]
+            roots = sorted(roots, key=lambda root: (-self._cluster_users[root], -self._cluster_frauds[root]))[:n]
+            members = {root: [] for root in roots}
+            for node, key in enumerate(self._keys):
+                root = self._find(node)
+                if root in members:
+                    members[root].append(key)
+            return [self._describe(root, members[root], limit) for root in roots]
+
+    def stats(self):
+        """Graph size and expiry settings"""
+        with self._lock:
+            users = sum(1 for key in self._keys if key[0] == 'userId')
+            return {
+                'users': users,
+                'identifiers': len(self._keys) - users,
+                'edges': len(self._edges),
+                'clusters': sum(1 for node, parent in enumerate(self._parent)
+                                if parent == node and self._cluster_users[node] > 1),
+                'windowSeconds': self.window_seconds,
+                'maxEdges': self.max_edges,
+                'rebuilds': self.rebuilds
+            }
@@ -0,0 +1,191 @@
+"""
+On-demand request profiling and memory snapshots for the Flask app
+"""
+
+import cProfile
+import io
+import pstats
+import random
+import threading
+import tracemalloc
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Keys accepted by pstats.Stats.sort_stats
+SORT_KEYS = tuple(sorted(pstats.Stats.sort_arg_dict_default))
+
+
+class RequestProfiler:
+    """Samples cProfile over the next N requests of one route
+
+    While nothing is armed, the request hooks return after a single attribute
+    check, so normal traffic does not pay for profiling.
+    """
+
+    def __init__(self):
+        self.active = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.route = None
+        self.remaining = 0
+        self.sample_rate = 1.0
+        self.profiled = 0
+        self._stats = None
+
+    def arm(self, route, n_requests, sample_rate=1.0):
+        """Profile the next n_requests requests whose rule or path matches route"""
+        with self._lock:
+            self.route = route
+            self.remaining = n_requests
+            self.sample_rate = sample_rate
+            self.profiled = 0
+            self._stats = None
+            self.active = n_requests > 0
+
+    def disarm(self):
+        """Stop profiling and drop collected stats"""
+        with self._lock:
+            self.active = False
+            self.route = None
+            self.remaining = 0
+            self.profiled = 0
+            self._stats = None
+
+    def before_request(self, request):
+        """Flask before_request hook"""
+        if not self.active:
+            return
+
+        rule = request.url_rule.rule if request.url_rule is not None else None
+        if self.route not in (rule, request.path):
+            return
+
+        with self._lock:
+            if self.remaining <= 0 or random.random() >= self.sample_rate:
+                return
+            self.remaining -= 1
+            if self.remaining == 0:
+                self.active = False
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already running in this thread
+            return
+        self._local.profile = profile
+
+    def teardown_request(self, exc=None):
+        """Flask teardown_request hook (runs even if the view raised)"""
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            return
+
+        profile.disable()
+        self._local.profile = None
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile, stream=io.StringIO())
+            else:
+                self._stats.add(profile)
+            self.profiled += 1
+
+    def status(self):
+        """Current arming state"""
+        return {
+            'active': self.active,
+            'route': self.route,
+            'remaining': self.remaining,
+            'sampleRate': self.sample_rate,
+            'profiledRequests': self.profiled
+        }
+
+    def report(self, top=30, sort='cumulative'):
+        """Aggregated stats for the profiled requests, heaviest functions first"""
+        with self._lock:
+            if self._stats is None:
+                return []
+            self._stats.sort_stats(sort)
+            rows = []
+            for func in self._stats.fcn_list[:top]:
+                primitive_calls, total_calls, tottime, cumtime, _ = self._stats.stats[func]
+                filename, lineno, name = func
+                rows.append({
+                    'function': f"{filename}:{lineno}({name})",
+                    'ncalls': total_calls,
+                    'primitiveCalls': primitive_calls,
+                    'tottime': round(tottime, 6),
+                    'cumtime': round(cumtime, 6),
+                    'cumtimePerRequest': round(cumtime / self.profiled, 6) if self.profiled else None
+                })
+            return rows
+
+
+class MemoryTracker:
+    """tracemalloc snapshots and diffs against a baseline
+
+    tracemalloc slows every allocation while it is tracing, so it is only
+    started on demand and should be stopped once the investigation is done.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.baseline = None
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def start(self, frames=1):
+        """Start tracing and take a baseline snapshot"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+            self.baseline = tracemalloc.take_snapshot()
+
+    def stop(self):
+        """Stop tracing and drop the baseline"""
+        with self._lock:
+            tracemalloc.stop()
+            self.baseline = None
+
+    def snapshot(self):
+        """Replace the baseline with a fresh snapshot"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                raise RuntimeError("Memory tracing is not started")
+            self.baseline = tracemalloc.take_snapshot()
+
+    def diff(self, top=20, key_type='lineno'):
+        """Largest allocation changes since the baseline"""
+        with self._lock:
+            if not tracemalloc.is_tracing() or self.baseline is None:
+                raise RuntimeError("Memory tracing is not started")
+            current = tracemalloc.take_snapshot()
+            # Hide the diagnostics' own allocations
+            filters = [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, cProfile.__file__),
+                tracemalloc.Filter(False, pstats.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ]
+            changes = current.filter_traces(filters).compare_to(
+                self.baseline.filter_traces(filters), key_type
+            )
+
+        traced, peak = tracemalloc.get_traced_memory()
+        return {
+            'tracedBytes': traced,
+            'peakTracedBytes': peak,
+            'top': [
+                {
+                    'location': str(stat.traceback),
+                    'sizeBytes': stat.size,
+                    'sizeDiffBytes': stat.size_diff,
+                    'count': stat.count,
+                    'countDiff': stat.count_diff
+                }
+                for stat in changes[:top]
+            ]
+        }
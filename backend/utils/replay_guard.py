@@ -0,0 +1,123 @@
+"""
+Replay and duplicate-transaction detection for client-supplied transaction IDs
+"""
+
+import threading
+import time
+import logging
+
+import numpy as np
+
+from utils.sketches import RotatingBloomFilter
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayGuard:
+    """Remembers recently seen transaction IDs and finds their stored rows
+
+    A rotating Bloom filter answers the common "never seen" case without
+    touching the store; only IDs it reports as possibly seen are confirmed
+    against the transaction store, so false positives never drop a real
+    transaction. IDs are forgotten once they age out of the filter.
+
+    A request holds its IDs from the duplicate check until they are stored
+    (reserve/release), so concurrent requests with the same ID are handled
+    one after the other and only the first is stored.
+    """
+
+    def __init__(self, store, window_seconds=86400, capacity=1000000, error_rate=0.001):
+        self.store = store
+        self.window_seconds = window_seconds
+        self.bloom = RotatingBloomFilter(capacity, error_rate, rotation_seconds=window_seconds)
+        self._lock = threading.Condition()
+        self._reserved = set()
+        self.checked = 0
+        self.bloom_hits = 0
+        self.duplicates = 0
+
+    def lookup(self, txn_id):
+        """Stored row of a previously seen transaction ID, or -1"""
+        return int(self.lookup_many([txn_id])[0])
+
+    def lookup_many(self, txn_ids):
+        """Stored row of each previously seen transaction ID, or -1"""
+        txn_ids = [str(txn_id) for txn_id in txn_ids]
+        with self._lock:
+            maybe_seen = self.bloom.contains_many(txn_ids)
+        rows = np.full(len(txn_ids), -1, dtype=np.int64)
+        if maybe_seen.any():
+            # Exact check against the store for the (few) Bloom hits only
+            rows[maybe_seen] = self.store.find_client_ids([txn_ids[i] for i in np.flatnonzero(maybe_seen)])
+
+        with self._lock:
+            self.checked += len(txn_ids)
+            self.bloom_hits += int(maybe_seen.sum())
+            self.duplicates += int((rows >= 0).sum())
+        return rows
+
+    def reserve(self, txn_id):
+        """Stored row of a previously seen transaction ID, or -1 with the ID now held by the caller"""
+        return int(self.reserve_many([txn_id])[0])
+
+    def reserve_many(self, txn_ids):
+        """Stored row of each transaction ID, holding the unseen ones (-1) until release_many
+
+        Waits while another request holds any of the IDs, so its check and
+        record act as one step for everyone else.
+        """
+        txn_ids = [str(txn_id) for txn_id in txn_ids]
+        wanted = set(txn_ids)
+        with self._lock:
+            while not self._reserved.isdisjoint(wanted):
+                self._lock.wait()
+            self._reserved.update(wanted)
+        try:
+            rows = self.lookup_many(txn_ids)
+        except BaseException:
+            self.release_many(wanted)
+            raise
+        self.release_many({txn_id for txn_id, row in zip(txn_ids, rows) if row >= 0})
+        return rows
+
+    def release(self, txn_id):
+        """Let other requests check a reserved ID again (after it was remembered, or abandoned)"""
+        self.release_many([txn_id])
+
+    def release_many(self, txn_ids):
+        """Release reserved transaction IDs"""
+        with self._lock:
+            self._reserved.difference_update(str(txn_id) for txn_id in txn_ids)
+            self._lock.notify_all()
+
+    def remember_stored(self):
+        """Remember the client IDs first stored within the window (after a restore)"""
+        rows = self.store.client_id_rows()
+        if not len(rows):
+            return 0
+        timestamps = self.store.column('timestamp')[rows]
+        recent = np.flatnonzero(timestamps >= int((time.time() - self.window_seconds) * 1e6))
+        # Oldest first, so any generations filled up by the load are the first to expire
+        recent = recent[np.argsort(timestamps[recent], kind='stable')]
+        values = self.store.id_pool.values
+        self.remember_many(values[code] for code in recent)
+        return len(recent)
+
+    def remember(self, txn_id):
+        """Record a transaction ID as seen"""
+        self.remember_many([txn_id])
+
+    def remember_many(self, txn_ids):
+        """Record transaction IDs as seen"""
+        with self._lock:
+            self.bloom.add_many(str(txn_id) for txn_id in txn_ids)
+
+    def stats(self):
+        """Lookup counters"""
+        with self._lock:
+            return {
+                'checked': self.checked,
+                'bloomHits': self.bloom_hits,
+                'duplicates': self.duplicates,
+                'falsePositives': self.bloom_hits - self.duplicates
+            }
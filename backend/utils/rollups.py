@@ -0,0 +1,223 @@
+"""
+Per-minute and per-hour rollups of scored transactions for dashboard charts
+"""
+
+import math
+import threading
+import time
+from datetime import datetime
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RESOLUTIONS = {'minute': 60, 'hour': 3600}
+# Buckets kept per resolution: one day of minutes, thirty days of hours
+DEFAULT_RETENTION = {'minute': 24 * 60, 'hour': 30 * 24}
+
+
+class _RollupTable:
+    """Ring of fixed-width time buckets; slot = bucket id % n_buckets
+
+    A slot is cleared when a newer bucket id lands on it, so old buckets
+    expire without any sweeping and memory stays fixed.
+    """
+
+    def __init__(self, bucket_seconds, n_buckets):
+        self.bucket_seconds = bucket_seconds
+        self.n_buckets = n_buckets
+        self.bucket_ids = np.full(n_buckets, -1, dtype=np.int64)
+        self.counts = np.zeros(n_buckets, dtype=np.int64)
+        self.anomalies = np.zeros(n_buckets, dtype=np.int64)
+        self.frauds = np.zeros(n_buckets, dtype=np.int64)
+        self.risk_sums = np.zeros(n_buckets, dtype=np.float64)
+        self.anomaly_score_sums = np.zeros(n_buckets, dtype=np.float64)
+        self.category_counts = np.zeros((n_buckets, 0), dtype=np.int64)
+
+    def _claim(self, bucket_id):
+        """Slot for bucket_id, clearing it if it held an older bucket; None if bucket_id expired"""
+        slot = bucket_id % self.n_buckets
+        current = self.bucket_ids[slot]
+        if current > bucket_id:
+            return None
+        if current < bucket_id:
+            self.bucket_ids[slot] = bucket_id
+            self.counts[slot] = self.anomalies[slot] = self.frauds[slot] = 0
+            self.risk_sums[slot] = self.anomaly_score_sums[slot] = 0.0
+            self.category_counts[slot] = 0
+        return slot
+
+    def ensure_categories(self, n_categories):
+        missing = n_categories - self.category_counts.shape[1]
+        if missing > 0:
+            self.category_counts = np.pad(self.category_counts, ((0, 0), (0, missing)))
+
+    def add(self, bucket_id, n, category_counts, anomalies, frauds, risk_sum, anomaly_score_sum):
+        """Add pre-summed values to one bucket"""
+        slot = self._claim(bucket_id)
+        if slot is None:
+            return
+        self.counts[slot] += n
+        self.category_counts[slot, :len(category_counts)] += category_counts
+        self.anomalies[slot] += anomalies
+        self.frauds[slot] += frauds
+        self.risk_sums[slot] += risk_sum
+        self.anomaly_score_sums[slot] += anomaly_score_sum
+
+    def window(self, first_id, last_id):
+        """Dense per-bucket arrays for bucket ids first_id..last_id (zeros where empty)"""
+        ids = np.arange(first_id, last_id + 1, dtype=np.int64)
+        slots = ids % self.n_buckets
+        valid = self.bucket_ids[slots] == ids
+        values = {
+            'count': self.counts, 'anomalies': self.anomalies, 'frauds': self.frauds,
+            'riskSum': self.risk_sums, 'anomalyScoreSum': self.anomaly_score_sums
+        }
+        result = {name: np.where(valid, column[slots], 0) for name, column in values.items()}
+        result['categories'] = np.where(valid[:, None], self.category_counts[slots], 0)
+        return ids, result
+
+
+class TimeSeriesRollups:
+    """Counts, risk-category mix, anomaly counts and score sums per minute and hour
+
+    Each scored transaction (or batch) adds to the current bucket of every
+    resolution, so a chart query reads O(buckets) pre-aggregated values
+    instead of scanning transactions. Risk categories are tracked by name as
+    they appear, so rule changes that add categories need no migration.
+    """
+
+    def __init__(self, retention=None):
+        retention = {**DEFAULT_RETENTION, **(retention or {})}
+        self.tables = {name: _RollupTable(seconds, retention[name]) for name, seconds in RESOLUTIONS.items()}
+        self.categories = []
+        self._category_index = {}
+        self._lock = threading.Lock()
+
+    def _category_code(self, category):
+        code = self._category_index.get(category)
+        if code is None:
+            code = self._category_index[category] = len(self.categories)
+            self.categories.append(category)
+            for table in self.tables.values():
+                table.ensure_categories(len(self.categories))
+        return code
+
+    def record(self, risk_score, risk_category, is_anomalous=False, anomaly_score=0.0, fraud=0, now=None):
+        """Add one scored transaction to the current buckets"""
+        now = time.time() if now is None else now
+        with self._lock:
+            code = self._category_code(str(risk_category))
+            category_counts = np.zeros(len(self.categories), dtype=np.int64)
+            category_counts[code] = 1
+            for table in self.tables.values():
+                table.add(int(now // table.bucket_seconds), 1, category_counts,
+                          int(bool(is_anomalous)), int(fraud), float(risk_score), float(anomaly_score))
+
+    def record_batch(self, risk_scores, risk_categories, is_anomalous=None, anomaly_scores=None,
+                     frauds=None, now=None, timestamps=None):
+        """Add a batch scored together, summed once per column per bucket
+
+        With timestamps (epoch seconds per row) each row goes to the bucket
+        of its own time; otherwise the whole batch goes to the current ones.
+        Rows stamped after now are counted in the current buckets.
+        """
+        now = time.time() if now is None else now
+        n = len(risk_scores)
+        with self._lock:
+            categories, inverse = np.unique(np.asarray(risk_categories, dtype=object).astype(str),
+                                            return_inverse=True)
+            codes = np.array([self._category_code(str(category)) for category in categories], dtype=np.int64)
+            columns = {
+                'anomalies': np.asarray(is_anomalous, dtype=bool) if is_anomalous is not None else None,
+                'frauds': np.asarray(frauds) != 0 if frauds is not None else None,
+                'risk': np.asarray(risk_scores, dtype=np.float64),
+                'anomaly_score': np.asarray(anomaly_scores, dtype=np.float64) if anomaly_scores is not None else None
+            }
+
+            if timestamps is None:
+                sums = {name: (values.sum() if values is not None else 0) for name, values in columns.items()}
+                category_counts = np.bincount(codes[inverse], minlength=len(self.categories))
+                for table in self.tables.values():
+                    table.add(int(now // table.bucket_seconds), n, category_counts, int(sums['anomalies']),
+                              int(sums['frauds']), float(sums['risk']), float(sums['anomaly_score']))
+                return
+
+            timestamps = np.asarray(timestamps, dtype=np.float64)
+            # A future bucket would claim a ring slot ahead of time and then block the live records
+            future = timestamps > now
+            if future.any():
+                logger.warning(f"{int(future.sum())} of {n} rows are stamped in the future; "
+                               f"counting them in the current buckets")
+                timestamps = np.minimum(timestamps, now)
+            for table in self.tables.values():
+                bucket_ids = (timestamps // table.bucket_seconds).astype(np.int64)
+                # Rows already older than the ring's retention are not kept
+                oldest = int(now // table.bucket_seconds) - table.n_buckets + 1
+                buckets, group = np.unique(bucket_ids, return_inverse=True)
+                sums = {name: np.bincount(group, weights=values, minlength=len(buckets)) if values is not None
+                        else np.zeros(len(buckets)) for name, values in columns.items()}
+                counts = np.bincount(group, minlength=len(buckets))
+                category_counts = np.zeros((len(buckets), len(self.categories)), dtype=np.int64)
+                np.add.at(category_counts, (group, codes[inverse]), 1)
+                for i, bucket_id in enumerate(buckets):
+                    if bucket_id >= oldest:
+                        table.add(int(bucket_id), int(counts[i]), category_counts[i], int(sums['anomalies'][i]),
+                                  int(sums['frauds'][i]), float(sums['risk'][i]), float(sums['anomaly_score'][i]))
+
+    def series(self, resolution=None, start=None, end=None, max_points=120):
+        """Chart points between start and end (epoch seconds), merged down to at most max_points
+
+        Without a resolution the finest one whose retention covers the range
+        is used. Defaults to the last hour.
+        """
+        end = time.time() if end is None else end
+        start = end - 3600 if start is None else start
+        if resolution is None:
+            resolution = next((name for name, table in self.tables.items()
+                               if (end - start) <= table.bucket_seconds * table.n_buckets), 'hour')
+        table = self.tables[resolution]
+
+        first_id = int(start // table.bucket_seconds)
+        last_id = int(end // table.bucket_seconds)
+        # Only buckets still held by the ring
+        first_id = max(first_id, last_id - table.n_buckets + 1)
+
+        with self._lock:
+            ids, columns = table.window(first_id, last_id)
+            categories = list(self.categories)
+
+        # Downsample by summing runs of adjacent buckets, aligned to multiples of factor
+        factor = max(1, math.ceil(len(ids) / max(1, max_points)))
+        while ids[-1] // factor - ids[0] // factor + 1 > max_points:
+            factor += 1
+        groups = ids // factor - ids[0] // factor
+        n_groups = int(groups[-1]) + 1
+        merged = {name: np.bincount(groups, weights=column, minlength=n_groups)
+                  for name, column in columns.items() if name != 'categories'}
+        merged_categories = np.zeros((n_groups, columns['categories'].shape[1]))
+        np.add.at(merged_categories, groups, columns['categories'])
+
+        points = []
+        for g in range(n_groups):
+            count = int(merged['count'][g])
+            bucket_start = (ids[0] // factor + g) * factor * table.bucket_seconds
+            points.append({
+                'timestamp': datetime.fromtimestamp(bucket_start).isoformat(),
+                'count': count,
+                'riskCategories': {category: int(merged_categories[g, j]) for j, category in enumerate(categories)},
+                'anomalies': int(merged['anomalies'][g]),
+                'frauds': int(merged['frauds'][g]),
+                'riskScoreSum': round(float(merged['riskSum'][g]), 4),
+                'avgRiskScore': round(float(merged['riskSum'][g]) / count, 4) if count else None,
+                'anomalyScoreSum': round(float(merged['anomalyScoreSum'][g]), 4),
+                'fraudRate': round(int(merged['frauds'][g]) / count, 4) if count else None
+            })
+
+        return {
+            'resolution': resolution,
+            'bucketSeconds': table.bucket_seconds * factor,
+            'downsampleFactor': factor,
+            'points': points
+        }
@@ -0,0 +1,188 @@
+"""
+Configurable decision rules for combining model outputs
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                  'config', 'decision_rules.json')
+
+
+class CompiledRules:
+    """Immutable, pre-compiled form of a rules config
+
+    Risk bands become a sorted edge array for ``np.searchsorted``, decision
+    rules become condition tuples, and recommendations become a lookup table
+    indexed by ``band * 2 + is_anomalous``.
+    """
+
+    def __init__(self, config):
+        bands = config['risk_bands']
+        if not bands or 'below' in bands[-1]:
+            raise ValueError("The last risk band must have no 'below' bound")
+        self.band_edges = np.array([band['below'] for band in bands[:-1]], dtype=np.float64)
+        if np.any(np.diff(self.band_edges) <= 0):
+            raise ValueError("Risk band bounds must be strictly increasing")
+        self.band_edge_list = [float(edge) for edge in self.band_edges]
+        self.categories = [band['category'] for band in bands]
+        self.category_array = np.array(self.categories, dtype=object)
+
+        # Each decision rule: (label, risk_above, risk_below, anomalous); None means "any"
+        self.decision_rules = []
+        for rule in config['decisions']:
+            unknown = set(rule) - {'decision', 'risk_above', 'risk_below', 'anomalous'}
+            if unknown:
+                raise ValueError(f"Unknown decision rule keys: {', '.join(sorted(unknown))}")
+            self.decision_rules.append((
+                rule['decision'], rule.get('risk_above'), rule.get('risk_below'), rule.get('anomalous')
+            ))
+        if not self.decision_rules or any(v is not None for v in self.decision_rules[-1][1:]):
+            raise ValueError("The last decision rule must be an unconditional default")
+        self.decisions = [rule[0] for rule in self.decision_rules]
+        self.decision_array = np.array(self.decisions, dtype=object)
+
+        recommendations = config.get('recommendations', {})
+        by_category = recommendations.get('risk_category', {})
+        anomalous = recommendations.get('anomalous', [])
+        default = recommendations.get('default', [])
+        self.recommendation_table = []
+        for category in self.categories:
+            for is_anomalous in (False, True):
+                items = list(by_category.get(category, []))
+                if is_anomalous:
+                    items.extend(anomalous)
+                self.recommendation_table.append(tuple(items) if items else tuple(default))
+
+    # Scalar path for single requests
+
+    def risk_category(self, risk_score):
+        """Risk category for a single score"""
+        return self.categories[bisect.bisect_right(self.band_edge_list, risk_score)]
+
+    def combined_decision(self, risk_score, is_anomalous):
+        """First matching decision rule for a single transaction"""
+        for decision, risk_above, risk_below, anomalous in self.decision_rules:
+            if risk_above is not None and not risk_score > risk_above:
+                continue
+            if risk_below is not None and not risk_score < risk_below:
+                continue
+            if anomalous is not None and bool(is_anomalous) != anomalous:
+                continue
+            return decision
+        return self.decisions[-1]
+
+    def recommendations(self, risk_category, is_anomalous):
+        """Recommendation list for a single transaction"""
+        band = self.categories.index(risk_category) if risk_category in self.categories else 0
+        return list(self.recommendation_table[band * 2 + bool(is_anomalous)])
+
+    # Vectorized path for bulk jobs
+
+    def risk_band_codes(self, risk_scores):
+        """Index into categories for each score"""
+        return np.searchsorted(self.band_edges, np.asarray(risk_scores, dtype=np.float64), side='right')
+
+    def risk_categories(self, risk_scores):
+        """Risk category for each score"""
+        return self.category_array[self.risk_band_codes(risk_scores)]
+
+    def decision_codes(self, risk_scores, is_anomalous):
+        """Index into decisions for each transaction (first matching rule wins)"""
+        risk_scores = np.asarray(risk_scores, dtype=np.float64)
+        anomalous = np.broadcast_to(np.asarray(is_anomalous, dtype=bool), risk_scores.shape)
+
+        conditions = []
+        for _, risk_above, risk_below, rule_anomalous in self.decision_rules[:-1]:
+            mask = np.ones(risk_scores.shape, dtype=bool)
+            if risk_above is not None:
+                mask &= risk_scores > risk_above
+            if risk_below is not None:
+                mask &= risk_scores < risk_below
+            if rule_anomalous is not None:
+                mask &= anomalous == rule_anomalous
+            conditions.append(mask)
+
+        return np.select(conditions, np.arange(len(conditions)), default=len(conditions))
+
+    def combined_decisions(self, risk_scores, is_anomalous):
+        """Decision label for each transaction"""
+        return self.decision_array[self.decision_codes(risk_scores, is_anomalous)]
+
+    def recommendation_codes(self, risk_scores, is_anomalous):
+        """Index into recommendation_table for each transaction"""
+        anomalous = np.asarray(is_anomalous, dtype=bool)
+        return self.risk_band_codes(risk_scores) * 2 + anomalous
+
+
+class DecisionRulesEngine:
+    """Loads decision rules from a JSON config and hot-reloads them on change
+
+    Callers get the current ``CompiledRules`` through ``rules``; a reload
+    compiles the new config first and swaps it in whole, so a bad edit is
+    logged and the previous rules stay active.
+    """
+
+    def __init__(self, path=DEFAULT_RULES_PATH, check_interval=2.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._last_check = 0.0
+        self._rules = None
+        self.reload()
+
+    @property
+    def rules(self):
+        """Current compiled rules, reloading first if the file has changed"""
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            try:
+                if os.path.getmtime(self.path) != self._mtime:
+                    self.reload()
+            except OSError as e:
+                logger.warning(f"Could not check decision rules file: {e}")
+        return self._rules
+
+    def reload(self):
+        """Load and compile the config file; keeps the old rules on error"""
+        with self._lock:
+            try:
+                # Remember the attempted version so a broken file is only reported once
+                self._mtime = os.path.getmtime(self.path)
+                with open(self.path) as f:
+                    compiled = CompiledRules(json.load(f))
+                self._rules = compiled
+                logger.info(f"Loaded decision rules from {self.path}")
+                return True
+
+            except Exception as e:
+                logger.error(f"Error loading decision rules from {self.path}: {e}")
+                if self._rules is None:
+                    raise
+                return False
+
+    def describe(self):
+        """Current thresholds and rules in JSON-ready form"""
+        rules = self.rules
+        bounds = [float(edge) for edge in rules.band_edges] + [None]
+        return {
+            'path': self.path,
+            'riskBands': [
+                {'category': category, 'below': bound}
+                for category, bound in zip(rules.categories, bounds)
+            ],
+            'decisions': [
+                {'decision': d, 'riskAbove': above, 'riskBelow': below, 'anomalous': anomalous}
+                for d, above, below, anomalous in rules.decision_rules
+            ]
+        }
@@ -0,0 +1,117 @@
+"""
+Live risk and anomaly score distributions, overall and per transaction type/location
+"""
+
+import threading
+import logging
+
+import numpy as np
+import pandas as pd
+
+from utils.sketches import KLLSketch
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('risk', 'anomaly')
+DIMENSIONS = ('transactionType', 'location')
+DEFAULT_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+class ScoreDistributions:
+    """One KLL sketch per (metric, dimension, value), plus an overall one per metric
+
+    Each transaction updates at most three sketches per metric, so the cost
+    per transaction is constant. Alerting thresholds for a target alert rate
+    are read straight off the sketches: high risk scores alert, low anomaly
+    scores (Isolation Forest convention) alert.
+    """
+
+    def __init__(self, k=200, min_samples=500):
+        self.k = k
+        self.min_samples = min_samples
+        self._sketches = {}
+        self._lock = threading.Lock()
+
+    def _sketch(self, metric, dimension=None, value=None):
+        key = (metric, dimension, value)
+        sketch = self._sketches.get(key)
+        if sketch is None:
+            sketch = self._sketches[key] = KLLSketch(self.k)
+        return sketch
+
+    def record(self, risk_score=None, anomaly_score=None, transaction_type=None, location=None):
+        """Add one transaction's scores"""
+        keys = {'transactionType': transaction_type, 'location': location}
+        with self._lock:
+            for metric, score in (('risk', risk_score), ('anomaly', anomaly_score)):
+                if score is None:
+                    continue
+                self._sketch(metric).add(score)
+                for dimension, value in keys.items():
+                    if value is not None:
+                        self._sketch(metric, dimension, str(value)).add(score)
+
+    def record_batch(self, risk_scores=None, anomaly_scores=None, transaction_types=None, locations=None):
+        """Add a batch of transactions' scores, grouped so each sketch gets one update"""
+        keys = {'transactionType': transaction_types, 'location': locations}
+        with self._lock:
+            for metric, scores in (('risk', risk_scores), ('anomaly', anomaly_scores)):
+                if scores is None:
+                    continue
+                scores = np.asarray(scores, dtype=np.float64)
+                self._sketch(metric).add_many(scores)
+                for dimension, values in keys.items():
+                    if values is None:
+                        continue
+                    # Rows without a value (None/NaN) only go to the overall sketch
+                    groups = pd.Series(scores).groupby(pd.Series(values, dtype=object).values)
+                    for value, group in groups:
+                        self._sketch(metric, dimension, str(value)).add_many(group.values)
+
+    def percentiles(self, metric, dimension=None, value=None, quantiles=DEFAULT_QUANTILES):
+        """{'count', 'min', 'max', 'p50', ...} for one sketch, or None if it has no data"""
+        with self._lock:
+            sketch = self._sketches.get((metric, dimension, value))
+            if sketch is None or sketch.n == 0:
+                return None
+            estimates = sketch.quantiles(quantiles)
+            result = {'count': sketch.n, 'min': round(sketch.min, 4), 'max': round(sketch.max, 4)}
+        for q, estimate in zip(quantiles, estimates):
+            result[f"p{q * 100:g}"] = round(estimate, 4)
+        return result
+
+    def threshold(self, metric, alert_rate, dimension=None, value=None):
+        """Score cut-off that flags about alert_rate of transactions
+
+        Falls back to the overall sketch when the keyed one has fewer than
+        min_samples values, and returns None when that is still too few.
+        """
+        with self._lock:
+            sketch = self._sketches.get((metric, dimension, value))
+            if sketch is None or sketch.n < self.min_samples:
+                sketch = self._sketches.get((metric, None, None))
+            if sketch is None or sketch.n < self.min_samples:
+                return None
+            # Risk alerts above the cut-off, anomaly alerts below it
+            q = 1 - alert_rate if metric == 'risk' else alert_rate
+            return sketch.quantile(q)
+
+    def summary(self, quantiles=DEFAULT_QUANTILES, alert_rate=None):
+        """Percentiles (and optional alert-rate thresholds) for every tracked key"""
+        with self._lock:
+            keys = sorted(self._sketches, key=lambda key: (key[0], key[1] or '', key[2] or ''))
+
+        result = {}
+        for metric, dimension, value in keys:
+            entry = self.percentiles(metric, dimension, value, quantiles)
+            if entry is None:
+                continue
+            if alert_rate is not None:
+                threshold = self.threshold(metric, alert_rate, dimension, value)
+                entry['threshold'] = round(threshold, 4) if threshold is not None else None
+            section = result.setdefault(metric, {})
+            if dimension is None:
+                section['overall'] = entry
+            else:
+                section.setdefault(dimension, {})[value] = entry
+        return result
@@ -0,0 +1,155 @@
+"""
+Shadow scoring of live traffic with a challenger model
+"""
+
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ShadowScorer:
+    """Scores transactions with a challenger model off the request path
+
+    Score pairs are kept in a fixed-size ring buffer of NumPy arrays so memory
+    stays constant however long the shadow runs. When the workers fall behind,
+    new submissions are dropped (and counted) rather than queued without bound.
+    Risk bands and decisions come from the rules engine's current rules each
+    time statistics are computed, so they follow rule reloads.
+    """
+
+    def __init__(self, challenger_model, rules_engine, max_workers=2, buffer_size=100000,
+                 max_pending=1000):
+        self.challenger_model = challenger_model
+        self.rules_engine = rules_engine
+        self.buffer_size = buffer_size
+        self.max_pending = max_pending
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='shadow')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._next = 0
+        self._count = 0
+        self._dropped = 0
+        self._errors = 0
+
+        self.champion_scores = np.zeros(buffer_size, dtype=np.float32)
+        self.challenger_scores = np.zeros(buffer_size, dtype=np.float32)
+        self.latencies_ms = np.zeros(buffer_size, dtype=np.float32)
+
+    def submit(self, processed_data, champion_score):
+        """Queue a transaction (or a feature matrix with an array of champion
+        scores) for challenger scoring; never blocks the caller"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._dropped += 1
+                return False
+            self._pending += 1
+
+        try:
+            self._executor.submit(self._score, processed_data, champion_score)
+        except RuntimeError:
+            # Executor already shut down
+            with self._lock:
+                self._pending -= 1
+                self._dropped += 1
+            return False
+        return True
+
+    def stats(self):
+        """Agreement and latency statistics over the buffered score pairs"""
+        with self._lock:
+            n = min(self._count, self.buffer_size)
+            champion = self.champion_scores[:n].copy()
+            challenger = self.challenger_scores[:n].copy()
+            latencies = self.latencies_ms[:n].copy()
+            counters = {
+                'scored': self._count,
+                'dropped': self._dropped,
+                'errors': self._errors,
+                'pending': self._pending
+            }
+
+        result = dict(counters, buffered=n)
+        if n == 0:
+            return result
+
+        rules = self.rules_engine.rules
+        champion_bands = rules.risk_band_codes(champion)
+        challenger_bands = rules.risk_band_codes(challenger)
+        # Decisions on the score alone (no behavior flag); anything but the default rule is a flag
+        champion_decisions = rules.decision_codes(champion, False)
+        challenger_decisions = rules.decision_codes(challenger, False)
+        default_decision = len(rules.decisions) - 1
+        champion_flags = champion_decisions != default_decision
+        challenger_flags = challenger_decisions != default_decision
+        diff = challenger - champion
+
+        correlation = None
+        if n > 1 and np.std(champion) > 0 and np.std(challenger) > 0:
+            correlation = round(float(np.corrcoef(champion, challenger)[0, 1]), 4)
+
+        result.update({
+            'riskCategoryAgreement': round(float(np.mean(champion_bands == challenger_bands)), 4),
+            'decisionAgreement': round(float(np.mean(champion_decisions == challenger_decisions)), 4),
+            'championFlagRate': round(float(np.mean(champion_flags)), 4),
+            'challengerFlagRate': round(float(np.mean(challenger_flags)), 4),
+            'meanScoreDiff': round(float(np.mean(diff)), 4),
+            'meanAbsScoreDiff': round(float(np.mean(np.abs(diff))), 4),
+            'scoreCorrelation': correlation,
+            'latencyMs': {
+                f'p{int(q)}': round(float(v), 3)
+                for q, v in zip((50, 95, 99), np.percentile(latencies, [50, 95, 99]))
+            }
+        })
+        return result
+
+    def recent_pairs(self, limit=100):
+        """Most recent (champion, challenger, latency) triples, newest first"""
+        with self._lock:
+            n = min(self._count, self.buffer_size, limit)
+            rows = (self._next - 1 - np.arange(n)) % self.buffer_size
+            return [
+                {
+                    'championScore': round(float(self.champion_scores[i]), 4),
+                    'challengerScore': round(float(self.challenger_scores[i]), 4),
+                    'latencyMs': round(float(self.latencies_ms[i]), 3)
+                }
+                for i in rows
+            ]
+
+    def shutdown(self, wait=True):
+        """Stop the worker threads"""
+        self._executor.shutdown(wait=wait)
+
+    def _score(self, processed_data, champion_score):
+        """Worker: score with the challenger and record the pair"""
+        try:
+            start = time.perf_counter()
+            challenger_scores = np.atleast_1d(self.challenger_model.predict_risk_score(processed_data))
+            champion_scores = np.atleast_1d(champion_score)
+            # Batches record the per-row share of the batch latency
+            latency_ms = (time.perf_counter() - start) * 1000 / len(challenger_scores)
+
+            # Keep only the newest rows if a batch is larger than the buffer
+            n = min(len(challenger_scores), self.buffer_size)
+            with self._lock:
+                rows = (self._next + np.arange(n)) % self.buffer_size
+                self.champion_scores[rows] = champion_scores[-n:]
+                self.challenger_scores[rows] = challenger_scores[-n:]
+                self.latencies_ms[rows] = latency_ms
+                self._next = (self._next + n) % self.buffer_size
+                self._count += len(challenger_scores)
+
+        except Exception as e:
+            logger.error(f"Error in shadow scoring: {e}")
+            with self._lock:
+                self._errors += 1
+
+        finally:
+            with self._lock:
+                self._pending -= 1
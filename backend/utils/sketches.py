@@ -0,0 +1,368 @@
+"""
+Fixed-size probabilistic sketches for streaming features
+"""
+
+import hashlib
+import math
+import time
+
+import numpy as np
+
+
+def hash64(value):
+    """Stable 64-bit hash of a value's string form (same in every process)"""
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'little')
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter with 2**precision one-byte registers
+
+    Uses linear counting for small cardinalities, which keeps estimates
+    practically exact for the handful of values a single user produces.
+    """
+
+    __slots__ = ('precision', 'registers', '_estimate')
+
+    def __init__(self, precision=7):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+        self._estimate = 0
+
+    def add(self, value):
+        """Add a value to the sketch"""
+        h = hash64(value)
+        index = h >> (64 - self.precision)
+        rest_bits = 64 - self.precision
+        rest = h & ((1 << rest_bits) - 1)
+        rank = rest_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            self._estimate = None
+
+    def merge(self, other):
+        """Fold another sketch of the same precision into this one"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLogs with different precision")
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        self._estimate = None
+
+    def count(self):
+        """Estimated number of distinct values added"""
+        if self._estimate is None:
+            m = len(self.registers)
+            zeros = self.registers.count(0)
+            if zeros:
+                # Linear counting is far more accurate in the small range
+                linear = m * math.log(m / zeros)
+                if linear <= 2.5 * m:
+                    self._estimate = int(round(linear))
+                    return self._estimate
+            alpha = 0.7213 / (1 + 1.079 / m)
+            raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+            self._estimate = int(round(raw))
+        return self._estimate
+
+    def __getstate__(self):
+        return (self.precision, bytes(self.registers))
+
+    def __setstate__(self, state):
+        self.precision, registers = state
+        self.registers = bytearray(registers)
+        self._estimate = None
+
+
+class TopK:
+    """Space-Saving heavy-hitter counter keeping at most k values
+
+    Counts are exact until more than k distinct values are seen; after that
+    each evicted slot's count becomes an upper bound (error kept per value).
+    """
+
+    __slots__ = ('k', 'counts', 'errors')
+
+    def __init__(self, k=4):
+        self.k = k
+        self.counts = {}
+        self.errors = {}
+
+    def add(self, value, weight=1):
+        """Count one (or weight) occurrences of value"""
+        if value in self.counts:
+            self.counts[value] += weight
+        elif len(self.counts) < self.k:
+            self.counts[value] = weight
+            self.errors[value] = 0
+        else:
+            # Replace the current minimum; its count becomes the new entry's error
+            victim = min(self.counts, key=self.counts.get)
+            floor = self.counts.pop(victim)
+            self.errors.pop(victim)
+            self.counts[value] = floor + weight
+            self.errors[value] = floor
+
+    def top(self, default=None):
+        """Most frequent value (ties broken by smallest value, like Series.mode)"""
+        if not self.counts:
+            return default
+        return min(self.counts, key=lambda v: (-self.counts[v], str(v)))
+
+    def items(self):
+        """(value, count, error) triples, most frequent first"""
+        return sorted(
+            ((v, c, self.errors[v]) for v, c in self.counts.items()),
+            key=lambda item: (-item[1], str(item[0]))
+        )
+
+    def __getstate__(self):
+        return (self.k, self.counts, self.errors)
+
+    def __setstate__(self, state):
+        self.k, self.counts, self.errors = state
+
+
+class CountMinSketch:
+    """Count-Min sketch: fixed depth x width counters, never undercounts
+
+    With width w and depth d the overestimate is at most ~e/w of the total
+    count with probability 1 - e**-d.
+    """
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self.total = 0
+        self._rows = np.arange(depth)
+
+    def _indexes(self, h):
+        # Kirsch-Mitzenmacher: derive all row hashes from two halves of one hash
+        # (wrapped to 64 bits so add_many's uint64 arithmetic agrees for any width)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return [((h1 + i * h2) & 0xFFFFFFFFFFFFFFFF) % self.width for i in range(self.depth)]
+
+    def add(self, value, weight=1):
+        """Count one (or weight) occurrences of value"""
+        self.table[self._rows, self._indexes(hash64(value))] += weight
+        self.total += weight
+
+    def add_many(self, values):
+        """Count every value in an iterable with one vectorized update"""
+        hashes = np.array([hash64(value) for value in values], dtype=np.uint64)
+        if not len(hashes):
+            return
+        h1 = hashes & np.uint64(0xFFFFFFFF)
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        for i in range(self.depth):
+            columns = ((h1 + np.uint64(i) * h2) % np.uint64(self.width)).astype(np.int64)
+            np.add.at(self.table[i], columns, 1)
+        self.total += len(hashes)
+
+    def estimate(self, value):
+        """Upper-bound estimate of value's count"""
+        return int(self.table[self._rows, self._indexes(hash64(value))].min())
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter sized for a capacity and false-positive rate"""
+
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        self.n_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.n_hashes = max(1, int(round(self.n_bits / capacity * math.log(2))))
+        self.bits = np.zeros((self.n_bits + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _positions(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64).reshape(-1, 1)
+        h1 = hashes & np.uint64(0xFFFFFFFF)
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        steps = np.arange(self.n_hashes, dtype=np.uint64)
+        return ((h1 + steps * h2) % np.uint64(self.n_bits)).astype(np.int64)
+
+    def add_many(self, values):
+        """Insert every value in an iterable"""
+        hashes = [hash64(value) for value in values]
+        if not hashes:
+            return
+        positions = self._positions(hashes).ravel()
+        np.bitwise_or.at(self.bits, positions >> 3, (1 << (positions & 7)).astype(np.uint8))
+        self.count += len(hashes)
+
+    def contains_many(self, values):
+        """Boolean array: True where a value may have been added, False where it surely was not"""
+        hashes = [hash64(value) for value in values]
+        if not hashes:
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(hashes)
+        return ((self.bits[positions >> 3] >> (positions & 7)) & 1).all(axis=1).astype(bool)
+
+    def add(self, value):
+        """Insert one value"""
+        self.add_many([value])
+
+    def __contains__(self, value):
+        return bool(self.contains_many([value])[0])
+
+
+class RotatingBloomFilter:
+    """Bloom filters in time-sliced generations so old keys age out
+
+    Inserts go to the newest generation and lookups check all of them; once
+    the newest is older than rotation_seconds a fresh one is started and the
+    oldest is dropped, so memory stays bounded and keys are remembered for
+    between (generations - 1) and generations rotation periods.
+    """
+
+    def __init__(self, capacity=1000000, error_rate=0.001, rotation_seconds=86400, generations=2):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rotation_seconds = rotation_seconds
+        self.generations = generations
+        self._filters = [(time.time(), BloomFilter(capacity, error_rate))]
+
+    def add_many(self, values, now=None):
+        """Insert every value in an iterable into the newest generation, starting new ones as they fill"""
+        values = list(values)
+        self._rotate(now)
+        while True:
+            bloom = self._filters[-1][1]
+            room = self.capacity - bloom.count
+            bloom.add_many(values[:room])
+            values = values[room:]
+            if not values:
+                break
+            self._rotate(now)
+
+    def contains_many(self, values, now=None):
+        """Boolean array of possible membership across all generations"""
+        self._rotate(now)
+        values = list(values)
+        result = np.zeros(len(values), dtype=bool)
+        for _, bloom in self._filters:
+            result |= bloom.contains_many(values)
+        return result
+
+    def add(self, value, now=None):
+        """Insert one value"""
+        self.add_many([value], now)
+
+    def contains(self, value, now=None):
+        """True if value may have been added within the retention period"""
+        return bool(self.contains_many([value], now)[0])
+
+    def _rotate(self, now):
+        now = time.time() if now is None else now
+        # Also rotate early when the newest generation is full, to hold the error rate
+        started, bloom = self._filters[-1]
+        if now - started >= self.rotation_seconds or bloom.count >= self.capacity:
+            self._filters.append((now, BloomFilter(self.capacity, self.error_rate)))
+            del self._filters[:-self.generations]
+
+
+class KLLSketch:
+    """KLL quantile sketch: a stack of compactors holding ~O(k) samples in total
+
+    Level h holds items of weight 2**h; when a level fills up it is sorted and
+    every other item (random offset) is promoted to the next level. Updates
+    are amortized O(1) and rank error is about 1.7/k of the stream length.
+    """
+
+    def __init__(self, k=200):
+        self.k = k
+        self.n = 0
+        self.compactors = [[]]
+        self.size = 0
+        self.max_size = self._capacity(0)
+        self._rng = np.random.default_rng()
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _capacity(self, level):
+        # Lower levels get geometrically smaller buffers (c = 2/3)
+        depth = len(self.compactors) - level - 1
+        return int(math.ceil(self.k * (2 / 3) ** depth)) + 1
+
+    def add(self, value):
+        """Add one value"""
+        value = float(value)
+        self.compactors[0].append(value)
+        self.n += 1
+        self.size += 1
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if self.size >= self.max_size:
+            self._compress()
+
+    def add_many(self, values):
+        """Add an array of values (NaNs are ignored)"""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.compactors[0].extend(values.tolist())
+        self.n += len(values)
+        self.size += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        while self.size >= self.max_size:
+            self._compress()
+
+    def _compress(self):
+        for level, items in enumerate(self.compactors):
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self.compactors):
+                    self.compactors.append([])
+                ordered = np.sort(np.asarray(items))
+                # An odd item out stays behind so total weight is preserved
+                keep = ordered[-1:].tolist() if len(ordered) % 2 else []
+                paired = ordered[:len(ordered) - len(keep)]
+                self.compactors[level] = keep
+                self.compactors[level + 1].extend(paired[self._rng.integers(2)::2].tolist())
+                break
+        self.size = sum(len(items) for items in self.compactors)
+        self.max_size = sum(self._capacity(level) for level in range(len(self.compactors)))
+
+    def merge(self, other):
+        """Fold another sketch into this one"""
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for level, items in enumerate(other.compactors):
+            self.compactors[level].extend(items)
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.size = sum(len(items) for items in self.compactors)
+        self.max_size = sum(self._capacity(level) for level in range(len(self.compactors)))
+        while self.size >= self.max_size:
+            self._compress()
+
+    def _weighted(self):
+        values = np.concatenate([np.asarray(items, dtype=np.float64) for items in self.compactors])
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.compactors)])
+        order = np.argsort(values, kind='stable')
+        return values[order], np.cumsum(weights[order])
+
+    def quantiles(self, qs):
+        """Approximate values at each quantile in qs (None while empty)"""
+        if self.n == 0:
+            return [None for _ in qs]
+        values, cumulative = self._weighted()
+        targets = np.asarray(qs, dtype=np.float64) * cumulative[-1]
+        idx = np.minimum(np.searchsorted(cumulative, targets, side='left'), len(values) - 1)
+        result = values[idx]
+        # The exact extremes are tracked, so q=0 and q=1 are exact
+        result = np.where(np.asarray(qs) <= 0, self.min, np.where(np.asarray(qs) >= 1, self.max, result))
+        return [float(v) for v in result]
+
+    def quantile(self, q):
+        """Approximate value at quantile q"""
+        return self.quantiles([q])[0]
+
+    def rank(self, value):
+        """Approximate fraction of values <= value"""
+        if self.n == 0:
+            return None
+        values, cumulative = self._weighted()
+        i = np.searchsorted(values, value, side='right')
+        return float(cumulative[i - 1] / cumulative[-1]) if i else 0.0
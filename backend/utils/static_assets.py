@@ -0,0 +1,131 @@
+"""
+In-memory, precompressed frontend assets with content-hash ETags
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import logging
+
+from flask import Response
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip only without it
+    brotli = None
+
+# Fingerprinted URLs (?v=<hash>) never change content; everything else revalidates
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+
+class _Asset:
+    """One file's bytes, hash and compressed variants"""
+
+    __slots__ = ('mimetype', 'digest', 'variants')
+
+    def __init__(self, body, mimetype, min_compress_bytes):
+        self.mimetype = mimetype
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        # Content-Encoding -> (body, ETag); compressed only when worth it
+        self.variants = {'identity': (body, self.digest)}
+        if len(body) >= min_compress_bytes and mimetype.startswith(COMPRESSIBLE_TYPES):
+            compressed = {'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressed['br'] = brotli.compress(body, quality=11)
+            for encoding, data in compressed.items():
+                if len(data) < len(body):
+                    self.variants[encoding] = (data, f'{self.digest}-{encoding}')
+
+
+class StaticAssets:
+    """Frontend files loaded once at startup and served from memory
+
+    Every file is hashed and, when compressible, gzip (and brotli, if the
+    package is installed) compressed ahead of time, so a request costs a
+    dict lookup. References to other assets in HTML pages are rewritten to
+    ``name?v=<hash>``; those URLs are cached as immutable, while pages and
+    unversioned URLs revalidate with their ETag and get 304s.
+    """
+
+    def __init__(self, directory, min_compress_bytes=256):
+        self.directory = directory
+        self.min_compress_bytes = min_compress_bytes
+        self.assets = {}
+        self.load()
+
+    def load(self):
+        """(Re)read every file under the directory"""
+        files = {}
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                with open(path, 'rb') as f:
+                    files[os.path.relpath(path, self.directory).replace(os.sep, '/')] = f.read()
+
+        assets = {name: self._asset(name, body) for name, body in files.items() if not name.endswith('.html')}
+        for name, body in files.items():
+            if name.endswith('.html'):
+                assets[name] = self._asset(name, self._fingerprint(body, assets))
+
+        self.assets = assets
+        logger.info(f"Loaded {len(assets)} static assets from {self.directory}"
+                    f"{'' if brotli is not None else ' (gzip only, brotli not installed)'}")
+
+    def _asset(self, name, body):
+        mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        return _Asset(body, mimetype, self.min_compress_bytes)
+
+    @staticmethod
+    def _fingerprint(html, assets):
+        """Point src/href attributes that name an asset at its versioned URL"""
+        def versioned(match):
+            attribute, name = match.groups()
+            asset = assets.get(name)
+            return f'{attribute}="{name}?v={asset.digest}"' if asset is not None else match.group(0)
+        return re.sub(r'\b(src|href)="([^"?#:]+)"', versioned, html.decode('utf-8')).encode('utf-8')
+
+    def response(self, name, request):
+        """Response for an asset, negotiated against the request's headers; None if unknown"""
+        asset = self.assets.get(name)
+        if asset is None:
+            return None
+
+        encoding = self._encoding(asset, request)
+        body, etag = asset.variants[encoding]
+        cache_control = IMMUTABLE_CACHE_CONTROL if request.args.get('v') == asset.digest \
+            else REVALIDATE_CACHE_CONTROL
+
+        if any(request.if_none_match.contains(tag) for _, tag in asset.variants.values()):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype=asset.mimetype)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    @staticmethod
+    def _encoding(asset, request):
+        """Best Accept-Encoding the asset has a variant for (brotli preferred on ties)"""
+        best, best_quality = 'identity', 0
+        for encoding in ('br', 'gzip'):
+            quality = request.accept_encodings[encoding]
+            if encoding in asset.variants and quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def stats(self):
+        """Per-asset sizes of each variant"""
+        return {
+            name: {encoding: len(body) for encoding, (body, _) in asset.variants.items()}
+            for name, asset in self.assets.items()
+        }
+
@@ -0,0 +1,453 @@
+"""
+Compact column-array storage for scored transactions
+"""
+
+import json
+import os
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+import logging
+
+import numpy as np
+import pandas as pd
+from dateutil.tz import tzlocal
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# Naive timestamps (datetime.now(), sample data, uploads without an offset) are local time
+LOCAL_TZ = tzlocal()
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+_GENERATED_ID = re.compile(r'^TXN_(\d{6,})$')
+
+
+def to_epoch_us(timestamp):
+    """Convert a timestamp (ISO string, datetime or pandas Timestamp) to int64 epoch microseconds
+
+    Integers are taken as epoch microseconds already (as the change log stores them).
+
+    Naive values are taken as local time, as the bulk path does, so the result is a
+    true epoch comparable with time.time().
+    """
+    if isinstance(timestamp, (int, np.integer)) and not isinstance(timestamp, bool):
+        return int(timestamp)
+    if isinstance(timestamp, str):
+        try:
+            dt = datetime.fromisoformat(timestamp)
+        except ValueError:
+            dt = pd.to_datetime(timestamp).to_pydatetime()
+    elif isinstance(timestamp, datetime):
+        dt = timestamp
+    else:
+        dt = pd.to_datetime(timestamp).to_pydatetime()
+
+    return (dt.astimezone(timezone.utc) - EPOCH) // ONE_MICROSECOND
+
+
+def split_ids(ids):
+    """Split transaction IDs into generated "TXN_000123" sequence numbers and other strings
+
+    Returns (ids as a str Series, int64 sequence numbers with -1 for
+    non-generated IDs, boolean mask of generated IDs).
+    """
+    ids = pd.Series(ids, dtype=object).astype(str).reset_index(drop=True)
+    digits = ids.str.extract(_GENERATED_ID)[0]
+    seq = pd.to_numeric(digits, errors='coerce')
+    generated = seq.notna()
+    generated[generated] = ('TXN_' + seq[generated].astype(np.int64).astype(str).str.zfill(6)) == ids[generated]
+    id_seq = np.where(generated, seq.fillna(-1), -1).astype(np.int64)
+    return ids, id_seq, generated.values
+
+
+def from_epoch_us(value):
+    """Convert int64 epoch microseconds back to a naive local datetime"""
+    return (EPOCH + timedelta(microseconds=int(value))).astimezone(LOCAL_TZ).replace(tzinfo=None)
+
+
+def local_datetimes(values):
+    """Convert an array of epoch microseconds to naive local pandas datetimes"""
+    return pd.to_datetime(values, unit='us', utc=True).tz_convert(LOCAL_TZ).tz_localize(None)
+
+
+class CategoryPool:
+    """Dictionary encoder mapping repeated strings to small integer codes"""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, value):
+        """Return the code for value, adding it to the pool if needed"""
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def lookup(self, value):
+        """Return the code for value, or -1 if it has never been seen"""
+        return self.codes.get(value, -1)
+
+    def decode(self, code):
+        """Return the value stored under code"""
+        return self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+
+class TransactionStore:
+    """Append-only column store for scored transaction records
+
+    Records are kept as typed NumPy columns (categories dictionary-encoded,
+    timestamps as int64 epoch microseconds) and only turned back into dicts
+    when a response needs them.
+
+    Records carry either a client-supplied ``clientId`` or no ID, in which
+    case the store assigns "TXN_<row + 1>". Client IDs always live in
+    id_pool, even when they look generated, so they never share a namespace
+    with server IDs; both are returned as ``id``.
+    """
+
+    CATEGORY_COLUMNS = ('userId', 'transactionType', 'location', 'riskCategory')
+    INT_COLUMNS = ('loginAttempts', 'transactionCount')
+    FLOAT_COLUMNS = ('transactionVelocity', 'riskScore', 'anomalyScore')
+    # degraded marks rows scored by the heuristic fallback instead of the model
+    FLAG_COLUMNS = ('isAnomaly', 'fraud', 'degraded')
+
+    # Order of keys in materialized records
+    FIELD_ORDER = (
+        'id', 'userId', 'transactionType', 'loginAttempts', 'transactionCount',
+        'transactionVelocity', 'location', 'timestamp', 'riskScore',
+        'riskCategory', 'isAnomaly', 'anomalyScore', 'fraud', 'degraded'
+    )
+
+    def __init__(self, initial_capacity=1024):
+        self._lock = threading.Lock()
+        self._size = 0
+        self._capacity = initial_capacity
+        self.pools = {name: CategoryPool() for name in self.CATEGORY_COLUMNS}
+        self.id_pool = CategoryPool()
+        # First row of each id_pool code, so client ID lookups need no scan
+        self._id_rows = []
+
+        self.columns = {
+            # Server "TXN_000123" IDs are stored as their number; client IDs
+            # go into id_pool and id_seq is -1
+            'id_seq': np.full(initial_capacity, -1, dtype=np.int64),
+            'id_code': np.full(initial_capacity, -1, dtype=np.int32),
+            'timestamp': np.zeros(initial_capacity, dtype=np.int64),
+        }
+        for name in self.CATEGORY_COLUMNS:
+            self.columns[name] = np.full(initial_capacity, -1, dtype=np.int32)
+        for name in self.INT_COLUMNS:
+            self.columns[name] = np.full(initial_capacity, -1, dtype=np.int32)
+        for name in self.FLOAT_COLUMNS:
+            self.columns[name] = np.full(initial_capacity, np.nan, dtype=np.float32)
+        for name in self.FLAG_COLUMNS:
+            self.columns[name] = np.full(initial_capacity, -1, dtype=np.int8)
+
+    def __len__(self):
+        return self._size
+
+    def append(self, record):
+        """Append a transaction record dict and return its row index"""
+        with self._lock:
+            if self._size == self._capacity:
+                self._grow()
+            row = self._size
+            self._write_row(row, record)
+            self._size += 1
+            return row
+
+    def extend(self, columns, n_rows):
+        """Append n_rows records given as field -> array/list columns
+
+        Vectorized counterpart of append for bulk jobs; returns the row index
+        of the first appended record.
+        """
+        with self._lock:
+            while self._size + n_rows > self._capacity:
+                self._grow()
+            start = self._size
+            self._write_columns(slice(start, start + n_rows), columns)
+            self._size += n_rows
+            return start
+
+    def find_client_ids(self, ids):
+        """Row index of each client transaction ID's first stored occurrence, or -1 if not stored
+
+        Only client IDs are searched, so a server-generated row never matches.
+        """
+        id_rows = self._id_rows
+        codes = [self.id_pool.lookup(str(value)) for value in ids]
+        # A code encoded by a write still in progress has no row yet
+        return np.array([id_rows[code] if 0 <= code < len(id_rows) else -1 for code in codes], dtype=np.int64)
+
+    def client_id_rows(self):
+        """First stored row of every id_pool value, in id_pool order"""
+        return np.array(self._id_rows, dtype=np.int64)
+
+    def column(self, name):
+        """Return a read-only view of a column over the stored rows"""
+        view = self.columns[name][:self._size]
+        view.flags.writeable = False
+        return view
+
+    def mask_equals(self, name, value):
+        """Boolean mask of rows whose category column equals value"""
+        code = self.pools[name].lookup(value)
+        if code < 0:
+            return np.zeros(self._size, dtype=bool)
+        return self.columns[name][:self._size] == code
+
+    def category_values(self, name, rows):
+        """Decoded values of a category column at the given rows (None where unset)"""
+        values = np.asarray(self.pools[name].values + [None], dtype=object)
+        return values[self.columns[name][:self._size][rows]]  # Code -1 picks the trailing None
+
+    def category_counts(self, name, mask=None):
+        """Count rows per category value, optionally only rows where mask is True"""
+        codes = self.columns[name][:self._size]
+        if mask is not None:
+            codes = codes[mask]
+        counts = np.bincount(codes[codes >= 0], minlength=len(self.pools[name]))
+        return {value: int(counts[code]) for code, value in enumerate(self.pools[name].values)}
+
+    def get(self, row):
+        """Materialize a single row as a JSON-ready dict"""
+        if row < 0 or row >= self._size:
+            raise IndexError(f"Transaction row {row} out of range")
+
+        record = {}
+        for field in self.FIELD_ORDER:
+            value = self._read_field(row, field)
+            if value is not None:
+                record[field] = value
+        return record
+
+    def materialize(self, rows):
+        """Materialize an iterable of row indices as a list of dicts"""
+        return [self.get(int(row)) for row in rows]
+
+    def snapshot(self):
+        """Capture (size, column views, pool values) for a consistent checkpoint"""
+        with self._lock:
+            size = self._size
+            # Rows below size never change and a grow replaces (not mutates)
+            # the arrays, so these views stay valid after the lock is released
+            columns = {name: col[:size] for name, col in self.columns.items()}
+            pools = {name: pool.values[:] for name, pool in self.pools.items()}
+            pools['id'] = self.id_pool.values[:]
+        return size, columns, pools
+
+    def save_checkpoint(self, directory, snapshot=None):
+        """Write a snapshot as one .npy file per column plus the category pools"""
+        size, columns, pools = snapshot if snapshot is not None else self.snapshot()
+        os.makedirs(directory, exist_ok=True)
+        for name, values in columns.items():
+            np.save(os.path.join(directory, f"{name}.npy"), values)
+        with open(os.path.join(directory, 'pools.json'), 'w') as f:
+            json.dump(pools, f)
+        return size
+
+    def load_checkpoint(self, directory):
+        """Replace the contents with a checkpoint written by save_checkpoint
+
+        Columns are memory-mapped copy-on-write, so loading costs little more
+        than reading the pools; pages are read lazily and copied only when
+        written (or when the store next grows).
+        """
+        with open(os.path.join(directory, 'pools.json')) as f:
+            pools = json.load(f)
+        columns = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='c')
+            for name in self.columns
+            if os.path.exists(os.path.join(directory, f"{name}.npy"))
+        }
+        size = len(columns['timestamp'])
+        for name, col in self.columns.items():
+            if name not in columns:
+                # Column added after the checkpoint was written: unset for its rows
+                columns[name] = np.full(size, np.nan if col.dtype.kind == 'f' else -1, dtype=col.dtype)
+
+        with self._lock:
+            for name, pool in self.pools.items():
+                pool.values = pools[name]
+                pool.codes = {value: code for code, value in enumerate(pool.values)}
+            self.id_pool.values = pools['id']
+            self.id_pool.codes = {value: code for code, value in enumerate(self.id_pool.values)}
+            self._id_rows = []
+            self._index_ids(0, columns['id_code'])
+            self.columns = columns
+            self._size = self._capacity = size
+        return size
+
+    def nbytes(self):
+        """Approximate bytes used by the stored rows (excluding category pools)"""
+        return sum(col.itemsize * self._size for col in self.columns.values())
+
+    def _grow(self):
+        """Double the capacity of every column"""
+        new_capacity = max(self._capacity * 2, 1024)
+        for name, col in self.columns.items():
+            fill = np.nan if col.dtype.kind == 'f' else (0 if name == 'timestamp' else -1)
+            grown = np.full(new_capacity, fill, dtype=col.dtype)
+            grown[:self._capacity] = col
+            self.columns[name] = grown
+        self._capacity = new_capacity
+
+    def _index_ids(self, start, codes):
+        """Record the first row of id_pool codes first written in codes (stored from row start)"""
+        codes = np.asarray(codes, dtype=np.int64)
+        # Codes are handed out in write order, so new ones are exactly those past the index
+        new = np.flatnonzero(codes >= len(self._id_rows))
+        if len(new):
+            _, first = np.unique(codes[new], return_index=True)
+            self._id_rows.extend((start + new[first]).tolist())
+
+    def _write_row(self, row, record):
+        """Encode a record dict into the column arrays"""
+        cols = self.columns
+
+        client_id = record.get('clientId')
+        txn_id = record.get('id')
+        if client_id is not None:
+            cols['id_code'][row] = self.id_pool.encode(str(client_id))
+            self._index_ids(row, cols['id_code'][row:row + 1])
+        elif txn_id is None:
+            cols['id_seq'][row] = row + 1
+        else:
+            # Explicit IDs (log entries written before client IDs were kept apart)
+            txn_id = str(txn_id)
+            match = _GENERATED_ID.match(txn_id)
+            if match and f"TXN_{int(match.group(1)):06d}" == txn_id:
+                cols['id_seq'][row] = int(match.group(1))
+            else:
+                cols['id_code'][row] = self.id_pool.encode(txn_id)
+                self._index_ids(row, cols['id_code'][row:row + 1])
+
+        try:
+            cols['timestamp'][row] = to_epoch_us(record.get('timestamp') or datetime.now())
+        except (ValueError, TypeError, OverflowError):
+            logger.warning(f"Could not parse timestamp: {record.get('timestamp')}")
+            cols['timestamp'][row] = to_epoch_us(datetime.now())
+
+        for name in self.CATEGORY_COLUMNS:
+            value = record.get(name)
+            if value is not None:
+                cols[name][row] = self.pools[name].encode(str(value))
+
+        for name in self.INT_COLUMNS:
+            value = record.get(name)
+            if value is not None:
+                cols[name][row] = int(value)
+
+        for name in self.FLOAT_COLUMNS:
+            value = record.get(name)
+            if value is not None:
+                cols[name][row] = float(value)
+
+        for name in self.FLAG_COLUMNS:
+            value = record.get(name)
+            if value is not None:
+                cols[name][row] = 1 if value else 0
+
+    def _write_columns(self, rows, columns):
+        """Encode whole columns into a slice of the column arrays"""
+        cols = self.columns
+
+        if columns.get('clientId') is not None:
+            cols['id_code'][rows] = [self.id_pool.encode(str(value)) for value in columns['clientId']]
+            self._index_ids(rows.start, cols['id_code'][rows])
+        elif columns.get('id') is None:
+            cols['id_seq'][rows] = np.arange(rows.start + 1, rows.stop + 1)
+        else:
+            ids, id_seq, generated = split_ids(columns['id'])
+            cols['id_seq'][rows] = id_seq
+            cols['id_code'][rows] = [
+                -1 if is_generated else self.id_pool.encode(value)
+                for value, is_generated in zip(ids, generated)
+            ]
+            self._index_ids(rows.start, cols['id_code'][rows])
+
+        timestamps = columns.get('timestamp')
+        now_us = to_epoch_us(datetime.now())
+        if timestamps is None:
+            cols['timestamp'][rows] = now_us
+        elif isinstance(timestamps, np.ndarray) and timestamps.dtype.kind in 'iu':
+            cols['timestamp'][rows] = timestamps  # Epoch microseconds already
+        else:
+            try:
+                parsed = pd.to_datetime(pd.Series(timestamps), errors='coerce', format='mixed')
+                if parsed.dt.tz is None:
+                    # Same reading of naive times as to_epoch_us, DST edges included
+                    parsed = parsed.dt.tz_localize(LOCAL_TZ)
+                parsed = parsed.dt.tz_convert(None)
+                epoch = parsed.values.astype('datetime64[us]').astype(np.int64)
+                epoch[parsed.isna().values] = now_us
+                cols['timestamp'][rows] = epoch
+            except (ValueError, TypeError):
+                cols['timestamp'][rows] = [self._safe_epoch(value, now_us) for value in timestamps]
+
+        for name in self.CATEGORY_COLUMNS:
+            values = columns.get(name)
+            if values is None:
+                continue
+            codes, uniques = pd.factorize(pd.Series(values, dtype=object).astype(str))
+            pool_codes = np.array([self.pools[name].encode(value) for value in uniques], dtype=np.int32)
+            cols[name][rows] = pool_codes[codes]
+
+        for name in self.INT_COLUMNS + self.FLOAT_COLUMNS:
+            values = columns.get(name)
+            if values is not None:
+                cols[name][rows] = np.asarray(values)
+
+        for name in self.FLAG_COLUMNS:
+            values = columns.get(name)
+            if values is not None:
+                cols[name][rows] = np.asarray(values, dtype=bool)
+
+    def _safe_epoch(self, timestamp, default):
+        """Epoch microseconds for timestamp, or default if it cannot be parsed"""
+        try:
+            return to_epoch_us(timestamp)
+        except (ValueError, TypeError, OverflowError):
+            return default
+
+    def _read_field(self, row, field):
+        """Decode a single field of a row, returning None for missing values"""
+        cols = self.columns
+
+        if field == 'id':
+            seq = cols['id_seq'][row]
+            if seq >= 0:
+                return f"TXN_{int(seq):06d}"
+            code = cols['id_code'][row]
+            return self.id_pool.decode(code) if code >= 0 else None
+
+        if field == 'timestamp':
+            return from_epoch_us(cols['timestamp'][row]).isoformat()
+
+        if field in self.pools:
+            code = cols[field][row]
+            return self.pools[field].decode(code) if code >= 0 else None
+
+        if field in self.INT_COLUMNS:
+            value = cols[field][row]
+            return int(value) if value >= 0 else None
+
+        if field in self.FLOAT_COLUMNS:
+            value = cols[field][row]
+            return round(float(value), 4) if not np.isnan(value) else None
+
+        if field in self.FLAG_COLUMNS:
+            value = cols[field][row]
+            if value < 0:
+                return None
+            return int(value) if field == 'fraud' else bool(value)
+
+        return None
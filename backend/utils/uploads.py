@@ -0,0 +1,165 @@
+"""
+Compressed CSV uploads and per-upload result aggregation for chunked processing
+"""
+
+import gzip
+import shutil
+import tempfile
+import zlib
+import logging
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:  # Optional: only needed for .csv.zst uploads
+    zstandard = None
+
+# File name suffix / Content-Encoding -> compression
+CSV_SUFFIXES = {'.csv': None, '.csv.gz': 'gzip', '.csv.zst': 'zstd'}
+CONTENT_ENCODINGS = {'identity': None, 'gzip': 'gzip', 'x-gzip': 'gzip', 'zstd': 'zstd'}
+
+# Request body types accepted as a raw (non-multipart) CSV upload
+RAW_CSV_MIMETYPES = ('text/csv', 'application/csv', 'application/gzip', 'application/x-gzip',
+                     'application/zstd', 'application/octet-stream')
+
+# Errors raised while reading a corrupt or truncated compressed stream
+DECOMPRESSION_ERRORS = (OSError, EOFError, zlib.error) + ((zstandard.ZstdError,) if zstandard else ())
+
+
+class UnsupportedCompression(Exception):
+    """The upload uses a compression this server cannot decode"""
+
+
+def upload_compression(filename, content_encoding=None):
+    """Compression of an upload from its Content-Encoding or file name
+
+    Raises ValueError if the file is not a (compressed) CSV and
+    UnsupportedCompression for encodings that cannot be decoded here.
+    """
+    name = (filename or '').lower()
+    suffix = next((s for s in sorted(CSV_SUFFIXES, key=len, reverse=True) if name.endswith(s)), None)
+    if suffix is None:
+        raise ValueError('File must be a CSV (.csv, .csv.gz or .csv.zst)')
+    compression = CSV_SUFFIXES[suffix]
+
+    if content_encoding:
+        encoding = content_encoding.strip().lower()
+        if encoding not in CONTENT_ENCODINGS:
+            raise UnsupportedCompression(f"Unsupported Content-Encoding: {content_encoding}")
+        compression = CONTENT_ENCODINGS[encoding] or compression
+
+    if compression == 'zstd' and zstandard is None:
+        raise UnsupportedCompression('zstd uploads need the zstandard package')
+    return compression
+
+
+def open_csv_stream(stream, compression):
+    """Binary stream of the upload's CSV bytes, decompressed on the fly"""
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    if compression == 'zstd':
+        return zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True)
+    return stream
+
+
+def rewindable(stream, max_memory=8 * 1024 * 1024):
+    """The stream itself if it can seek, else a (spooled) copy that can"""
+    if stream.seekable():
+        return stream
+    copy = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    shutil.copyfileobj(stream, copy)
+    copy.seek(0)
+    return copy
+
+
+class UploadSummary:
+    """Running totals for one upload processed chunk by chunk
+
+    Collects what the single-shot upload response reported (validation
+    failures with file-wide row numbers, duplicates, the preview rows and
+    top risk factors) so the response looks the same whatever the chunking.
+    """
+
+    def __init__(self, filename, preview_size=100, explain=False, list_limit=100):
+        self.filename = filename
+        self.preview_size = preview_size
+        self.explain = explain
+        self.list_limit = list_limit
+        self.rows_read = 0
+        self.total_count = 0
+        self.invalid_count = 0
+        self.validation_errors = {}
+        self.invalid_rows = []
+        self.quarantine_file = None
+        self.duplicate_count = 0
+        self.duplicate_ids = []
+        self.transactions = []
+        self.top_risk_factors = None
+        self.admission = None
+        self.truncated = False
+
+    def add_validation(self, validation, row_offset):
+        """Fold in a chunk's ValidationResult (row numbers shifted to the whole file)"""
+        if not validation.n_invalid:
+            return
+        self.invalid_count += validation.n_invalid
+        for message, count in validation.summary().items():
+            self.validation_errors[message] = self.validation_errors.get(message, 0) + count
+        room = self.list_limit - len(self.invalid_rows)
+        for entry in validation.invalid_rows(room) if room > 0 else []:
+            entry['row'] += row_offset
+            self.invalid_rows.append(entry)
+
+    def add_duplicates(self, txn_ids):
+        """Count skipped duplicate transaction IDs"""
+        self.duplicate_count += len(txn_ids)
+        self.duplicate_ids.extend(txn_ids[:max(0, self.list_limit - len(self.duplicate_ids))])
+
+    def preview_room(self):
+        """How many more rows the preview takes"""
+        return max(0, self.preview_size - len(self.transactions))
+
+    def add_risk_factors(self, explanations):
+        """Count the strongest risk-raising feature of each explained row"""
+        top_features = pd.Series([
+            e['topFeatures'][0]['feature'] for e in explanations
+            if e['topFeatures'] and e['topFeatures'][0]['contribution'] > 0
+        ], dtype=object)
+        counts = self.top_risk_factors or {}
+        for feature, count in top_features.value_counts().items():
+            counts[feature] = counts.get(feature, 0) + int(count)
+        self.top_risk_factors = counts
+
+    def validation_fields(self):
+        """Validation part of the response"""
+        fields = {'invalidCount': self.invalid_count}
+        if self.invalid_count:
+            fields['validationErrors'] = self.validation_errors
+            fields['invalidRows'] = self.invalid_rows
+            if self.quarantine_file:
+                fields['quarantineFile'] = self.quarantine_file
+        return fields
+
+    def response(self):
+        """Upload response body"""
+        response = {
+            'message': f'Successfully processed {self.total_count} transactions' if self.total_count
+            else 'No new transactions to process',
+            'transactions': self.transactions,  # First preview_size for display
+            'totalCount': self.total_count,
+            **self.validation_fields(),
+            'duplicateCount': self.duplicate_count,
+            'duplicateIds': self.duplicate_ids
+        }
+        if self.top_risk_factors is not None:
+            response['topRiskFactors'] = self.top_risk_factors
+        if self.admission is not None:
+            response['degraded'] = True
+            response['admission'] = self.admission.to_dict()
+        if self.truncated:
+            response['truncated'] = True
+            response['rowsRead'] = self.rows_read
+        return response
@@ -0,0 +1,198 @@
+"""
+Per-user transaction profiles maintained incrementally from the transaction store
+"""
+
+import threading
+from collections import deque
+import logging
+
+import numpy as np
+
+from utils.transaction_store import from_epoch_us
+
+logger = logging.getLogger(__name__)
+
+
+class UserProfileCache:
+    """Running per-user aggregates, recent history and cached profile dicts
+
+    Aggregates are arrays indexed by the store's userId code. Rows appended
+    since the last read are folded in with one vectorized pass, so every
+    write path (single appends, bulk uploads, checkpoint restore and log
+    replay) is covered without hooks. A user's cached profile is dropped
+    only when one of their transactions arrives, so reading an unchanged
+    user is a dict lookup. The last history_size row indices per user are
+    kept in a bounded deque. Behavior anomaly flags published by the
+    periodic sweep sit alongside, with the flagged-user count kept current
+    so the dashboard reads it without a scan.
+    """
+
+    def __init__(self, store, history_size=10):
+        self.store = store
+        self.history_size = history_size
+        self._lock = threading.Lock()
+        self._reset()
+        self.hits = 0
+        self.misses = 0
+
+    def _reset(self):
+        self._seen = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.risk_sums = np.zeros(0, dtype=np.float64)
+        self.risk_max = np.zeros(0, dtype=np.float64)
+        self.last_risk = np.zeros(0, dtype=np.float64)
+        self.anomalies = np.zeros(0, dtype=np.int64)
+        self.frauds = np.zeros(0, dtype=np.int64)
+        self.last_activity = np.zeros(0, dtype=np.int64)
+        self._history = {}
+        self._profiles = {}
+        # Latest anomaly sweep: score per user code (NaN = not swept), flags and their count
+        self.sweep_scores = np.zeros(0, dtype=np.float64)
+        self.sweep_flags = np.zeros(0, dtype=bool)
+        self.swept_at = None
+        self.anomalous_users = None
+
+    def _grow(self, n_users):
+        missing = n_users - len(self.counts)
+        if missing <= 0:
+            return
+        pad = lambda values, fill: np.concatenate([values, np.full(missing, fill, dtype=values.dtype)])
+        self.counts = pad(self.counts, 0)
+        self.risk_sums = pad(self.risk_sums, 0.0)
+        self.risk_max = pad(self.risk_max, -np.inf)
+        self.last_risk = pad(self.last_risk, 0.0)
+        self.anomalies = pad(self.anomalies, 0)
+        self.frauds = pad(self.frauds, 0)
+        self.last_activity = pad(self.last_activity, np.iinfo(np.int64).min)
+        self.sweep_scores = pad(self.sweep_scores, np.nan)
+        self.sweep_flags = pad(self.sweep_flags, False)
+
+    def _catch_up(self):
+        """Fold rows appended since the last call into the aggregates"""
+        size = len(self.store)
+        if size < self._seen:
+            # The store was replaced (checkpoint restore): start over
+            self._reset()
+        if size == self._seen:
+            return
+
+        start = self._seen
+        users = self.store.column('userId')[start:size].astype(np.int64)
+        valid = users >= 0
+        rows = np.arange(start, size)[valid]
+        users = users[valid]
+        risk = self.store.column('riskScore')[start:size][valid].astype(np.float64)
+        timestamps = self.store.column('timestamp')[start:size][valid]
+        anomalous = self.store.column('isAnomaly')[start:size][valid] == 1
+        fraud = self.store.column('fraud')[start:size][valid] == 1
+
+        n_users = len(self.store.pools['userId'])
+        self._grow(n_users)
+        self.counts += np.bincount(users, minlength=n_users)
+        self.risk_sums += np.bincount(users, weights=risk, minlength=n_users)
+        self.anomalies += np.bincount(users, weights=anomalous, minlength=n_users).astype(np.int64)
+        self.frauds += np.bincount(users, weights=fraud, minlength=n_users).astype(np.int64)
+        np.maximum.at(self.risk_max, users, risk)
+        np.maximum.at(self.last_activity, users, timestamps)
+
+        # Per user, the latest rows of this batch: group rows by user, keeping row order
+        order = np.argsort(users, kind='stable')
+        grouped_users = users[order]
+        starts = np.flatnonzero(np.r_[True, grouped_users[1:] != grouped_users[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        self.last_risk[grouped_users[ends - 1]] = risk[order[ends - 1]]
+        for user, first, last in zip(grouped_users[starts].tolist(), starts, ends):
+            history = self._history.get(user)
+            if history is None:
+                history = self._history[user] = deque(maxlen=self.history_size)
+            history.extend(rows[order[max(first, last - self.history_size):last]].tolist())
+            self._profiles.pop(user, None)
+
+        self._seen = size
+
+    def publish_anomalies(self, user_codes, scores, flags, swept_at):
+        """Replace the sweep results: users not in user_codes count as not swept"""
+        with self._lock:
+            self._catch_up()
+            self._grow(len(self.store.pools['userId']))
+            new_scores = np.full(len(self.sweep_scores), np.nan)
+            new_flags = np.zeros(len(self.sweep_flags), dtype=bool)
+            new_scores[user_codes] = scores
+            new_flags[user_codes] = flags
+
+            # Drop cached profiles whose sweep result changed
+            changed = np.flatnonzero((new_flags != self.sweep_flags) |
+                                     ~((new_scores == self.sweep_scores) |
+                                       (np.isnan(new_scores) & np.isnan(self.sweep_scores))))
+            for code in changed.tolist():
+                self._profiles.pop(code, None)
+
+            self.sweep_scores = new_scores
+            self.sweep_flags = new_flags
+            self.swept_at = swept_at
+            self.anomalous_users = int(np.count_nonzero(new_flags))
+
+    def anomalous_user_count(self):
+        """Users flagged by the latest anomaly sweep; before the first one, users with an anomalous transaction"""
+        if self.anomalous_users is not None:
+            return self.anomalous_users
+        with self._lock:
+            self._catch_up()
+            return int(np.count_nonzero(self.anomalies))
+
+    def profile(self, user_id):
+        """(profile dict, rebuilt) for the user, or (None, False) if they have no transactions"""
+        with self._lock:
+            self._catch_up()
+            code = self.store.pools['userId'].lookup(user_id)
+            if code < 0 or code >= len(self.counts) or self.counts[code] == 0:
+                return None, False
+
+            cached = self._profiles.get(code)
+            if cached is not None:
+                self.hits += 1
+                return cached, False
+
+            self.misses += 1
+            profile = self._build(code, user_id)
+            self._profiles[code] = profile
+            return profile, True
+
+    def _build(self, code, user_id):
+        count = int(self.counts[code])
+        avg_risk = float(self.risk_sums[code]) / count
+        return {
+            'transactionCount': count,
+            'avgRiskScore': round(avg_risk, 4),
+            'maxRiskScore': round(float(self.risk_max[code]), 4),
+            'riskTrend': 'increasing' if self.last_risk[code] > avg_risk else 'stable',
+            'anomalyCount': int(self.anomalies[code]),
+            'isAnomalous': bool(self.anomalies[code] > 0),
+            'fraudRate': int(self.frauds[code]) / count,
+            'lastActivity': from_epoch_us(self.last_activity[code]).isoformat(),
+            'userId': user_id,
+            'transactionHistory': self.store.materialize(self._history[code]),
+            'behaviorAnomaly': self._sweep_result(code)
+        }
+
+    def _sweep_result(self, code):
+        score = self.sweep_scores[code]
+        if np.isnan(score):
+            return None
+        return {
+            'isAnomalous': bool(self.sweep_flags[code]),
+            'anomalyScore': round(float(score), 4),
+            'sweptAt': self.swept_at
+        }
+
+    def stats(self):
+        """Cache counters"""
+        with self._lock:
+            return {
+                'users': len(self._history),
+                'cachedProfiles': len(self._profiles),
+                'rowsIndexed': self._seen,
+                'hits': self.hits,
+                'misses': self.misses,
+                'anomalousUsers': self.anomalous_users
+            }
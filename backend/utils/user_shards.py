@@ -0,0 +1,315 @@
+"""
+Per-user state partitioned by userId across local shard processes
+"""
+
+import bisect
+import os
+import pickle
+import secrets
+import threading
+import logging
+import multiprocessing
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+from models.behavior_model import BehaviorProfilingModel
+from utils.sketches import hash64
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class HashRing:
+    """Consistent hash ring mapping keys to shard indexes
+
+    Each shard owns many virtual points on the ring, so keys spread evenly and
+    changing the shard count only moves about 1/n of the users.
+    """
+
+    def __init__(self, n_shards, replicas=128):
+        points = sorted((hash64(f"shard-{shard}#{i}"), shard)
+                        for shard in range(n_shards) for i in range(replicas))
+        self._hashes = [h for h, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_for(self, key):
+        """Index of the shard that owns key"""
+        i = bisect.bisect(self._hashes, hash64(key)) % len(self._hashes)
+        return self._shards[i]
+
+
+class UserStateShard:
+    """Behavior summaries for the users one shard owns"""
+
+    def __init__(self, behavior_profiles=None):
+        self.behavior = BehaviorProfilingModel()
+        self.behavior.user_profiles = behavior_profiles if behavior_profiles is not None else {}
+
+    def update_behavior(self, user_id, transaction_data):
+        """Fold a transaction into the user's running behavior summary"""
+        self.behavior.update_user_profile(user_id, transaction_data)
+
+    def behavior_profile(self, user_id):
+        """Behavior features for the user, or an empty dict"""
+        return self.behavior.get_user_profile(user_id).get('profile', {})
+
+    def behavior_values(self, name, user_ids):
+        """One behavior feature for each of user_ids (None for users not held)"""
+        return [self.behavior.get_user_profile(user_id).get('profile', {}).get(name) for user_id in user_ids]
+
+    def sizes(self):
+        """Number of users held"""
+        return {'behaviorProfiles': len(self.behavior.user_profiles)}
+
+    def export_state(self):
+        """Pickled copy of every held user's state"""
+        return pickle.dumps({'behavior': self.behavior.user_profiles}, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def import_state(self, blob):
+        """Add users from an export_state blob, replacing any already held"""
+        state = pickle.loads(blob)
+        self.behavior.user_profiles.update(state['behavior'])
+
+
+# Shard methods callable over IPC
+SHARD_METHODS = (
+    'update_behavior', 'behavior_profile', 'behavior_values', 'sizes',
+    'export_state', 'import_state'
+)
+
+
+class LocalUserState:
+    """Single-process user state with the same interface as ShardedUserState"""
+
+    def __init__(self, behavior_profiles=None):
+        self.shard = UserStateShard(behavior_profiles)
+        self._lock = threading.Lock()
+        self.n_shards = 1
+
+    def __getattr__(self, name):
+        if name not in SHARD_METHODS:
+            raise AttributeError(name)
+        method = getattr(self.shard, name)
+
+        def call(*args):
+            with self._lock:
+                return method(*args)
+        return call
+
+    def status(self):
+        """Shard count and restarts (none in-process)"""
+        return {'shards': 1, 'restarts': 0, 'restartsByShard': [0]}
+
+    def shutdown(self):
+        """Nothing to release for in-process state"""
+
+
+def _serve_connection(conn, shard, lock):
+    """Answer (method, args) requests on one client connection until it closes"""
+    with conn:
+        while True:
+            try:
+                method, args = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                if method not in SHARD_METHODS:
+                    raise ValueError(f"Unknown shard method: {method}")
+                with lock:
+                    result = getattr(shard, method)(*args)
+                conn.send(('ok', result))
+            except Exception as e:
+                conn.send(('error', f"{type(e).__name__}: {e}"))
+
+
+def serve_shard(address, authkey, behavior_profiles=None):
+    """Run one shard server on a Unix socket (target of the shard processes)"""
+    shard = UserStateShard(behavior_profiles)
+    lock = threading.Lock()
+    with Listener(address, family='AF_UNIX', authkey=authkey) as listener:
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, OSError, EOFError) as e:
+                logger.warning(f"Rejected shard connection: {e}")
+                continue
+            threading.Thread(target=_serve_connection, args=(conn, shard, lock), daemon=True).start()
+
+
+class ShardedUserState:
+    """Client that routes per-user calls to the shard process owning the user
+
+    Every web worker process builds one of these over the same socket
+    directory; the first to get there starts the shard processes and the rest
+    connect to them. Connections are kept per thread and per process (they
+    are re-opened after a fork), since a Connection is not thread-safe.
+
+    Shards unpickle what they receive, so the socket directory is private
+    (0700) and connections authenticate with a random key kept in a 0600
+    file there, created by the first client (unless authkey is given).
+    A shard found dead is restarted empty: its users' state is lost, which
+    is logged and counted in status().
+    """
+
+    def __init__(self, n_shards, socket_dir, authkey=None, seed_profiles=None):
+        self.n_shards = n_shards
+        self.socket_dir = os.path.abspath(socket_dir)
+        self.ring = HashRing(n_shards)
+        self.addresses = [os.path.join(self.socket_dir, f"shard-{i}.sock") for i in range(n_shards)]
+        self.processes = []
+        self.restarts = [0] * n_shards
+        self._local = threading.local()
+        self._seed_profiles = seed_profiles or {}
+
+        os.makedirs(self.socket_dir, mode=0o700, exist_ok=True)
+        os.chmod(self.socket_dir, 0o700)
+        self.authkey = authkey if authkey is not None else self._load_authkey()
+        self.ensure_started()
+
+    def _load_authkey(self):
+        """The deployment's shard key, generated on first use"""
+        path = os.path.join(self.socket_dir, 'authkey')
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            with open(path, 'rb') as f:
+                return f.read()
+        key = secrets.token_bytes(32)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(key)
+        return key
+
+    def ensure_started(self, restarting=False):
+        """Start any shard that is not accepting connections (restarting: after it was found dead)"""
+        with open(os.path.join(self.socket_dir, 'shards.lock'), 'w') as lock_file:
+            # Serialize startup between worker processes
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                for shard in range(self.n_shards):
+                    if not self._reachable(shard):
+                        if restarting:
+                            self.restarts[shard] += 1
+                            logger.error(f"User state shard {shard} died; restarting it empty, "
+                                         f"its users' behavior state is lost")
+                        self._start(shard)
+            finally:
+                # Unlock explicitly: forked shards share this file description
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _reachable(self, shard):
+        try:
+            Client(self.addresses[shard], family='AF_UNIX', authkey=self.authkey).close()
+            return True
+        except (OSError, EOFError):
+            return False
+
+    def _start(self, shard):
+        address = self.addresses[shard]
+        if os.path.exists(address):
+            os.remove(address)  # Stale socket left by a dead shard
+        seed = {user_id: entry for user_id, entry in self._seed_profiles.items()
+                if self.ring.shard_for(user_id) == shard}
+
+        context = multiprocessing.get_context('fork')
+        process = context.Process(target=serve_shard, args=(address, self.authkey, seed),
+                                  name=f"user-shard-{shard}", daemon=True)
+        process.start()
+        self.processes.append(process)
+
+        # Wait until the listener is up so the first request does not fail
+        for _ in range(100):
+            if self._reachable(shard):
+                break
+            process.join(0.05)
+        logger.info(f"Started user state shard {shard} (pid {process.pid}, {len(seed)} seeded users)")
+
+    def _connection(self, shard):
+        conns = getattr(self._local, 'conns', None)
+        if conns is None or self._local.pid != os.getpid():
+            conns = self._local.conns = {}
+            self._local.pid = os.getpid()
+        conn = conns.get(shard)
+        if conn is None:
+            conn = conns[shard] = Client(self.addresses[shard], family='AF_UNIX', authkey=self.authkey)
+        return conn
+
+    def _call(self, shard, method, *args):
+        for attempt in range(2):
+            try:
+                conn = self._connection(shard)
+                conn.send((method, args))
+                status, result = conn.recv()
+                break
+            except (OSError, EOFError):
+                # Shard restarted or connection went stale: reconnect (and restart) once
+                self._local.conns.pop(shard, None)
+                if attempt:
+                    raise
+                self.ensure_started(restarting=True)
+        if status == 'error':
+            raise RuntimeError(f"Shard {shard} {method} failed: {result}")
+        return result
+
+    def _call_user(self, method, user_id, *args):
+        return self._call(self.ring.shard_for(user_id), method, user_id, *args)
+
+    def update_behavior(self, user_id, transaction_data):
+        """Fold a transaction into the user's running behavior summary"""
+        return self._call_user('update_behavior', user_id, transaction_data)
+
+    def behavior_profile(self, user_id):
+        """Behavior features for the user, or an empty dict"""
+        return self._call_user('behavior_profile', user_id)
+
+    def behavior_values(self, name, user_ids):
+        """One behavior feature for each of user_ids, with one call per shard"""
+        by_shard = {}
+        for i, user_id in enumerate(user_ids):
+            by_shard.setdefault(self.ring.shard_for(user_id), []).append(i)
+        values = [None] * len(user_ids)
+        for shard, indexes in by_shard.items():
+            for i, value in zip(indexes, self._call(shard, 'behavior_values', name, [user_ids[i] for i in indexes])):
+                values[i] = value
+        return values
+
+    def sizes(self):
+        """Number of users held, summed over shards"""
+        totals = {}
+        for shard in range(self.n_shards):
+            for key, value in self._call(shard, 'sizes').items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def export_state(self):
+        """Pickled copy of every shard's users, merged"""
+        merged = {'behavior': {}}
+        for shard in range(self.n_shards):
+            state = pickle.loads(self._call(shard, 'export_state'))
+            merged['behavior'].update(state['behavior'])
+        return pickle.dumps(merged, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def import_state(self, blob):
+        """Route the users in an export_state blob to their owning shards"""
+        state = pickle.loads(blob)
+        parts = [{'behavior': {}} for _ in range(self.n_shards)]
+        for user_id, value in state['behavior'].items():
+            parts[self.ring.shard_for(user_id)]['behavior'][user_id] = value
+        for shard, part in enumerate(parts):
+            self._call(shard, 'import_state', pickle.dumps(part, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def status(self):
+        """Shard count and how often shards were restarted (losing their users) by this client"""
+        return {'shards': self.n_shards, 'restarts': sum(self.restarts), 'restartsByShard': list(self.restarts)}
+
+    def shutdown(self):
+        """Stop the shard processes this client started"""
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join(1)
+        self.processes = []
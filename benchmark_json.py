@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+JSON serialization benchmark for the Fraud Detection API
+Times Flask's default json encoder against the orjson-backed provider (and
+streamed encoding) on the payloads of /api/transactions and /api/upload_csv
+"""
+
+import argparse
+import sys
+import time
+from itertools import chain
+import numpy as np
+import pandas as pd
+import logging
+
+# Add backend to path
+sys.path.append('backend')
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from utils.data_processor import generate_sample_data
+from utils.fast_json import FastJSONProvider, orjson
+from utils.transaction_store import TransactionStore
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def build_store(n_rows):
+    """Transaction store filled with scored sample transactions"""
+    sample = pd.DataFrame(generate_sample_data(n_rows))
+    risk_scores = np.random.random(n_rows)
+    store = TransactionStore()
+    store.extend({
+        'id': [f"TXN_{i + 1:06d}" for i in range(n_rows)],
+        'userId': sample['userId'].values,
+        'transactionType': sample['transactionType'].values,
+        'loginAttempts': sample['loginAttempts'].values,
+        'transactionCount': sample['transactionCount'].values,
+        'transactionVelocity': sample['transactionVelocity'].values,
+        'location': sample['location'].values,
+        'riskScore': risk_scores,
+        'riskCategory': np.where(risk_scores > 0.7, 'High', np.where(risk_scores > 0.4, 'Moderate', 'Low')),
+        'isAnomaly': np.random.random(n_rows) > 0.9,
+        'anomalyScore': np.random.uniform(-0.5, 0.5, n_rows),
+        'fraud': (risk_scores > 0.8).astype(int)
+    }, n_rows)
+    return store, sample
+
+def transactions_payload(store, n_rows):
+    """/api/transactions body for a page of n_rows"""
+    return {
+        'transactions': store.materialize(range(n_rows)),
+        'totalCount': len(store),
+        'appliedFilters': {'risk': None, 'userId': None, 'limit': n_rows}
+    }
+
+def upload_payload(store, sample, preview_size=100):
+    """/api/upload_csv body: preview rows carrying their original CSV data"""
+    preview = store.materialize(range(preview_size))
+    for record, original in zip(preview, sample.head(preview_size).to_dict('records')):
+        record['originalData'] = original
+    return {
+        'message': f'Successfully processed {len(store)} transactions',
+        'transactions': preview,
+        'totalCount': len(store),
+        'invalidCount': 0,
+        'duplicateCount': 0,
+        'duplicateIds': []
+    }
+
+def timed(fn, repeat):
+    """Best wall time of repeat calls, in milliseconds, and the last result"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+def benchmark(args):
+    """Encode each payload with both providers and print the timings"""
+    app = Flask(__name__)
+    default_provider = DefaultJSONProvider(app)
+    fast_provider = FastJSONProvider(app)
+
+    store, sample = build_store(max(args.rows, args.preview))
+    payloads = {
+        f'upload_csv preview ({args.preview} rows)': upload_payload(store, sample, args.preview),
+        f'transactions page ({args.rows} rows)': transactions_payload(store, args.rows)
+    }
+
+    print(f"\n⏱️  Encoder: {'orjson ' + orjson.__version__ if orjson else 'json (orjson not installed)'}, "
+          f"best of {args.repeat}")
+    for name, payload in payloads.items():
+        default_ms, default_body = timed(lambda: default_provider.response(payload).get_data(), args.repeat)
+        fast_ms, fast_body = timed(lambda: fast_provider.response(payload).get_data(), args.repeat)
+        print(f"\n   {name}")
+        print(f"   default json : {default_ms:8.2f} ms  {len(default_body):>10,} bytes")
+        print(f"   fast json    : {fast_ms:8.2f} ms  {len(fast_body):>10,} bytes  ({default_ms / fast_ms:.1f}x)")
+
+    # Streaming: rows materialized and encoded batch by batch, as /api/transactions does for large pages
+    def stream():
+        rows = np.arange(args.rows)
+        batches = (store.materialize(rows[i:i + 500]) for i in range(0, args.rows, 500))
+        body = dict(transactions_payload(store, 0), transactions=None)
+        chunks = list(fast_provider.iter_encode(body, 'transactions', chain.from_iterable(batches)))
+        return chunks
+
+    def build_and_encode():
+        return fast_provider.response(transactions_payload(store, args.rows)).get_data()
+
+    whole_ms, _ = timed(build_and_encode, args.repeat)
+    stream_ms, chunks = timed(stream, args.repeat)
+    first_ms, _ = timed(lambda: next(iter(fast_provider.iter_encode(
+        {'transactions': None}, 'transactions', iter(store.materialize(range(500)))))), args.repeat)
+    print(f"\n   transactions page ({args.rows} rows), materialize + encode")
+    print(f"   whole body   : {whole_ms:8.2f} ms")
+    print(f"   streamed     : {stream_ms:8.2f} ms  {len(chunks)} chunks, largest {max(map(len, chunks)):,} bytes, "
+          f"first bytes after {first_ms:.2f} ms")
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Benchmark API response JSON serialization")
+    parser.add_argument('--rows', type=int, default=10000, help="Rows in the /api/transactions page")
+    parser.add_argument('--preview', type=int, default=100, help="Rows in the upload preview")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed repetitions per case")
+    return parser.parse_args()
+
+def main():
+    """Main benchmark function"""
+    args = parse_args()
+
+    print("🚀 Benchmarking JSON Serialization...")
+    print("=" * 50)
+
+    try:
+        benchmark(args)
+
+    except Exception as e:
+        logger.error(f"Benchmark failed with error: {e}")
+        import traceback
+        traceback.print_exc()
+        return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
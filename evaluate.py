@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Evaluation script for Fraud Detection System
+Scores a holdout set with both models and regenerates the comparison CSVs
+"""
+
+import argparse
+import os
+import sys
+import time
+import pandas as pd
+import numpy as np
+import logging
+
+# Add backend to path
+sys.path.append('backend')
+
+from models.fraud_model import FraudDetectionModel
+from models.behavior_model import BehaviorProfilingModel, build_user_behavior_features
+from utils.data_processor import DataProcessor, FEATURE_COLUMNS
+from utils.evaluation import bootstrap_metrics, threshold_sweep
+from utils.rules_engine import DecisionRulesEngine
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Assumed average loss prevented per detected fraud, used for the business value column
+AVG_FRAUD_LOSS = 10000
+
+def load_holdout(args):
+    """Load the holdout set, either from its own file or as the rows setup.py held out of training"""
+    if args.holdout:
+        if os.path.exists(args.dataset) and os.path.samefile(args.holdout, args.dataset):
+            raise ValueError(f"{args.holdout} is the training dataset; metrics on it would be in-sample")
+        df = pd.read_csv(args.holdout)
+        logger.info(f"Loaded holdout set: {len(df)} records")
+        return df
+
+    if not os.path.exists(args.holdout_indices):
+        raise FileNotFoundError(f"{args.holdout_indices} not found: re-run setup.py to hold out an evaluation "
+                                f"split, or pass --holdout with records the models were not trained on")
+
+    df = pd.read_csv(args.dataset)
+    indices = np.load(args.holdout_indices)
+    if len(indices) and indices.max() >= len(df):
+        raise ValueError(f"{args.holdout_indices} does not match {args.dataset}: re-run setup.py")
+    logger.info(f"Using the {len(indices)} of {len(df)} records in {args.dataset} held out of training")
+    return df.iloc[indices].reset_index(drop=True)
+
+def score_holdout(df, fraud_model, behavior_model, data_processor):
+    """Score every holdout row with the XGBoost model and every user with the Isolation Forest"""
+    start = time.perf_counter()
+    X = data_processor.process_dataframe(df)[FEATURE_COLUMNS].values
+    risk_scores = np.asarray(fraud_model.predict_risk_score(X), dtype=np.float64)
+    logger.info(f"Scored {len(df)} transactions in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    user_features = build_user_behavior_features(df)
+    user_features['anomaly_score'] = behavior_model.get_anomaly_score(user_features)
+    user_features['is_anomalous'] = behavior_model.predict_anomaly(user_features)
+    user_fraud = df.groupby('userId')['fraud'].max()
+    user_features['fraud'] = user_fraud.reindex(user_features['userId']).values
+    logger.info(f"Scored {len(user_features)} users in {time.perf_counter() - start:.2f}s")
+
+    # Transactions of users without a behavior profile are treated as normal
+    anomalous_users = set(user_features.loc[user_features['is_anomalous'] == 1, 'userId'])
+    txn_anomalous = df['userId'].isin(anomalous_users).values
+
+    return risk_scores, txn_anomalous, user_features
+
+def write_outputs(args, df, risk_scores, txn_anomalous, user_features, fraud_model):
+    """Compute metrics and write the CSV reports"""
+    y = df['fraud'].values.astype(int)
+    k_values = tuple(args.k)
+    predictions = (risk_scores > 0.5).astype(int)
+
+    # model_predictions.csv
+    risk_category = DecisionRulesEngine().rules.risk_categories(risk_scores)
+    pd.DataFrame({
+        'XGB_Risk_Score': risk_scores,
+        'XGB_Prediction': predictions,
+        'Actual_Fraud': y,
+        'Risk_Category': risk_category
+    }).to_csv(os.path.join(args.output_dir, 'model_predictions.csv'), index=False)
+
+    # feature_importance.csv
+    importance = fraud_model.get_feature_importance()
+    pd.DataFrame(
+        sorted(importance.items(), key=lambda item: item[1], reverse=True),
+        columns=['feature', 'importance']
+    ).to_csv(os.path.join(args.output_dir, 'feature_importance.csv'), index=False)
+
+    # model_metrics.csv - point estimates with bootstrap confidence intervals
+    start = time.perf_counter()
+    metric_rows = []
+    evaluations = [
+        ('XGBoost', y, risk_scores),
+        # Lower decision_function values are more anomalous
+        ('Isolation Forest', user_features['fraud'].values, -user_features['anomaly_score'].values)
+    ]
+    for model_name, labels, scores in evaluations:
+        results = bootstrap_metrics(labels, scores, k_values=k_values, n_boot=args.bootstrap,
+                                    n_workers=args.workers)
+        for metric, (estimate, lower, upper, dropped) in results.items():
+            metric_rows.append({
+                'model': model_name, 'metric': metric,
+                'estimate': estimate, 'ci_lower': lower, 'ci_upper': upper,
+                'replicates_dropped': dropped
+            })
+    pd.DataFrame(metric_rows).to_csv(os.path.join(args.output_dir, 'model_metrics.csv'), index=False)
+    logger.info(f"Bootstrapped metrics ({args.bootstrap} replicates) in {time.perf_counter() - start:.2f}s")
+
+    # threshold_sweep.csv - combined decision volumes per risk threshold
+    thresholds = np.round(np.arange(0.05, 1.0, 0.05), 2)
+    pd.DataFrame(threshold_sweep(risk_scores, txn_anomalous, y, thresholds)).to_csv(
+        os.path.join(args.output_dir, 'threshold_sweep.csv'), index=False
+    )
+
+    # model_comparison_summary.csv
+    accuracy = float(np.mean(predictions == y))
+    detected_frauds = int(np.sum((predictions == 1) & (y == 1)))
+    flagged = user_features[user_features['is_anomalous'] == 1]
+    normal_users = user_features[user_features['fraud'] == 0]
+    normal_detection_rate = float(np.mean(normal_users['is_anomalous'] == 0)) if len(normal_users) else 0.0
+    flagged_fraud_rate = float(flagged['fraud'].mean()) if len(flagged) else 0.0
+
+    pd.DataFrame([
+        {
+            'Model': 'XGBoost (Fraud Risk Scoring)',
+            'Type': 'Supervised Classification',
+            'Accuracy': f"{accuracy:.4f}",
+            'Key Strength': 'Real-time transaction scoring',
+            'Use Case': 'Transaction-level fraud detection',
+            'Business Value': f"${detected_frauds * AVG_FRAUD_LOSS:,} prevented losses"
+        },
+        {
+            'Model': 'Isolation Forest (Behavior Profiling)',
+            'Type': 'Unsupervised Anomaly Detection',
+            'Accuracy': f"{normal_detection_rate:.3f} (Normal Detection Rate)",
+            'Key Strength': 'User behavior pattern detection',
+            'Use Case': 'Account-level risk assessment',
+            'Business Value': f"{flagged_fraud_rate:.1%} fraud rate in flagged users"
+        }
+    ]).to_csv(os.path.join(args.output_dir, 'model_comparison_summary.csv'), index=False)
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Evaluate the fraud detection models on a holdout set")
+    parser.add_argument('--dataset', default='backend/data/fraud_detection_dataset.csv',
+                        help="Dataset the models were trained on")
+    parser.add_argument('--holdout-indices', default='backend/data/holdout_indices.npy',
+                        help="Rows of --dataset that setup.py held out of training")
+    parser.add_argument('--holdout', default=None,
+                        help="Separate holdout CSV, not seen in training (overrides --holdout-indices)")
+    parser.add_argument('--bootstrap', type=int, default=200,
+                        help="Number of bootstrap replicates for confidence intervals")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Processes used for bootstrapping (default: all cores)")
+    parser.add_argument('--k', type=int, nargs='+', default=[100, 500, 1000],
+                        help="Cut-offs for precision@k")
+    parser.add_argument('--output-dir', default='.',
+                        help="Directory to write the CSV reports to")
+    return parser.parse_args()
+
+def main():
+    """Main evaluation function"""
+    args = parse_args()
+
+    print("📊 Evaluating Fraud Detection Models...")
+    print("=" * 50)
+
+    try:
+        fraud_model = FraudDetectionModel()
+        fraud_model.load_model('backend/data/trained_xgb_model.pkl')
+        behavior_model = BehaviorProfilingModel()
+        behavior_model.load_model('backend/data/trained_isolation_model.pkl')
+        if behavior_model.category_codes is None:
+            # Model saved before its category codes were stored; it was trained on the full dataset
+            behavior_model.fit_category_codes(build_user_behavior_features(pd.read_csv(args.dataset)))
+        data_processor = DataProcessor()
+
+        df = load_holdout(args)
+        risk_scores, txn_anomalous, user_features = score_holdout(df, fraud_model, behavior_model, data_processor)
+
+        os.makedirs(args.output_dir, exist_ok=True)
+        write_outputs(args, df, risk_scores, txn_anomalous, user_features, fraud_model)
+
+        print(f"\n✅ Evaluation reports written to {os.path.abspath(args.output_dir)}")
+
+    except Exception as e:
+        logger.error(f"Evaluation failed with error: {e}")
+        import traceback
+        traceback.print_exc()
+        return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
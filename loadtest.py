@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Open-loop load generator for the Fraud Detection API
+Drives a local server (see run_local.py) at fixed arrival rates and reports
+latency percentiles, error rates and saturation throughput
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import random
+import sys
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+
+# Add backend to path
+sys.path.append('backend')
+
+from utils.data_processor import generate_sample_data
+
+ENDPOINTS = ('analyze', 'bulk', 'transactions')
+
+def _to_builtin(value):
+    """json.dumps default for NumPy scalars"""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class PayloadFactory:
+    """Pre-built request bodies so generating load costs almost nothing per request"""
+
+    def __init__(self, n_samples=2000, bulk_rows=100, n_bulk_files=20):
+        # Without transaction IDs every request is scored, not answered as a replay
+        transactions = [{key: value for key, value in t.items() if key != 'transactionId'}
+                        for t in generate_sample_data(n_samples)]
+        self.analyze_bodies = [json.dumps(t, default=_to_builtin).encode() for t in transactions]
+        self.user_ids = [t['userId'] for t in transactions]
+
+        df = pd.DataFrame(transactions)
+        self.bulk_bodies = []
+        self.boundary = 'loadtest-boundary'
+        for i in range(n_bulk_files):
+            chunk = df.sample(n=min(bulk_rows, len(df)), random_state=i)
+            csv_bytes = chunk.to_csv(index=False).encode()
+            body = io.BytesIO()
+            body.write(f'--{self.boundary}\r\n'.encode())
+            body.write(b'Content-Disposition: form-data; name="file"; filename="loadtest.csv"\r\n')
+            body.write(b'Content-Type: text/csv\r\n\r\n')
+            body.write(csv_bytes)
+            body.write(f'\r\n--{self.boundary}--\r\n'.encode())
+            self.bulk_bodies.append(body.getvalue())
+
+    def request(self, endpoint):
+        """Return (method, path, content_type, body) for one request of the given kind"""
+        if endpoint == 'analyze':
+            return 'POST', '/api/analyze_transaction', 'application/json', random.choice(self.analyze_bodies)
+        if endpoint == 'bulk':
+            return ('POST', '/api/upload_csv', f'multipart/form-data; boundary={self.boundary}',
+                    random.choice(self.bulk_bodies))
+        if random.random() < 0.5:
+            return 'GET', f'/api/transactions?userId={random.choice(self.user_ids)}', None, None
+        return 'GET', '/api/transactions?limit=50', None, None
+
+async def http_request(host, port, method, path, content_type=None, body=None, timeout=30.0):
+    """Minimal HTTP/1.1 request over a fresh connection; returns the status code"""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        headers = [f'{method} {path} HTTP/1.1', f'Host: {host}:{port}', 'Connection: close']
+        if body is not None:
+            headers.append(f'Content-Type: {content_type}')
+            headers.append(f'Content-Length: {len(body)}')
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode())
+        if body is not None:
+            writer.write(body)
+        await writer.drain()
+
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        # Drain the rest of the response so the server is not cut off mid-write
+        await asyncio.wait_for(reader.read(), timeout)
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+class RunResult:
+    """Latencies and outcomes of one fixed-rate run"""
+
+    def __init__(self, rate, duration):
+        self.rate = rate
+        self.duration = duration
+        self.latencies = {endpoint: [] for endpoint in ENDPOINTS}
+        self.errors = {endpoint: 0 for endpoint in ENDPOINTS}
+        self.sent = {endpoint: 0 for endpoint in ENDPOINTS}
+        self.skipped = 0
+        self.elapsed = 0.0
+
+    def summary(self):
+        """Per-endpoint and overall latency percentiles (ms) and error rates"""
+        rows = {}
+        all_latencies = []
+        for endpoint in ENDPOINTS:
+            latencies = np.array(self.latencies[endpoint]) * 1000
+            all_latencies.append(latencies)
+            rows[endpoint] = self._row(latencies, self.sent[endpoint], self.errors[endpoint])
+
+        total_sent = sum(self.sent.values())
+        total_errors = sum(self.errors.values())
+        overall = self._row(np.concatenate(all_latencies), total_sent, total_errors)
+        overall['offered_rps'] = self.rate
+        # Poisson arrivals fluctuate around the target rate; compare against what was actually sent
+        overall['sent_rps'] = round(total_sent / self.duration, 1)
+        overall['achieved_rps'] = round((total_sent - total_errors) / self.elapsed, 1) if self.elapsed else 0.0
+        overall['skipped'] = self.skipped
+        rows['overall'] = overall
+        return rows
+
+    @staticmethod
+    def _row(latencies, sent, errors):
+        row = {'sent': sent, 'errors': errors, 'error_rate': round(errors / sent, 4) if sent else 0.0}
+        if len(latencies):
+            for name, q in (('p50', 50), ('p90', 90), ('p99', 99), ('p999', 99.9)):
+                row[name] = round(float(np.percentile(latencies, q)), 2)
+            row['max'] = round(float(latencies.max()), 2)
+        return row
+
+async def run_fixed_rate(args, payloads, rate):
+    """Fire requests on a Poisson arrival schedule, independent of response times
+
+    Latency is measured from each request's scheduled start, so time spent
+    queued behind a slow server is counted instead of silently skipped.
+    """
+    parsed = urlsplit(args.url)
+    host, port = parsed.hostname, parsed.port or 80
+    weights = [args.mix_analyze, args.mix_bulk, args.mix_transactions]
+
+    result = RunResult(rate, args.duration)
+    in_flight = set()
+
+    async def one_request(endpoint, scheduled):
+        method, path, content_type, body = payloads.request(endpoint)
+        try:
+            status = await http_request(host, port, method, path, content_type, body, timeout=args.timeout)
+            if status >= 400:
+                result.errors[endpoint] += 1
+            else:
+                result.latencies[endpoint].append(time.perf_counter() - scheduled)
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            result.errors[endpoint] += 1
+
+    loop_start = time.perf_counter()
+    next_arrival = loop_start
+    end = loop_start + args.duration
+    while next_arrival < end:
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if len(in_flight) >= args.max_in_flight:
+            # The client itself is saturated; record it rather than block the schedule
+            result.skipped += 1
+        else:
+            endpoint = random.choices(ENDPOINTS, weights=weights)[0]
+            result.sent[endpoint] += 1
+            task = asyncio.ensure_future(one_request(endpoint, next_arrival))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+
+        next_arrival += random.expovariate(rate)
+
+    if in_flight:
+        await asyncio.wait(in_flight, timeout=args.timeout)
+    result.elapsed = time.perf_counter() - loop_start
+    return result
+
+def print_summary(result):
+    """Print one run's results as a table"""
+    summary = result.summary()
+    print(f"\nOffered {result.rate} req/s for {result.duration}s -> "
+          f"achieved {summary['overall']['achieved_rps']} req/s, skipped {result.skipped}")
+    columns = ['sent', 'errors', 'error_rate', 'p50', 'p90', 'p99', 'p999', 'max']
+    print(f"{'endpoint':<14}" + ''.join(f"{c:>11}" for c in columns))
+    for endpoint, row in summary.items():
+        print(f"{endpoint:<14}" + ''.join(f"{str(row.get(c, '-')):>11}" for c in columns))
+    return summary
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Open-loop load test for the Fraud Detection API")
+    parser.add_argument('--url', default='http://localhost:5000', help="Base URL of the running server")
+    parser.add_argument('--rates', type=float, nargs='+', default=[10, 25, 50, 100],
+                        help="Arrival rates (req/s) to run, in order")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds per rate")
+    parser.add_argument('--mix-analyze', type=float, default=0.8, help="Share of analyze_transaction calls")
+    parser.add_argument('--mix-bulk', type=float, default=0.05, help="Share of bulk CSV upload calls")
+    parser.add_argument('--mix-transactions', type=float, default=0.15, help="Share of /api/transactions reads")
+    parser.add_argument('--bulk-rows', type=int, default=100, help="Rows per bulk upload")
+    parser.add_argument('--timeout', type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument('--max-in-flight', type=int, default=1000,
+                        help="Client-side cap on concurrent requests")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed for arrivals and payload choice")
+    parser.add_argument('--output', default=None, help="Write all results to this JSON file")
+    return parser.parse_args()
+
+def main():
+    """Main load test function"""
+    args = parse_args()
+    random.seed(args.seed)
+
+    print("🔥 Open-loop load test")
+    print("=" * 50)
+    payloads = PayloadFactory(bulk_rows=args.bulk_rows)
+
+    summaries = []
+    saturation_rps = None
+    for rate in args.rates:
+        result = asyncio.run(run_fixed_rate(args, payloads, rate))
+        summary = print_summary(result)
+        summaries.append(summary)
+
+        # Saturated once the server no longer keeps up with the offered load
+        overall = summary['overall']
+        if overall['achieved_rps'] < 0.9 * overall['sent_rps'] or overall['error_rate'] > 0.01:
+            print(f"\n⚠️  Saturated at {rate} req/s offered")
+            break
+        saturation_rps = overall['achieved_rps']
+
+    print(f"\n📈 Highest sustained throughput: {saturation_rps if saturation_rps is not None else 'n/a'} req/s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'runs': summaries, 'sustained_rps': saturation_rps}, f, indent=2)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
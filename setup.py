@@ -4,6 +4,7 @@ Setup script for Fraud Detection System
 This script trains the models and prepares the system for use
 """
 
+import argparse
 import os
 import sys
 import pandas as pd
@@ -15,13 +16,17 @@ import logging
 sys.path.append('backend')
 
 from models.fraud_model import FraudDetectionModel
-from models.behavior_model import BehaviorProfilingModel
-from utils.data_processor import DataProcessor, generate_sample_data
+from models.behavior_model import BehaviorProfilingModel, build_user_behavior_features
+from utils.data_processor import DataProcessor, FEATURE_COLUMNS, generate_sample_data
+from utils.backtest import USER_COLUMNS
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Rows of the training dataset kept out of training so evaluate.py scores unseen records
+HOLDOUT_INDICES_PATH = 'backend/data/holdout_indices.npy'
+
 def setup_directories():
     """Create necessary directories"""
     directories = [
@@ -51,76 +56,71 @@ def create_sample_dataset():
 
     return df
 
-def train_models():
+def hold_out_split(labels, test_size):
+    """Hold out a stratified split of the dataset rows for evaluate.py and save its indices"""
+    held_out = np.zeros(len(labels), dtype=bool)
+    if test_size <= 0:
+        if os.path.exists(HOLDOUT_INDICES_PATH):
+            os.remove(HOLDOUT_INDICES_PATH)
+        return held_out
+
+    from sklearn.model_selection import train_test_split
+
+    _, indices = train_test_split(np.arange(len(labels)), test_size=test_size, stratify=labels, random_state=42)
+    indices = np.sort(indices)
+    np.save(HOLDOUT_INDICES_PATH, indices)
+    held_out[indices] = True
+    logger.info(f"Held out {len(indices)} of {len(labels)} records for evaluation: {HOLDOUT_INDICES_PATH}")
+    return held_out
+
+def train_models(external_memory=False, chunksize=100000, n_jobs=None, test_size=0.2):
     """Train both fraud detection models"""
     logger.info("Training machine learning models...")
 
-    # Load or create dataset
-    dataset_path = 'backend/data/fraud_detection_dataset.csv'
-    if os.path.exists(dataset_path):
-        df = pd.read_csv(dataset_path)
-        logger.info(f"Loaded existing dataset: {len(df)} records")
-    else:
-        df = create_sample_dataset()
-
     # Initialize data processor
     data_processor = DataProcessor()
+    dataset_path = 'backend/data/fraud_detection_dataset.csv'
+    fraud_model = FraudDetectionModel()
 
-    # Process data for training
-    processed_transactions = []
-    for _, row in df.iterrows():
-        processed = data_processor.process_single_transaction(row.to_dict())
-        processed_transactions.append(processed)
+    if external_memory:
+        # Stream the dataset in chunks instead of loading it into RAM
+        if not os.path.exists(dataset_path):
+            create_sample_dataset()
+        held_out = hold_out_split(pd.read_csv(dataset_path, usecols=['fraud'])['fraud'].values, test_size)
 
-    # Convert to DataFrame for training
-    processed_df = pd.DataFrame(processed_transactions)
+        def transform(chunk):
+            # CSV chunks keep their row numbers as the index
+            chunk = chunk[~held_out[chunk.index]]
+            X_chunk = data_processor.process_dataframe(chunk)[FEATURE_COLUMNS]
+            return X_chunk.values, chunk['fraud'].values
 
-    # Prepare features and labels
-    feature_columns = [
-        'loginAttempts', 'transactionCount', 'lastTransactionTime',
-        'transactionVelocity', 'hour', 'dayOfWeek', 'month',
-        'transactionType', 'lastTransaction', 'utility', 'location', 'ipSubnet'
-    ]
+        logger.info("Training XGBoost fraud detection model from external memory...")
+        fraud_model.train_external_memory(dataset_path, transform, chunksize=chunksize, n_jobs=n_jobs)
+        fraud_model.save_model('backend/data/trained_xgb_model.pkl')
+
+        # The behavior model only needs the per-user columns
+        df = pd.read_csv(dataset_path, usecols=lambda column: column in USER_COLUMNS)[~held_out]
+    else:
+        # Load or create dataset
+        if os.path.exists(dataset_path):
+            df = pd.read_csv(dataset_path)
+            logger.info(f"Loaded existing dataset: {len(df)} records")
+        else:
+            df = create_sample_dataset()
+        df = df[~hold_out_split(df['fraud'].values, test_size)]
 
-    X = processed_df[feature_columns].fillna(0)
-    y = df['fraud'].values
+        # Prepare features and labels
+        X = data_processor.process_dataframe(df)[FEATURE_COLUMNS].fillna(0)
+        y = df['fraud'].values
 
-    # Train XGBoost model
-    logger.info("Training XGBoost fraud detection model...")
-    fraud_model = FraudDetectionModel()
-    fraud_model.train(X, y)
-    fraud_model.save_model('backend/data/trained_xgb_model.pkl')
+        # Train XGBoost model
+        logger.info("Training XGBoost fraud detection model...")
+        fraud_model.train(X, y, n_jobs=n_jobs)
+        fraud_model.save_model('backend/data/trained_xgb_model.pkl')
 
     # Create user behavior data for Isolation Forest
     logger.info("Creating user behavior profiles...")
-    user_groups = df.groupby('userId')
-
-    user_behavior_data = []
-    for user_id, group in user_groups:
-        if len(group) >= 3:  # Only users with multiple transactions
-            profile = {
-                'userId': user_id,
-                'avg_login_attempts': group['loginAttempts'].mean(),
-                'std_login_attempts': group['loginAttempts'].std() if len(group) > 1 else 0,
-                'avg_transaction_count': group['transactionCount'].mean(),
-                'std_transaction_count': group['transactionCount'].std() if len(group) > 1 else 0,
-                'avg_transaction_velocity': group['transactionVelocity'].mean(),
-                'std_transaction_velocity': group['transactionVelocity'].std() if len(group) > 1 else 0,
-                'preferred_transaction_type': group['transactionType'].mode().iloc[0] if len(group) > 0 else 'Credit Card',
-                'preferred_location': group['location'].mode().iloc[0] if len(group) > 0 else 'Mumbai',
-                'preferred_hour': 12,  # Default
-                'unique_locations': group['location'].nunique(),
-                'unique_ip_subnets': 1,  # Simplified
-                'transaction_frequency': len(group)
-            }
-            user_behavior_data.append(profile)
-
-    user_behavior_df = pd.DataFrame(user_behavior_data)
-
-    # Encode categorical data for behavior model
-    for col in ['preferred_transaction_type', 'preferred_location']:
-        if col in user_behavior_df.columns:
-            user_behavior_df[col] = pd.Categorical(user_behavior_df[col]).codes
+    user_behavior_df = build_user_behavior_features(df)
 
     # Train Isolation Forest model
     logger.info("Training Isolation Forest behavior model...")
@@ -158,8 +158,25 @@ def verify_setup():
     logger.info("✅ Setup verification completed successfully!")
     return True
 
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Set up and train the Fraud Detection System")
+    parser.add_argument('--external-memory', action='store_true',
+                        help="Stream training data from disk in chunks (for datasets larger than RAM)")
+    parser.add_argument('--chunksize', type=int, default=100000,
+                        help="Rows per chunk in external-memory mode")
+    parser.add_argument('--n-jobs', type=int, default=None,
+                        help="Number of XGBoost threads (default: all cores)")
+    parser.add_argument('--test-size', type=float, default=0.2,
+                        help="Fraction of the dataset held out of training for evaluate.py (0 to train on all of it)")
+    parser.add_argument('--keep-dataset', action='store_true',
+                        help="Train on the existing dataset instead of regenerating the sample data")
+    return parser.parse_args()
+
 def main():
     """Main setup function"""
+    args = parse_args()
+
     print("🚀 Setting up Fraud Detection System...")
     print("=" * 50)
 
@@ -168,10 +185,12 @@ def main():
         setup_directories()
 
         # Create sample dataset
-        create_sample_dataset()
+        if not (args.keep_dataset and os.path.exists('backend/data/fraud_detection_dataset.csv')):
+            create_sample_dataset()
 
         # Train models
-        train_models()
+        train_models(external_memory=args.external_memory, chunksize=args.chunksize, n_jobs=args.n_jobs,
+                     test_size=args.test_size)
 
         # Verify setup
         if verify_setup():